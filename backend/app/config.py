@@ -2,7 +2,7 @@
 配置管理
 """
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 
 class Settings(BaseSettings):
     """应用配置"""
@@ -16,6 +16,44 @@ class Settings(BaseSettings):
     LLM_API_KEY: Optional[str] = None
     LLM_BASE_URL: Optional[str] = None
     LLM_MODEL: str = "gpt-3.5-turbo"  # 或本地模型名称
+    LLM_KIND: Optional[str] = None  # 端点类型：openai（OpenAI 兼容 API）/ local（本地推理服务），为空时按地址推断
+    
+    # 多端点负载均衡（JSON 数组，为空时使用单端点），格式见 app/core/llm_pool.py
+    LLM_ENDPOINTS: Optional[str] = None
+    LLM_POOL_MAX_ATTEMPTS: int = 2  # 单次调用最多尝试的端点数（失败时换端点重试）
+    LLM_POOL_EJECT_FAILURES: int = 3  # 连续失败达到该次数时摘除端点
+    LLM_POOL_EJECT_COOLDOWN: float = 30.0  # 摘除后的冷却时间（秒），连续摘除时指数增长
+    LLM_POOL_MAX_COOLDOWN: float = 300.0  # 冷却时间上限（秒）
+    LLM_POOL_SLOW_LATENCY: float = 0  # EWMA 延迟超过该值（秒）时摘除端点，0 表示不按延迟摘除
+    LLM_POOL_EWMA_ALPHA: float = 0.3  # 延迟 EWMA 的平滑系数
+    
+    # 本地模型端点的长连接客户端
+    LLM_HTTP_MAX_CONNECTIONS: int = 32  # 每个端点的最大连接数
+    LLM_HTTP_MAX_KEEPALIVE: int = 16  # 每个端点保持的空闲长连接数
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = 60.0  # 空闲长连接的保留时间（秒）
+    LLM_HTTP_CONNECT_TIMEOUT: float = 5.0  # 建立连接的超时（秒）
+    LLM_HTTP2: bool = True  # 是否启用 HTTP/2（需安装 h2，未安装时使用 HTTP/1.1）
+    
+    # 大模型请求准入控制（见 app/core/admission.py）
+    LLM_MAX_IN_FLIGHT: int = 8  # 同时在途的大模型请求数上限，0 表示不限制
+    LLM_MIN_IN_FLIGHT: int = 1  # 遇到 429 时并发上限最低减到该值
+    LLM_ADMISSION_QUEUE_SIZE: int = 64  # 等待队列长度上限，队列满时直接降级
+    LLM_ADMISSION_MAX_WAIT: float = 30.0  # 最长排队时间（秒），0 表示不限制
+    LLM_ADMISSION_DECREASE_FACTOR: float = 0.5  # 遇到 429 时并发上限的缩小比例
+    
+    # 分阶段模型路由（为空时使用上面的全局配置）
+    # 意图识别：快速、便宜的小模型，输出只有简短的 JSON
+    LLM_INTENT_MODEL: Optional[str] = None
+    LLM_INTENT_BASE_URL: Optional[str] = None
+    LLM_INTENT_API_KEY: Optional[str] = None
+    LLM_INTENT_MAX_TOKENS: Optional[int] = 256  # 意图识别输出 token 上限
+    LLM_INTENT_TIMEOUT: float = 10.0  # 意图识别单次请求超时（秒）
+    # 文档生成：能力更强的大模型，输出长文本
+    LLM_DOCUMENT_MODEL: Optional[str] = None
+    LLM_DOCUMENT_BASE_URL: Optional[str] = None
+    LLM_DOCUMENT_API_KEY: Optional[str] = None
+    LLM_DOCUMENT_MAX_TOKENS: Optional[int] = 2048  # 文档生成输出 token 上限
+    LLM_DOCUMENT_TIMEOUT: float = 60.0  # 文档生成单次请求超时（秒）
     
     # 工具 API 配置
     # 天气 API 配置（支持心知天气和和风天气）
@@ -30,6 +68,76 @@ class Settings(BaseSettings):
     # 工具调用配置
     TOOL_TIMEOUT: int = 10  # 工具调用超时时间（秒）
     MAX_TOOL_STEPS: int = 4  # 最大工具调用步骤数
+    CLIENT_DISCONNECT_POLL_INTERVAL: float = 0.5  # 检查客户端是否断开连接的间隔（秒），断开后取消工作流
+    MACRO_STORE_PATH: Optional[str] = ".cache/macros.json"  # 工作流宏存储文件，为空时只使用内置宏
+    
+    # 工具结果缓存（按工具配置有效期，单位秒；未配置的工具不缓存）
+    TOOL_CACHE_TTLS: Dict[str, int] = {"weather": 1800, "news": 900, "stock": 600}
+    TOOL_CACHE_MAX_ENTRIES: int = 512  # 每个工具的缓存条目上限
+    
+    # 定时预计算（见 app/core/precompute.py）：在高峰前预先调用工具，写入工具缓存和文档缓存
+    PRECOMPUTE_ENABLED: bool = True
+    PRECOMPUTE_CRON: str = "*/10 7-9 * * *"  # 默认任务的执行时间（cron 格式：分 时 日 月 周）
+    PRECOMPUTE_JOBS: Optional[str] = None  # 自定义任务（JSON 数组），为空时预计算所有内置城市的天气（自选股只在行情接口有真实数据时预计算）
+    PRECOMPUTE_CONCURRENCY: int = 4  # 预计算的最大并发工具调用数
+    
+    # 对话会话（见 app/core/session.py）：保存每轮的执行计划和工具结果，追问时复用
+    SESSION_MAX_SESSIONS: int = 1000  # 会话数上限（按最近访问淘汰）
+    SESSION_TTL: int = 1800  # 会话空闲过期时间（秒）
+    SESSION_RECENT_TURNS: int = 2  # 原样保存（可复用工具结果）的最近轮数，更早的轮次压缩保存
+    SESSION_MAX_BYTES: int = 262144  # 每个会话的内存上限（字节）
+    
+    # 异步任务队列（见 app/core/jobs.py）
+    JOB_WORKERS: int = 4  # 同时执行的工作流数
+    JOB_QUEUE_SIZE: int = 100  # 排队任务数上限，队列满时提交返回 429
+    JOB_RESULT_TTL: int = 600  # 已结束任务的保留时间（秒）
+    
+    # 批量执行（/api/workflow/batch）
+    BATCH_MAX_INPUTS: int = 500  # 单次最多提交的输入数
+    BATCH_MAX_CONCURRENCY: int = 8  # 同时执行的工作流数上限
+    
+    # 意图识别配置
+    INTENT_RULE_CONFIDENCE_THRESHOLD: float = 0.9  # 规则识别置信度达到该值时跳过大模型
+    INTENT_DECOMPOSE_ENABLED: bool = True  # 复合请求是否拆分为子请求分别识别（并发调用大模型）
+    INTENT_DECOMPOSE_RULE_THRESHOLD: float = 0.9  # 子请求规则识别置信度达到该值时不调用大模型
+    INTENT_CLASSIFIER_ENABLED: bool = True  # 是否使用本地意图分类器（需先训练模型）
+    INTENT_CLASSIFIER_THRESHOLD: float = 0.9  # 分类器置信度达到该值时跳过大模型
+    INTENT_CLASSIFIER_MIN_SAMPLES: int = 50  # 训练分类器所需的最少样本数
+    INTENT_LOG_PATH: Optional[str] = ".cache/intent_log.jsonl"  # 意图识别日志（分类器训练数据），为空时不记录
+    INTENT_MODEL_PATH: str = ".cache/intent_model.npz"  # 分类器模型文件
+    LLM_FUNCTION_CALLING: bool = True  # 意图识别是否使用原生函数调用（tools 参数），关闭时使用 JSON 文本提示词
+    INTENT_PROMPT_FILTER_TOOLS: bool = True  # 意图识别提示词只介绍规则预识别到的工具（未识别到时介绍全部）
+    INTENT_PROMPT_FILTER_MIN_CONFIDENCE: float = 0.9  # 规则识别置信度达到该值时才过滤工具说明（置信度低时规则可能漏掉工具，介绍全部）
+    INTENT_STREAMING: bool = False  # 文本模式下是否流式识别意图（每个工具调用一闭合就推测执行）
+    INTENT_LLM_TIMEOUT: float = 2.5  # 大模型意图识别的延迟预算（秒），超时后使用规则识别结果，0 表示不限制
+    INTENT_CACHE_MAX_ENTRIES: int = 1024  # 意图缓存条目上限
+    INTENT_CACHE_TTL: int = 3600  # 意图缓存有效期（秒）
+    INTENT_SIMILARITY_ENABLED: bool = True  # 是否复用近似输入的意图识别结果（实体必须一致）
+    INTENT_SIMILARITY_THRESHOLD: float = 0.45  # 复用所需的最低 TF-IDF 余弦相似度（实体已精确校验，主要过滤句式差异过大的输入；"北京这周天气如何" 和 "北京未来几天天气" 约 0.66）
+    INTENT_SIMILARITY_VERIFY_RATE: float = 0.05  # 近似复用时在后台用大模型校验的抽样比例（统计误复用率）
+    LLM_HEDGE_BASE_URL: Optional[str] = None  # 对冲请求的备用端点，为空时不发对冲请求
+    LLM_HEDGE_API_KEY: Optional[str] = None  # 备用端点的 API Key，为空时使用 LLM_API_KEY
+    LLM_HEDGE_MODEL: Optional[str] = None  # 备用端点的模型，为空时使用 LLM_MODEL
+    LLM_HEDGE_DELAY: float = 0.8  # 主请求超过该时间（秒）未返回时发出对冲请求
+    SPECULATIVE_EXECUTION_ENABLED: bool = True  # 等待大模型意图识别时，是否按规则识别结果推测执行工具
+    SPECULATIVE_TOOLS: List[str] = ["weather", "stock", "calculate"]  # 允许推测执行的低成本工具
+    SPECULATIVE_MIN_CONFIDENCE: float = 0.5  # 规则识别置信度达到该值时才推测执行
+    
+    # 文档生成配置
+    DOC_CONTEXT_TOKEN_BUDGET: int = 1500  # 文档提示词中上下文数据的 token 预算
+    DOC_CONTEXT_MAX_ROWS: int = 15  # 上下文表格最多保留的行数，超出部分用统计值概括
+    DOC_MAP_REDUCE_ENABLED: bool = True  # 上下文数据过大时是否先分片并发摘要再汇总
+    DOC_MAP_REDUCE_THRESHOLD: int = 3000  # 触发 map-reduce 的上下文 token 数
+    DOC_MAP_REDUCE_CHUNK_TOKENS: int = 1200  # 每个分片的 token 上限
+    DOC_MAP_REDUCE_CONCURRENCY: int = 4  # 分片摘要的最大并发数
+    DOC_CACHE_ENABLED: bool = True  # 是否缓存大模型生成的文档
+    DOC_CACHE_MAX_ENTRIES: int = 256  # 文档缓存内存条目上限
+    DOC_CACHE_DISK_MAX_ENTRIES: int = 2048  # 文档缓存磁盘条目上限
+    DOC_CACHE_TTL: int = 3600  # 文档缓存有效期（秒）
+    DOC_CACHE_DIR: Optional[str] = ".cache/documents"  # 文档缓存目录，为空时只使用内存
+    ARTIFACT_DIR: str = ".cache/artifacts"  # 导出文件（docx/html）的存储目录
+    ARTIFACT_EXPORT_WORKERS: int = 2  # 后台导出线程数
+    ARTIFACT_MAX_FILES: int = 500  # 导出文件数上限，超出时删除最久未使用的文件
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,156 @@
+"""
+大模型请求准入控制
+
+突发流量下所有请求同时打到模型服务商会触发 429，最终都落到降级方案。准入控制器在 LLMService 之前限制并发：
+- 同时在途的大模型请求数不超过当前并发上限，超出的请求进入有界等待队列，队列满或等待超时直接拒绝
+- 等待队列按优先级出队：意图识别（阻塞整个请求）优先于文档生成
+- 并发上限按 AIMD 自适应：请求成功时缓慢增加（每轮约 +1），出现 429 时按比例减小，
+  使请求量稳定在服务商限流线以下，而不是在限流线附近来回震荡
+- 队列长度、等待时间通过 /api/metrics 导出
+"""
+from typing import Dict, Any, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import heapq
+import itertools
+import time
+from app.core.metrics import metrics
+from app.config import settings
+
+# 各阶段的优先级（数值越小越先出队）
+STAGE_PRIORITY = {"intent": 0, None: 1, "document": 2}
+
+class AdmissionRejected(Exception):
+    """等待队列已满或排队超时，请求未被放行"""
+
+def is_rate_limited(error: BaseException) -> bool:
+    """判断异常是否为服务商限流（HTTP 429）"""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        # httpx.HTTPStatusError 的状态码在 response 上
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code == 429
+
+class AdmissionController:
+    """并发上限 + 优先级等待队列 + AIMD 自适应上限"""
+
+    def __init__(self, max_in_flight: int, min_in_flight: int = 1):
+        self.max_limit = max_in_flight
+        self.min_limit = max(min(min_in_flight, max_in_flight), 1)
+        self.limit = float(max_in_flight)
+        self.in_flight = 0
+        self._waiters: List[list] = []  # 堆：[优先级, 序号, future]
+        self._sequence = itertools.count()
+        self._last_decrease = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_limit > 0
+
+    def _current_limit(self) -> int:
+        return max(int(self.limit), self.min_limit)
+
+    async def acquire(self, priority: int) -> None:
+        """
+        等待一个并发名额
+
+        Raises:
+            AdmissionRejected: 等待队列已满或等待超时
+        """
+        if self.in_flight < self._current_limit() and not self._waiters:
+            self.in_flight += 1
+            metrics.observe("llm_admission_wait_ms", 0.0)
+            return
+        if len(self._waiters) >= settings.LLM_ADMISSION_QUEUE_SIZE:
+            metrics.increment("llm_admission.rejected")
+            raise AdmissionRejected(f"大模型请求等待队列已满（{len(self._waiters)}）")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._sequence), future]
+        heapq.heappush(self._waiters, entry)
+        start_time = time.time()
+        try:
+            await asyncio.wait_for(future, timeout=settings.LLM_ADMISSION_MAX_WAIT or None)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # 名额已经分配给本请求，归还
+                self.release(start_time, None)
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.increment("llm_admission.rejected")
+                raise AdmissionRejected(f"大模型请求排队超过 {settings.LLM_ADMISSION_MAX_WAIT}s") from None
+            raise
+        metrics.observe("llm_admission_wait_ms", round((time.time() - start_time) * 1000, 1))
+
+    def release(self, started_at: float, rate_limited: Optional[bool]) -> None:
+        """
+        归还名额并调整并发上限
+
+        Args:
+            started_at: 请求被放行的时间
+            rate_limited: True 遇到 429 / False 成功 / None 其他失败或取消（不调整上限）
+        """
+        self.in_flight = max(self.in_flight - 1, 0)
+        if rate_limited:
+            metrics.increment("llm_admission.rate_limited")
+            # 同一轮被限流的请求只减一次：只有在上次减小之后发出的请求才触发
+            if started_at >= self._last_decrease:
+                old_limit = self._current_limit()
+                self.limit = max(self.limit * settings.LLM_ADMISSION_DECREASE_FACTOR, self.min_limit)
+                self._last_decrease = time.time()
+                print(f"[WARNING] 大模型服务限流（429），并发上限 {old_limit} -> {self._current_limit()}")
+        elif rate_limited is False and self.limit < self.max_limit:
+            # 每轮（约 limit 个请求）增加 1
+            self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+        self._wake()
+
+    def _wake(self) -> None:
+        """按优先级放行等待中的请求"""
+        while self._waiters and self.in_flight < self._current_limit():
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, stage: Optional[str] = None):
+        """
+        占用一个并发名额：正常结束记为成功，429 异常触发上限减小
+
+        用法：
+            async with admission.slot("intent"):
+                ...
+        """
+        if not self.enabled:
+            yield
+            return
+        await self.acquire(STAGE_PRIORITY.get(stage, STAGE_PRIORITY[None]))
+        started_at = time.time()
+        try:
+            yield
+        except BaseException as e:
+            self.release(started_at, True if is_rate_limited(e) else None)
+            raise
+        else:
+            self.release(started_at, False)
+
+    def stats(self) -> Dict[str, Any]:
+        queued: Dict[str, int] = {}
+        stage_names = {priority: stage or "default" for stage, priority in STAGE_PRIORITY.items()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                name = stage_names.get(priority, str(priority))
+                queued[name] = queued.get(name, 0) + 1
+        return {
+            "limit": self._current_limit(),
+            "in_flight": self.in_flight,
+            "queue_depth": sum(queued.values()),
+            "queued": queued
+        }
+
+admission = AdmissionController(settings.LLM_MAX_IN_FLIGHT, settings.LLM_MIN_IN_FLIGHT)
+
+metrics.register_gauge("llm_admission", admission.stats)
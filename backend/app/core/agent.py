@@ -1,26 +1,66 @@
 """
 Agent 调度逻辑
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple, Union, Callable, Awaitable
+import asyncio
+import copy
 import json
-import re
+import random
+import time
 from app.core.scheduler import ToolScheduler
 from app.core.prompt import PromptTemplate
 from app.core.llm_service import LLMService
+from app.core.intent_rules import match_intent, build_tool_plan
+from app.core.decomposer import decompose, fill_missing_tasks
+from app.core.intent_classifier import get_classifier, log_intent
+from app.core.intent_cache import intent_cache, intent_key, track_background, store_when_done
+from app.core.intent_similarity import similar_intents
+from app.core.session import session_store, plan_follow_up
+from app.core.tool_cache import tool_cache_key
+from app.core.json_extractor import JsonExtractor, extract_intent_json
+from app.core.compactor import estimate_tokens
+from app.core.metrics import metrics
+from app.tools import get_tool_schemas
+from app.tools.stock import STOCK_NAME_TO_CODE
+from app.config import settings
+
+def _normalize_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """规范化工具参数，用于判断推测参数是否等价（忽略大小写、首尾空白和数字的字符串形式）"""
+    normalized = {}
+    for key, value in params.items():
+        if isinstance(value, str):
+            value = value.strip().lower()
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = float(value)
+        normalized[key] = value
+    return normalized
 
 class Agent:
     """智能 Agent，负责意图识别和工具调度"""
     
-    def __init__(self):
-        self.scheduler = ToolScheduler()
+    def __init__(self, scheduler: Optional[ToolScheduler] = None):
+        """
+        Args:
+            scheduler: 工具调度器（批量请求注入共享的合并调度器），为空时新建
+        """
+        self.scheduler = scheduler or ToolScheduler()
         self.prompt_template = PromptTemplate()
-        self.llm_service = LLMService()
+        self.llm_service = LLMService(stage="intent")
         self._last_user_input = ""  # 保存最后一次用户输入，用于降级方案
+        self._speculative: Dict[str, Dict[str, Any]] = {}  # 推测执行中的工具调用：{tool_name: {"params", "task"}}
+        self._speculation_open = False  # 当前请求是否仍接受推测执行（请求结束后后台完成的大模型流不再推测）
+        self._reusable: Dict[str, Dict[str, Any]] = {}  # 会话中可复用的工具结果：{缓存键: 结果}
+        self._tool_calls = 0  # 已发出进度事件的工具调用数（事件中的调用序号）
     
     async def execute(
         self, 
         user_input: str, 
-        conversation_id: Optional[str] = None
+        conversation_id: Optional[str] = None,
+        on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
     ) -> Dict[str, Any]:
         """
         执行用户请求（支持多工具链式调用）
@@ -28,6 +68,8 @@ class Agent:
         Args:
             user_input: 用户输入的自然语言
             conversation_id: 对话 ID（用于多轮对话）
+            on_event: 事件回调（可选），用于转发流式工具的增量输出，
+                事件格式：{"type": "delta", "tool": "document", "content": "..."}
             
         Returns:
             工作流执行结果，格式：
@@ -44,16 +86,49 @@ class Agent:
             # 保存原始用户输入，用于降级方案
             self._last_user_input = user_input
             
+            # 规则引擎预识别（一次扫描，亚毫秒级）
+            rule_match = match_intent(user_input)
+            
             # 检查是否包含多个任务（简单检测）
-            has_multiple_tasks = self._detect_multiple_tasks(user_input)
+            has_multiple_tasks = len(rule_match["tasks"]) > 1
             if has_multiple_tasks:
                 print(f"[DEBUG] Agent 检测到多任务请求，将尝试识别所有任务")
             
-            # 1. 使用大模型进行意图识别和参数提取
-            intent_result = await self._recognize_intent(user_input)
+            # 多轮对话：最近几轮的工具结果可以直接复用；追问按上一轮的计划只执行变化的部分
+            parsed_result = None
+            if conversation_id:
+                self._reusable = session_store.reusable_results(conversation_id)
+                parsed_result = self._follow_up(user_input, rule_match, conversation_id)
             
-            # 2. 解析大模型返回的结果（支持多工具）
-            parsed_result = self._parse_intent_result(intent_result, user_input)
+            if parsed_result is None and rule_match["confidence"] >= settings.INTENT_RULE_CONFIDENCE_THRESHOLD:
+                # 规则识别置信度足够高，跳过大模型
+                print(f"[DEBUG] Agent 规则识别置信度 {rule_match['confidence']}，跳过大模型")
+                metrics.increment("intent_source.rule")
+                parsed_result = self._rule_match_to_parsed(rule_match, user_input)
+            elif parsed_result is None:
+                # 本地分类器置信度足够高时同样跳过大模型
+                parsed_result = self._classify_intent(user_input)
+                if parsed_result is None:
+                    # 等待大模型期间，按规则识别结果推测执行低成本工具
+                    self._start_speculation(rule_match, user_input)
+                    
+                    # 复合请求拆分为子请求分别识别，避免整段识别时丢失任务
+                    if has_multiple_tasks and settings.INTENT_DECOMPOSE_ENABLED:
+                        parsed_result = await self._decompose_intent(user_input, rule_match)
+                
+                if parsed_result is None:
+                    # 1. 使用大模型进行意图识别和参数提取
+                    tool_names = self._prompt_tool_names(rule_match)
+                    intent_result, latency = await self._recognize_intent(user_input, tool_names)
+                    
+                    # 2. 解析大模型返回的结果（支持多工具）；超出延迟预算时使用规则识别结果
+                    if intent_result is None:
+                        parsed_result = self._rule_match_to_parsed(rule_match, user_input)
+                    else:
+                        parsed_result = self._parse_intent_result(intent_result, user_input, latency)
+                        if has_multiple_tasks:
+                            # 3. 大模型漏掉了规则检测到的任务时补上
+                            parsed_result = self._fill_missing_tasks(parsed_result, rule_match, user_input)
             
             # 检查是否是多工具调用
             if isinstance(parsed_result, dict) and "tools" in parsed_result:
@@ -61,9 +136,10 @@ class Agent:
                 tools_list = parsed_result["tools"]
                 print(f"[DEBUG] Agent 识别到 {len(tools_list)} 个工具，开始链式调用")
                 
+                plan = copy.deepcopy(tools_list)  # 执行前的计划（执行时会注入上下文数据）
                 tool_chain = []
                 all_results = []
-                previous_result = None
+                collected_data = {}  # 前面各工具的成功结果，按工具名保存
                 
                 for i, tool_info in enumerate(tools_list):
                     tool_name = tool_info.get("tool")
@@ -72,18 +148,23 @@ class Agent:
                     print(f"[DEBUG] Agent 执行工具 {i+1}/{len(tools_list)}: {tool_name}")
                     
                     # 如果当前工具是 document，且前面有工具结果，将结果作为上下文数据
-                    if tool_name == "document" and previous_result:
-                        # 将前一个工具的结果整合到 document 工具的 data 参数中
-                        if previous_result.get("success") and previous_result.get("data"):
-                            tool_params["data"] = previous_result["data"]
-                            # 更新 content，包含对前一个工具结果的引用
-                            if "content" in tool_params:
-                                tool_params["content"] = f"{tool_params['content']}（基于前一个工具的执行结果）"
-                            else:
-                                tool_params["content"] = "基于前一个工具的执行结果生成总结"
+                    if tool_name == "document" and collected_data:
+                        if len(collected_data) == 1:
+                            # 只有一个工具结果时，直接作为 data（保持原有结构）
+                            tool_params["data"] = next(iter(collected_data.values()))
+                            reference = "前一个工具"
+                        else:
+                            # 多个工具结果（如天气 + 股票 + 新闻）按工具名整合到 data 中
+                            tool_params["data"] = dict(collected_data)
+                            reference = "前面各工具"
+                        # 更新 content，包含对前面工具结果的引用
+                        if "content" in tool_params:
+                            tool_params["content"] = f"{tool_params['content']}（基于{reference}的执行结果）"
+                        else:
+                            tool_params["content"] = f"基于{reference}的执行结果生成总结"
                     
                     # 调用工具
-                    tool_result = await self.scheduler.call_tool(tool_name, tool_params)
+                    tool_result = await self._call_tool(tool_name, tool_params, on_event)
                     
                     # 记录工具链信息
                     tool_chain.append({
@@ -99,12 +180,16 @@ class Agent:
                         "tool_result": tool_result
                     })
                     
-                    previous_result = tool_result
+                    if tool_name != "document" and tool_result.get("success") and tool_result.get("data"):
+                        key = tool_name if tool_name not in collected_data else f"{tool_name}_{i + 1}"
+                        collected_data[key] = tool_result["data"]
                     
                     # 如果某个工具失败，可以选择继续或停止
                     if not tool_result.get("success"):
                         print(f"[WARNING] 工具 {tool_name} 执行失败，但继续执行后续工具")
                 
+                self._record_turn(conversation_id, user_input, plan, all_results)
+                
                 # 返回多工具结果
                 return {
                     "intent_type": tools_list[0].get("tool") if tools_list else "data",
@@ -118,24 +203,19 @@ class Agent:
                 # 单工具调用（原有逻辑）
                 tool_name, tool_params = parsed_result
                 
-                # 3. 如果检测到多任务但大模型只识别了一个，尝试提取其他任务
-                if has_multiple_tasks and tool_name:
-                    additional_tool = self._extract_additional_tool(user_input, tool_name)
-                    if additional_tool:
-                        print(f"[DEBUG] Agent 检测到额外任务: {additional_tool['tool_name']}")
-                        # 如果主要工具不是计算，但检测到计算任务，优先执行计算
-                        if additional_tool["tool_name"] == "calculate" and tool_name != "calculate":
-                            print(f"[DEBUG] Agent 优先执行计算任务")
-                            tool_name = "calculate"
-                            tool_params = additional_tool["tool_params"]
-                
                 # 调试信息
                 print(f"[DEBUG] Agent 解析结果 - tool_name: {tool_name}, tool_params: {tool_params}")
                 
                 # 4. 调用工具
                 tool_result = None
                 if tool_name:
-                    tool_result = await self.scheduler.call_tool(tool_name, tool_params)
+                    plan = [{"tool": tool_name, "parameters": copy.deepcopy(tool_params)}]
+                    tool_result = await self._call_tool(tool_name, tool_params, on_event)
+                    self._record_turn(conversation_id, user_input, plan, [{
+                        "tool_name": tool_name,
+                        "tool_params": tool_params,
+                        "tool_result": tool_result
+                    }])
                 
                 # 5. 返回结果
                 return {
@@ -163,123 +243,531 @@ class Agent:
                 "is_multi_tool": False,
                 "tool_chain": []
             }
+        finally:
+            # 未被采用的推测结果直接丢弃
+            self._discard_speculation()
     
-    def _detect_multiple_tasks(self, user_input: str) -> bool:
-        """检测用户输入是否包含多个任务"""
-        # 检测关键词组合
-        task_keywords = {
-            "weather": ["天气", "气温", "温度", "weather"],
-            "calculate": ["计算", "算", "等于", "+", "-", "*", "/", "加", "减", "乘", "除"],
-            "news": ["新闻", "资讯", "news"],
-            "stock": ["股票", "stock"]
-        }
+    async def execute_graph(
+        self,
+        steps: List[Dict[str, Any]],
+        on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """
+        执行预先声明的工具图（工作流宏），跳过意图识别
         
-        detected_tasks = []
-        user_input_lower = user_input.lower()
+        Args:
+            steps: 工具图步骤，见 ToolScheduler.run_graph
+            on_event: 事件回调（转发流式工具的增量输出）
+            
+        Returns:
+            与 execute 的返回结构相同（只有一个步骤时为单工具结果）
+        """
+        async def call(tool_name: str, tool_params: Dict[str, Any]) -> Dict[str, Any]:
+            return await self._call_tool(tool_name, tool_params, on_event)
         
-        for task_type, keywords in task_keywords.items():
-            if any(kw in user_input_lower for kw in keywords):
-                detected_tasks.append(task_type)
+        all_results = await self.scheduler.run_graph(steps, call)
+        if len(all_results) == 1:
+            # 单步骤宏按单工具结果返回
+            result = all_results[0]
+            return {
+                "intent_type": result["tool_name"],
+                "tool_name": result["tool_name"],
+                "tool_params": result["tool_params"],
+                "tool_result": result["tool_result"],
+                "is_multi_tool": False,
+                "tool_chain": []
+            }
+        return {
+            "intent_type": steps[0]["tool"] if steps else "data",
+            "tool_name": [step["tool"] for step in steps],
+            "tool_params": [step.get("parameters", {}) for step in steps],
+            "tool_result": all_results,
+            "is_multi_tool": True,
+            "tool_chain": [
+                {
+                    "step": i + 1,
+                    "tool_name": result["tool_name"],
+                    "tool_params": result["tool_params"],
+                    "success": result["tool_result"].get("success", False)
+                }
+                for i, result in enumerate(all_results)
+            ]
+        }
+    
+    def _start_speculation(self, rule_match: Dict[str, Any], user_input: str) -> None:
+        """
+        推测执行：在等待大模型意图识别的同时，按规则识别结果提前调用工具
         
-        return len(detected_tasks) > 1
+        只推测 SPECULATIVE_TOOLS 中的低成本工具；大模型识别出相同工具且参数等价时采用推测结果，否则丢弃
+        """
+        self._speculation_open = True
+        if rule_match["confidence"] < settings.SPECULATIVE_MIN_CONFIDENCE:
+            return
+        for tool_info in rule_match["tools"]:
+            if tool_info["tool"] not in self._speculative:
+                self._speculate(tool_info["tool"], tool_info["parameters"], user_input)
     
-    def _extract_additional_tool(self, user_input: str, current_tool: str) -> Optional[Dict[str, Any]]:
-        """从用户输入中提取额外的工具需求"""
-        user_input_lower = user_input.lower()
-        
-        # 如果当前工具不是计算，但用户输入包含计算表达式
-        if current_tool != "calculate":
-            # 检测计算表达式
-            calc_patterns = [
-                r'计算\s*([+\-*/0-9\s.()]+)',
-                r'算\s*([+\-*/0-9\s.()]+)',
-                r'([0-9]+\s*[+\-*/]\s*[0-9]+)',
-                r'等于\s*([+\-*/0-9\s.()]+)'
-            ]
-            
-            for pattern in calc_patterns:
-                match = re.search(pattern, user_input)
-                if match:
-                    expression = match.group(1) if match.groups() else match.group(0)
-                    expression = expression.strip()
-                    # 清理表达式
-                    expression = re.sub(r'\s+', '', expression)
-                    if expression:
-                        return {
-                            "tool_name": "calculate",
-                            "tool_params": {"expression": expression}
-                        }
-        
-        return None
+    def _speculate(self, tool_name: str, parameters: Dict[str, Any], user_input: str) -> None:
+        """推测执行单个工具；已有参数不同的推测任务时取消旧任务"""
+        if (
+            not settings.SPECULATIVE_EXECUTION_ENABLED
+            or not self._speculation_open
+            or tool_name not in settings.SPECULATIVE_TOOLS
+        ):
+            return
+        params = self._process_tool_params(tool_name, dict(parameters), user_input)
+        existing = self._speculative.get(tool_name)
+        if existing:
+            if _normalize_params(existing["params"]) == _normalize_params(params):
+                return
+            existing["task"].cancel()
+        self._speculative[tool_name] = {
+            "params": params,
+            "task": asyncio.create_task(self.scheduler.call_tool(tool_name, dict(params)))
+        }
+        print(f"[DEBUG] Agent 推测执行工具 - {tool_name}: {params}")
+    
+    def _take_speculation(self, tool_name: str, tool_params: Dict[str, Any]) -> Optional["asyncio.Task"]:
+        """取出与本次调用等价的推测任务（工具相同且参数等价），没有时返回 None"""
+        speculation = self._speculative.get(tool_name)
+        if not speculation:
+            return None
+        if _normalize_params(speculation["params"]) != _normalize_params(tool_params):
+            print(f"[DEBUG] Agent 推测参数不一致，丢弃推测结果 - {tool_name}: {speculation['params']} != {tool_params}")
+            return None
+        del self._speculative[tool_name]
+        return speculation["task"]
+    
+    def _discard_speculation(self) -> None:
+        """取消所有未被采用的推测任务（之后不再接受新的推测）"""
+        self._speculation_open = False
+        for tool_name, speculation in self._speculative.items():
+            if not speculation["task"].done():
+                speculation["task"].cancel()
+            print(f"[DEBUG] Agent 丢弃推测结果 - {tool_name}")
+        self._speculative.clear()
     
-    async def _recognize_intent(self, user_input: str) -> str:
+    async def _call_tool(
+        self,
+        tool_name: str,
+        tool_params: Dict[str, Any],
+        on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """
+        调用工具；提供了事件回调时使用流式调用并转发增量输出，并在工具开始和结束时发出进度事件：
+        {"type": "tool", "id": 调用序号, "tool": ..., "status": "running" | "success" | "failed", ...}
         """
-        使用大模型识别用户意图
+        if not on_event:
+            return await self._run_tool(tool_name, tool_params)
+        
+        self._tool_calls += 1
+        call_id = self._tool_calls
+        start_time = time.time()
+        await on_event({"type": "tool", "id": call_id, "tool": tool_name, "status": "running"})
+        tool_result = await self._run_tool(tool_name, tool_params, on_event)
+        await on_event({
+            "type": "tool",
+            "id": call_id,
+            "tool": tool_name,
+            "status": "success" if tool_result and tool_result.get("success") else "failed",
+            "params": {key: value for key, value in tool_params.items() if key != "data"},
+            "duration": f"{(time.time() - start_time) * 1000:.0f}ms"
+        })
+        return tool_result
+    
+    async def _run_tool(
+        self,
+        tool_name: str,
+        tool_params: Dict[str, Any],
+        on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """依次尝试会话复用、推测执行结果，最后实际调用工具"""
+        reused = self._reusable.get(tool_cache_key(tool_name, tool_params))
+        if reused is not None:
+            print(f"[DEBUG] Agent 复用会话中的工具结果 - {tool_name}")
+            metrics.increment("session.reused_tools")
+            return copy.deepcopy(reused)
+        
+        speculative_task = self._take_speculation(tool_name, tool_params)
+        if speculative_task:
+            print(f"[DEBUG] Agent 采用推测执行结果 - {tool_name}")
+            return await speculative_task
+        
+        if not on_event:
+            return await self.scheduler.call_tool(tool_name, tool_params)
+        
+        tool_result = None
+        async for event in self.scheduler.stream_tool(tool_name, tool_params):
+            if event["type"] == "delta":
+                await on_event({"type": "delta", "tool": tool_name, "content": event["content"]})
+            elif event["type"] == "result":
+                tool_result = event["result"]
+        return tool_result
+    
+    def _follow_up(self, user_input: str, rule_match: Dict[str, Any], conversation_id: str):
+        """
+        把追问（"再帮我写个总结"、"换成上海"）解析为基于上一轮计划的执行计划
         
         Returns:
-            JSON 格式的意图识别结果
+            与 _parse_intent_result 相同的格式；不是追问时返回 None
+        """
+        last_turn = session_store.last_turn(conversation_id)
+        if not last_turn:
+            return None
+        plan = plan_follow_up(user_input, rule_match, last_turn["plan"])
+        if not plan:
+            return None
+        print(f"[DEBUG] Agent 识别为追问，沿用上一轮计划: {[(tool_info['tool'], tool_info['parameters']) for tool_info in plan]}")
+        metrics.increment("intent_source.session")
+        return self._rule_match_to_parsed({"tools": plan}, user_input)
+    
+    def _record_turn(
+        self,
+        conversation_id: Optional[str],
+        user_input: str,
+        plan: List[Dict[str, Any]],
+        results: List[Dict[str, Any]]
+    ) -> None:
+        """保存本轮的计划和工具结果（没有对话 ID 时不保存）"""
+        if conversation_id:
+            session_store.record_turn(conversation_id, user_input, plan, results)
+    
+    def _rule_match_to_parsed(self, rule_match: Dict[str, Any], user_input: str):
         """
-        # 构建提示词
-        prompt = self.prompt_template.get_intent_recognition_prompt(user_input)
+        将规则识别结果转换为与 _parse_intent_result 相同的格式
         
-        # 调用大模型
-        messages = [
-            {
-                "role": "system",
-                "content": "你是一个智能助手，负责分析用户需求并选择合适的工具。请严格按照 JSON 格式返回结果。"
-            },
+        Returns:
+            单工具: (tool_name, tool_params) 元组
+            多工具: {"tools": [...]} 字典
+            无法识别: (None, {})
+        """
+        tools = rule_match["tools"]
+        if not tools:
+            return None, {}
+        processed_tools = [
             {
-                "role": "user",
-                "content": prompt
+                "tool": tool_info["tool"],
+                "parameters": self._process_tool_params(tool_info["tool"], dict(tool_info["parameters"]), user_input)
             }
+            for tool_info in tools
         ]
+        if len(processed_tools) > 1:
+            return {"tools": processed_tools}
+        return processed_tools[0]["tool"], processed_tools[0]["parameters"]
+    
+    def _fill_missing_tasks(self, parsed_result, rule_match: Dict[str, Any], user_input: str):
+        """补上规则引擎检测到、但大模型识别结果中缺少的工具（返回格式与 _parse_intent_result 相同）"""
+        if isinstance(parsed_result, dict):
+            tools = parsed_result["tools"]
+        elif parsed_result[0]:
+            tools = [{"tool": parsed_result[0], "parameters": parsed_result[1]}]
+        else:
+            tools = []
+        filled = fill_missing_tasks(tools, rule_match["tools"])
+        if len(filled) == len(tools):
+            return parsed_result
+        print(f"[DEBUG] Agent 补充大模型遗漏的任务: {[tool_info['tool'] for tool_info in filled[len(tools):]]}")
+        return self._rule_match_to_parsed({"tools": filled}, user_input)
+    
+    async def _decompose_intent(self, user_input: str, rule_match: Dict[str, Any]):
+        """
+        拆分复合请求：子请求由规则识别，置信度不足的子请求并发调用大模型识别
+        
+        Returns:
+            与 _parse_intent_result 相同的格式；无法拆分时返回 None
+        """
+        plan = await decompose(
+            user_input,
+            rule_match,
+            self._recognize_part,
+            settings.INTENT_DECOMPOSE_RULE_THRESHOLD
+        )
+        if not plan:
+            return None
+        print(f"[DEBUG] Agent 复合请求合并计划: {[tool_info['tool'] for tool_info in plan]}")
+        metrics.increment("intent_source.decomposed")
+        return self._rule_match_to_parsed({"tools": plan}, user_input)
+    
+    async def _recognize_part(self, part: str) -> Optional[List[Dict[str, Any]]]:
+        """用大模型识别单个子请求（沿用意图缓存和延迟预算），超出延迟预算时返回 None"""
+        tool_names = self._prompt_tool_names(match_intent(part))
+        intent_result, latency = await self._recognize_intent(part, tool_names, LLMService(stage="intent"))
+        if intent_result is None:
+            return None
+        parsed_result = self._parse_intent_result(intent_result, part, latency)
+        if isinstance(parsed_result, dict):
+            return parsed_result["tools"]
+        tool_name, tool_params = parsed_result
+        return [{"tool": tool_name, "parameters": tool_params}] if tool_name else None
+    
+    def _prompt_tool_names(self, rule_match: Dict[str, Any]) -> Optional[List[str]]:
+        """意图识别提示词要介绍的工具：规则识别置信度足够高时只介绍预识别到的工具，否则返回 None（介绍全部）"""
+        if not settings.INTENT_PROMPT_FILTER_TOOLS:
+            return None
+        if rule_match["confidence"] < settings.INTENT_PROMPT_FILTER_MIN_CONFIDENCE:
+            return None
+        return [tool_info["tool"] for tool_info in rule_match["tools"]] or None
+    
+    def _classify_intent(self, user_input: str):
+        """
+        使用本地分类器预测工具组合（参数由规则引擎提取）
+        
+        Returns:
+            与 _parse_intent_result 相同的格式；模型未训练或置信度不足时返回 None
+        """
+        classifier = get_classifier()
+        if classifier is None:
+            return None
+        tools, confidence = classifier.predict(user_input)
+        if not tools or confidence < settings.INTENT_CLASSIFIER_THRESHOLD:
+            print(f"[DEBUG] Agent 本地分类器置信度不足 - 预测: {tools}, 置信度: {confidence:.3f}")
+            return None
+        print(f"[DEBUG] Agent 本地分类器预测 {tools}（置信度 {confidence:.3f}），跳过大模型")
+        metrics.increment("intent_source.classifier")
+        return self._rule_match_to_parsed({"tools": build_tool_plan(user_input, tools)}, user_input)
+    
+    def _log_intent(self, user_input: str, tool_names: List[str], latency: Optional[float]) -> None:
+        """
+        记录大模型识别出的工具组合，作为本地分类器的训练数据
+        
+        Args:
+            latency: 本次大模型意图识别的耗时（秒），为 None 时不记录（降级方案和缓存命中的结果）
+        """
+        if latency is None:
+            return
+        log_intent(user_input, tool_names, latency)
+    
+    async def _recognize_intent(
+        self,
+        user_input: str,
+        tool_names: Optional[List[str]] = None,
+        llm_service: Optional[LLMService] = None
+    ) -> Tuple[Optional[Union[str, Dict[str, Any]]], Optional[float]]:
+        """
+        使用大模型识别用户意图（带延迟预算）
+        
+        Args:
+            user_input: 用户输入
+            tool_names: 提示词中只介绍这些工具（规则预识别结果），为空时介绍全部工具
+            llm_service: 使用的大模型服务，为空时使用 self.llm_service（并发识别子请求时各用一个实例）
+        
+        - 相同输入命中意图缓存时直接返回；近似输入（相似度达到阈值且实体一致）复用其意图识别结果
+        - 配置了 LLM_HEDGE_BASE_URL 时，主请求超过 LLM_HEDGE_DELAY 仍未返回则向备用端点发出对冲请求，采用先返回的结果
+        - 超过 INTENT_LLM_TIMEOUT 仍未返回时放弃等待，大模型请求在后台继续完成并写入意图缓存
+        
+        Returns:
+            (意图识别结果, 大模型识别耗时)：耗时随结果返回（并发识别子请求时互不覆盖），
+            命中缓存、复用近似输入或大模型调用降级（结果来自规则识别）时为 None；
+            超出延迟预算时返回 (None, None)（由调用方使用规则识别结果）
+        """
+        cache_key = intent_key(user_input)
+        cached = intent_cache.get(cache_key)
+        if cached is not None:
+            print(f"[DEBUG] Agent 意图缓存命中 - 用户输入: {user_input}")
+            metrics.increment("intent_source.cache")
+            return cached, None
+        
+        if settings.INTENT_SIMILARITY_ENABLED:
+            similar = similar_intents.lookup(user_input, intent_cache)
+            if similar is not None:
+                print(f"[DEBUG] Agent 复用近似输入的意图 - {similar['input']}（相似度 {similar['similarity']:.2f}）")
+                metrics.increment("intent_source.similar")
+                if random.random() < settings.INTENT_SIMILARITY_VERIFY_RATE:
+                    self._verify_reuse(user_input, tool_names, similar["result"], cache_key)
+                return similar["result"], None
+        
+        messages, tool_schemas = self._intent_messages(user_input, tool_names)
         
         print(f"[DEBUG] Agent 调用大模型 - 用户输入: {user_input}")
-        response = await self.llm_service.chat(messages, temperature=0.3, user_input=user_input)
-        print(f"[DEBUG] Agent 收到大模型响应 - 长度: {len(response)} 字符")
-        print(f"[DEBUG] Agent 收到大模型响应 - 内容: {response[:300]}...")
-        return response
+        start_time = time.time()
+        budget = settings.INTENT_LLM_TIMEOUT or None
+        tasks = [self._start_intent_request(llm_service or self.llm_service, messages, tool_schemas, user_input, cache_key)]
+        
+        try:
+            hedge_service = self._hedge_service()
+            if hedge_service:
+                delay = settings.LLM_HEDGE_DELAY if budget is None else min(settings.LLM_HEDGE_DELAY, budget)
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    print(f"[DEBUG] Agent 主请求 {delay}s 未返回，发出对冲请求 - {hedge_service.base_url}")
+                    tasks.append(self._start_intent_request(hedge_service, messages, tool_schemas, user_input, cache_key))
+            
+            remaining = None if budget is None else max(budget - (time.time() - start_time), 0)
+            done, pending = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # 工作流被取消：同时取消在途的大模型请求，不再消耗额度
+            for task in tasks:
+                task.cancel()
+            raise
+        if not done:
+            # 超出延迟预算：请求留在后台继续执行，完成后写入意图缓存
+            for task in pending:
+                track_background(task)
+            print(f"[WARNING] Agent 意图识别超出延迟预算 {budget}s，使用规则识别结果")
+            metrics.increment("intent_source.timeout")
+            return None, None
+        
+        for task in pending:
+            # 已有结果，取消较慢的请求
+            task.cancel()
+        response, used_fallback = next(iter(done)).result()
+        if used_fallback:
+            # 大模型调用失败或被准入控制拒绝，结果来自规则识别，不作为分类器训练数据
+            metrics.increment("intent_source.llm_fallback")
+            print(f"[DEBUG] Agent 大模型意图识别使用了降级方案 - 内容: {str(response)[:300]}...")
+            return response, None
+        latency = time.time() - start_time
+        metrics.increment("intent_source.llm")
+        metrics.observe("intent_llm_latency_ms", round(latency * 1000, 1))
+        print(f"[DEBUG] Agent 收到大模型响应 - 内容: {str(response)[:300]}...")
+        return response, latency
+    
+    def _intent_messages(
+        self,
+        user_input: str,
+        tool_names: Optional[List[str]]
+    ) -> Tuple[list, List[Dict[str, Any]]]:
+        """构建意图识别提示词（静态部分在前，工具说明只包含规则预识别到的工具），返回 (消息列表, 工具定义)"""
+        if settings.LLM_FUNCTION_CALLING:
+            # 原生函数调用：工具定义通过 tools 参数传递
+            messages = self.prompt_template.get_function_calling_messages(user_input)
+            tool_schemas = get_tool_schemas(tool_names)
+        else:
+            messages = self.prompt_template.get_intent_recognition_messages(user_input, tool_names)
+            tool_schemas = []
+        prompt_tokens = estimate_tokens("".join(message["content"] for message in messages))
+        if tool_schemas:
+            prompt_tokens += estimate_tokens(json.dumps(tool_schemas, ensure_ascii=False))
+        metrics.observe("intent_prompt_tokens", prompt_tokens)
+        print(f"[DEBUG] Agent 意图识别提示词 - 估算 token: {prompt_tokens}, 工具: {tool_names or '全部'}")
+        return messages, tool_schemas
+    
+    def _verify_reuse(self, user_input: str, tool_names: Optional[List[str]], reused: Any, cache_key: str) -> None:
+        """抽样校验近似复用：后台用大模型重新识别，统计误复用率，结果写入意图缓存"""
+        messages, tool_schemas = self._intent_messages(user_input, tool_names)
+        llm_service = self.llm_service
+        task = self._start_intent_request(llm_service, messages, tool_schemas, user_input, cache_key)
+        
+        def _on_done(done_task: asyncio.Task) -> None:
+            if done_task.cancelled() or done_task.exception() is not None:
+                return
+            result, used_fallback = done_task.result()
+            if used_fallback:
+                return
+            if similar_intents.record_verification(reused, result):
+                print(f"[WARNING] Agent 近似意图误复用 - 用户输入: {user_input}")
+        
+        task.add_done_callback(_on_done)
+        track_background(task)
+    
+    def _start_intent_request(
+        self,
+        llm_service: LLMService,
+        messages: list,
+        tool_schemas: List[Dict[str, Any]],
+        user_input: str,
+        cache_key: str
+    ) -> "asyncio.Task":
+        """发起一次意图识别请求，成功（非降级）的结果在完成时写入意图缓存；任务结果为 (意图识别结果, 是否使用了降级方案)"""
+        task = asyncio.create_task(self._call_intent_llm(llm_service, messages, tool_schemas, user_input))
+        store_when_done(task, cache_key, user_input)
+        return task
+    
+    async def _call_intent_llm(
+        self,
+        llm_service: LLMService,
+        messages: list,
+        tool_schemas: List[Dict[str, Any]],
+        user_input: str
+    ) -> Tuple[Union[str, Dict[str, Any]], bool]:
+        """
+        调用大模型识别意图
+        
+        Returns:
+            (意图识别结果, 是否使用了降级方案)：函数调用模式的结果为 {"tools": [...]} 字典，
+            文本模式（或模型未使用函数调用、只返回文本）为 JSON 文本
+        """
+        if not settings.LLM_FUNCTION_CALLING:
+            if settings.INTENT_STREAMING:
+                return await self._stream_intent(llm_service, messages, user_input)
+            reply = await llm_service.chat_result(messages, temperature=0.3, user_input=user_input)
+            return reply["content"], reply["fallback"]
+        result = await llm_service.chat_with_tools(messages, tool_schemas, temperature=0.3, user_input=user_input)
+        if not result["tools"] and result["content"].lstrip().startswith(("{", "```")):
+            # 模型不支持函数调用，按 JSON 文本返回了结果
+            return result["content"], result["fallback"]
+        return {"tools": result["tools"]}, result["fallback"]
+    
+    async def _stream_intent(self, llm_service: LLMService, messages: list, user_input: str) -> Tuple[str, bool]:
+        """
+        流式调用大模型识别意图
+        
+        每个工具调用对象一闭合就推测执行该工具，不等待完整响应；返回 (完整的响应文本, 是否使用了降级方案或输出不完整)
+        """
+        extractor = JsonExtractor()
+        chunks = []
+        status: Dict[str, Any] = {}
+        async for delta in llm_service.chat_stream(messages, temperature=0.3, user_input=user_input, status=status):
+            chunks.append(delta)
+            for event in extractor.feed(delta):
+                if event["type"] == "tool_call":
+                    tool_call = event["tool_call"]
+                    print(f"[DEBUG] Agent 流式意图识别 - 工具调用已完整: {tool_call['tool']}")
+                    self._speculate(tool_call["tool"].lower(), tool_call.get("parameters") or {}, user_input)
+        # 输出中途中断的响应不完整，与降级结果一样不写入意图缓存
+        return "".join(chunks), status["fallback"] or status["incomplete"]
+    
+    def _hedge_service(self) -> Optional[LLMService]:
+        """
+        对冲请求使用的备用大模型服务，未配置时返回 None
+        
+        API Key 和模型为空时使用全局的 LLM_API_KEY / LLM_MODEL（不继承 LLM_INTENT_*，那是主端点的配置），
+        输出 token 上限、超时和准入优先级仍按意图识别阶段
+        """
+        if not settings.LLM_HEDGE_BASE_URL or not self.llm_service.available:
+            return None
+        return LLMService(
+            stage="intent",
+            api_key=settings.LLM_HEDGE_API_KEY or settings.LLM_API_KEY,
+            base_url=settings.LLM_HEDGE_BASE_URL,
+            model=settings.LLM_HEDGE_MODEL or settings.LLM_MODEL
+        )
     
-    def _parse_intent_result(self, intent_result: str, user_input: str):
+    def _parse_intent_result(
+        self,
+        intent_result: Union[str, Dict[str, Any]],
+        user_input: str,
+        latency: Optional[float] = None
+    ):
         """
         解析大模型返回的意图识别结果（支持单工具和多工具）
         
+        Args:
+            intent_result: JSON 文本，或函数调用模式返回的 {"tools": [...]} 字典
+            latency: 大模型识别耗时（秒），用于记录分类器训练数据，为 None 时不记录
+        
         Returns:
             单工具: (tool_name, tool_params) 元组
             多工具: {"tools": [...]} 字典
         """
         try:
-            # 尝试解析 JSON
-            # 处理可能的 markdown 代码块
-            intent_result = intent_result.strip()
-            print(f"[DEBUG] Agent 解析 - 原始响应: {intent_result[:200]}...")
-            
-            if "```json" in intent_result:
-                match = re.search(r'```json\s*(.*?)\s*```', intent_result, re.DOTALL)
-                if match:
-                    intent_result = match.group(1)
-                    print(f"[DEBUG] Agent 解析 - 从 markdown 代码块中提取 JSON")
-            elif "```" in intent_result:
-                match = re.search(r'```\s*(.*?)\s*```', intent_result, re.DOTALL)
-                if match:
-                    intent_result = match.group(1)
-                    print(f"[DEBUG] Agent 解析 - 从代码块中提取内容")
-            
-            # 尝试提取 JSON 对象（支持多工具格式）
-            # 先尝试匹配多工具格式（包含 "tools" 数组）
-            multi_tool_match = re.search(r'\{[^{}]*"tools"[^{}]*\[[^\]]*\][^{}]*\}', intent_result, re.DOTALL)
-            if multi_tool_match:
-                intent_result = multi_tool_match.group(0)
-                print(f"[DEBUG] Agent 解析 - 从文本中提取多工具 JSON 对象")
+            if isinstance(intent_result, dict):
+                # 函数调用返回的结构化结果，无需从文本中提取 JSON
+                calls = intent_result.get("tools") or []
+                if len(calls) == 1:
+                    result = {"tool": calls[0]["tool"], "parameters": calls[0].get("parameters") or {}}
+                elif calls:
+                    result = {"tools": calls}
+                else:
+                    result = {"tool": None}
+                print(f"[DEBUG] Agent 解析 - 函数调用结果: {result}")
             else:
-                # 尝试匹配单工具格式
-                single_tool_match = re.search(r'\{[^{}]*"tool"[^{}]*\}', intent_result, re.DOTALL)
-                if single_tool_match:
-                    intent_result = single_tool_match.group(0)
-                    print(f"[DEBUG] Agent 解析 - 从文本中提取单工具 JSON 对象")
-            
-            result = json.loads(intent_result)
-            print(f"[DEBUG] Agent 解析 - JSON 解析成功: {result}")
+                # 扫描配对的 JSON 对象（忽略代码块标记和说明文字，自动修复尾随逗号、单引号等）
+                print(f"[DEBUG] Agent 解析 - 原始响应: {intent_result.strip()[:200]}...")
+                result = extract_intent_json(intent_result)
+                if result is None:
+                    raise json.JSONDecodeError("未找到可解析的 JSON 对象", intent_result, 0)
+                print(f"[DEBUG] Agent 解析 - JSON 解析成功: {result}")
             
             # 检查是否是多工具格式
             if "tools" in result and isinstance(result["tools"], list):
@@ -300,12 +788,16 @@ class Agent:
                         "parameters": processed_params
                     })
                 
+                self._log_intent(user_input, [tool_info["tool"] for tool_info in processed_tools], latency)
                 return {"tools": processed_tools}
             
             # 单工具格式
             tool_name = result.get("tool")
             if not tool_name:
                 print(f"[DEBUG] Agent 解析 - 未找到 tool 字段，降级到规则识别")
+                if "tool" in result:
+                    # 大模型明确表示无法识别（tool 为 null）
+                    self._log_intent(user_input, [], latency)
                 return self._fallback_parse(user_input)
             
             # 转换为小写，匹配工具注册表中的名称
@@ -319,6 +811,7 @@ class Agent:
             # 参数后处理
             processed_params = self._process_tool_params(tool_name, parameters, user_input)
             
+            self._log_intent(user_input, [tool_name], latency)
             return tool_name, processed_params
                 
         except json.JSONDecodeError as e:
@@ -348,32 +841,20 @@ class Agent:
             query = parameters.get("query", user_input)
             limit = parameters.get("limit", 10)
             print(f"[DEBUG] Agent 解析 - 新闻工具: query={query}, limit={limit}")
-            return {"query": query, "limit": limit}
+            processed = {"query": query, "limit": limit}
+            if parameters.get("category"):
+                # 保留大模型识别出的新闻分类
+                processed["category"] = parameters["category"]
+            return processed
         
         elif tool_name == "stock":
             symbol = parameters.get("symbol", "000001")
             days = parameters.get("days", 5)
             
-            # 股票名称到代码的映射
-            stock_name_to_code = {
-                "贵州茅台": "600519",
-                "茅台": "600519",
-                "平安银行": "000001",
-                "平安": "000001",
-                "腾讯控股": "00700",
-                "腾讯": "00700",
-                "阿里巴巴": "09988",
-                "阿里": "09988",
-                "万科A": "000002",
-                "万科": "000002",
-                "招商银行": "600036",
-                "五粮液": "000858",
-            }
-            
             # 如果 symbol 是股票名称，转换为代码
             original_symbol = symbol
-            if symbol in stock_name_to_code:
-                symbol = stock_name_to_code[symbol]
+            if symbol in STOCK_NAME_TO_CODE:
+                symbol = STOCK_NAME_TO_CODE[symbol]
                 print(f"[DEBUG] Agent 股票名称转换: {original_symbol} -> {symbol}")
             
             print(f"[DEBUG] Agent 解析 - 股票工具: symbol={symbol}, days={days}")
@@ -389,61 +870,20 @@ class Agent:
             content = parameters.get("content", user_input)
             data = parameters.get("data", {})  # 保留 data 参数（可能来自前一个工具）
             print(f"[DEBUG] Agent 解析 - 文档工具: template={template}, content={content[:50]}...")
-            return {"template": template, "content": content, "data": data}
+            processed = {"template": template, "content": content, "data": data}
+            if parameters.get("format"):
+                # 保留导出格式（docx/html 会在后台导出为文件）
+                processed["format"] = parameters["format"]
+            return processed
         
         else:
             return parameters
     
     def _extract_city(self, user_input: str) -> str:
         """从用户输入中提取城市名称"""
-        cities = ["北京", "上海", "广州", "深圳", "杭州", "南京", "成都", "武汉", 
-                 "西安", "天津", "重庆", "苏州", "长沙", "郑州", "青岛", "大连",
-                 "济南", "福州", "厦门", "合肥", "石家庄", "哈尔滨", "长春", "沈阳"]
-        for city in cities:
-            if city in user_input:
-                return city
-        return "北京"  # 默认
+        return match_intent(user_input)["entities"]["city"] or "北京"  # 默认
     
-    def _fallback_parse(self, user_input: str) -> tuple:
+    def _fallback_parse(self, user_input: str):
         """降级方案：基于规则的解析"""
         print(f"[DEBUG] Agent 使用降级方案（规则识别）- 用户输入: {user_input}")
-        user_input_lower = user_input.lower()
-        
-        # 按优先级检查（新闻优先，必须明确包含"新闻"或"资讯"）
-        if "新闻" in user_input_lower or "资讯" in user_input_lower or "news" in user_input_lower:
-            # 提取查询关键词
-            query = user_input
-            query = re.sub(r'抓取|检索|搜索|找|看看|查|列出|总结', '', query)
-            query = re.sub(r'新闻|资讯|news', '', query, flags=re.IGNORECASE)
-            query = query.strip()
-            
-            # 提取数量
-            limit = 10
-            limit_match = re.search(r'(\d+)\s*条', user_input)
-            if limit_match:
-                limit = int(limit_match.group(1))
-                limit = min(max(limit, 1), 50)
-            
-            # 提取领域关键词
-            if not query or len(query) < 2:
-                if "ai" in user_input_lower or "人工智能" in user_input_lower:
-                    query = "AI"
-                elif "科技" in user_input_lower:
-                    query = "科技"
-                elif "国内" in user_input_lower:
-                    query = "国内"
-                else:
-                    query = "科技"
-            
-            return "news", {"query": query, "limit": limit}
-        elif "天气" in user_input_lower or "气温" in user_input_lower:
-            location = self._extract_city(user_input)
-            days = 1 if any(kw in user_input_lower for kw in ["现在", "今天"]) else 7
-            return "weather", {"location": location, "days": days}
-        elif "股票" in user_input_lower:
-            return "stock", {"symbol": "000001", "days": 5}
-        elif "计算" in user_input_lower or "+" in user_input or "-" in user_input:
-            return "calculate", {"expression": user_input}
-        else:
-            return None, {}
-
+        return self._rule_match_to_parsed(match_intent(user_input), user_input)
@@ -0,0 +1,217 @@
+"""
+文档导出产物存储
+
+将 Markdown 文档在后台线程中渲染为 docx / html 文件，按内容哈希保存在本地目录中。
+工作流结果中只返回产物的 ID 和下载地址，文件本身通过下载接口流式返回；
+相同内容的重复导出直接命中磁盘上已有的文件。
+目录中的文件数超出 ARTIFACT_MAX_FILES 时，按最近使用时间删除最旧的文件；
+导出失败的任务记录在状态被查询一次后删除，未被查询的失败记录最多保留 MAX_FAILED_JOBS 条。
+"""
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import re
+import threading
+from app.core.cache import fingerprint
+from app.config import settings
+
+# 支持导出的格式及对应的 MIME 类型
+EXPORT_FORMATS: Dict[str, str] = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "html": "text/html"
+}
+
+def render_html(markdown_text: str, title: str) -> bytes:
+    """将 Markdown 渲染为完整的 HTML 页面"""
+    import html as html_lib
+    import markdown
+
+    title = html_lib.escape(title)
+    body = markdown.markdown(markdown_text, extensions=["tables", "fenced_code"])
+    html = f"""<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+    return html.encode("utf-8")
+
+def _strip_inline_markdown(text: str) -> str:
+    """去掉行内 Markdown 标记（粗体、斜体、行内代码、链接）"""
+    text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)
+    text = re.sub(r'(\*\*|__|\*|_|`)(.+?)\1', r'\2', text)
+    return text.strip()
+
+def render_docx(markdown_text: str, path: str) -> None:
+    """将 Markdown 按行转换为 Word 文档（标题、列表、段落）"""
+    from docx import Document
+
+    document = Document()
+    for line in markdown_text.splitlines():
+        stripped = line.strip()
+        if not stripped or re.fullmatch(r'[-*_]{3,}', stripped):
+            continue
+        heading = re.match(r'^(#{1,6})\s+(.*)$', stripped)
+        bullet = re.match(r'^[-*+]\s+(.*)$', stripped)
+        numbered = re.match(r'^\d+[.)]\s+(.*)$', stripped)
+        if heading:
+            document.add_heading(_strip_inline_markdown(heading.group(2)), level=min(len(heading.group(1)), 4))
+        elif bullet:
+            document.add_paragraph(_strip_inline_markdown(bullet.group(1)), style="List Bullet")
+        elif numbered:
+            document.add_paragraph(_strip_inline_markdown(numbered.group(1)), style="List Number")
+        else:
+            document.add_paragraph(_strip_inline_markdown(stripped))
+    document.save(path)
+
+# 未被查询的失败任务记录上限
+MAX_FAILED_JOBS = 256
+
+class ArtifactStore:
+    """按内容哈希保存导出文件，并在后台线程池中执行渲染"""
+
+    def __init__(self, root_dir: str, max_workers: int = 2, max_files: int = 500):
+        self.root_dir = root_dir
+        self.max_files = max_files
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="artifact-export")
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, artifact_id: str, format_type: str) -> str:
+        return os.path.join(self.root_dir, f"{artifact_id}.{format_type}")
+
+    def _describe(self, artifact_id: str, format_type: str, status: str, error: str = None) -> Dict[str, Any]:
+        return {
+            "id": artifact_id,
+            "format": format_type,
+            "status": status,
+            "error": error,
+            "url": f"/api/documents/{artifact_id}/download"
+        }
+
+    def submit(self, markdown_text: str, format_type: str, title: str = "文档") -> Dict[str, Any]:
+        """
+        提交导出任务
+
+        Args:
+            markdown_text: Markdown 文档内容
+            format_type: 导出格式（docx/html）
+            title: 文档标题
+
+        Returns:
+            产物描述：{"id", "format", "status": "ready"|"pending"|"unsupported", "error", "url"}
+        """
+        format_type = format_type.lower()
+        artifact_id = fingerprint("artifact", format_type, markdown_text)[:32]
+        if format_type not in EXPORT_FORMATS:
+            return self._describe(artifact_id, format_type, "unsupported", f"不支持的导出格式：{format_type}")
+
+        path = self._path(artifact_id, format_type)
+        if os.path.exists(path):
+            print(f"[DEBUG] 导出产物已存在，直接复用 - {artifact_id}.{format_type}")
+            try:
+                # 更新修改时间，清理时按最近使用排序
+                os.utime(path)
+            except OSError:
+                pass
+            return self._describe(artifact_id, format_type, "ready")
+
+        with self._lock:
+            job = self._jobs.get(artifact_id)
+            if job and job["status"] == "pending":
+                return self._describe(artifact_id, format_type, "pending")
+            self._jobs[artifact_id] = {"format": format_type, "status": "pending", "error": None}
+
+        self._executor.submit(self._render, artifact_id, markdown_text, format_type, title)
+        print(f"[DEBUG] 已提交后台导出任务 - {artifact_id}.{format_type}")
+        return self._describe(artifact_id, format_type, "pending")
+
+    def _render(self, artifact_id: str, markdown_text: str, format_type: str, title: str) -> None:
+        """在后台线程中渲染文件（先写临时文件再替换，避免下载到半截文件）"""
+        path = self._path(artifact_id, format_type)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.root_dir, exist_ok=True)
+            if format_type == "html":
+                with open(tmp_path, "wb") as f:
+                    f.write(render_html(markdown_text, title))
+            else:
+                render_docx(markdown_text, tmp_path)
+            os.replace(tmp_path, path)
+            status, error = "ready", None
+            print(f"[DEBUG] 导出完成 - {artifact_id}.{format_type}")
+            self._prune()
+        except Exception as e:
+            status, error = "failed", f"导出失败：{str(e)}"
+            print(f"[ERROR] 导出 {artifact_id}.{format_type} 失败：{e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        with self._lock:
+            if status == "ready":
+                # 已生成的文件以磁盘为准，不再保留任务记录
+                self._jobs.pop(artifact_id, None)
+            else:
+                self._jobs[artifact_id] = {"format": format_type, "status": status, "error": error}
+                self._jobs.move_to_end(artifact_id)
+                failed = [job_id for job_id, job in self._jobs.items() if job["status"] == "failed"]
+                for job_id in failed[:max(len(failed) - MAX_FAILED_JOBS, 0)]:
+                    del self._jobs[job_id]
+
+    def _prune(self) -> None:
+        """文件数超出上限时，删除最久未使用的文件（不含正在写入的临时文件）"""
+        try:
+            files = [
+                os.path.join(self.root_dir, filename)
+                for filename in os.listdir(self.root_dir)
+                if filename.rsplit(".", 1)[-1] in EXPORT_FORMATS
+            ]
+            if len(files) <= self.max_files:
+                return
+            files.sort(key=os.path.getmtime)
+        except OSError:
+            # 其他导出线程同时在清理
+            return
+        for path in files[:len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        print(f"[DEBUG] 清理导出产物 {len(files) - self.max_files} 个，保留 {self.max_files} 个")
+
+    def status(self, artifact_id: str) -> Optional[Dict[str, Any]]:
+        """查询产物状态，未知 ID 返回 None"""
+        located = self.locate(artifact_id)
+        if located:
+            return self._describe(artifact_id, located[1], "ready")
+        with self._lock:
+            job = self._jobs.get(artifact_id)
+            if job and job["status"] == "failed":
+                # 失败状态只报告一次（重新提交会重新导出）
+                del self._jobs[artifact_id]
+        if job:
+            return self._describe(artifact_id, job["format"], job["status"], job["error"])
+        return None
+
+    def locate(self, artifact_id: str) -> Optional[Tuple[str, str]]:
+        """查找已生成的文件，返回 (路径, 格式)"""
+        if not re.fullmatch(r'[0-9a-f]{32}', artifact_id):
+            return None
+        for format_type in EXPORT_FORMATS:
+            path = self._path(artifact_id, format_type)
+            if os.path.exists(path):
+                return path, format_type
+        return None
+
+artifact_store = ArtifactStore(
+    settings.ARTIFACT_DIR,
+    max_workers=settings.ARTIFACT_EXPORT_WORKERS,
+    max_files=settings.ARTIFACT_MAX_FILES
+)
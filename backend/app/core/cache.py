@@ -0,0 +1,167 @@
+"""
+结果缓存
+
+提供基于稳定指纹的有界缓存：内存 LRU 作为一级缓存，磁盘 JSON 文件作为二级缓存。
+缓存键由输入的规范化 JSON 计算得到，上游数据一旦变化，指纹随之变化，旧条目自然失效。
+"""
+from typing import Dict, Any, Optional
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+
+def fingerprint(*parts: Any) -> str:
+    """
+    计算输入的稳定指纹
+
+    对参数做规范化 JSON 序列化（键排序、紧凑分隔符），保证相同内容得到相同哈希
+    """
+    canonical = json.dumps(
+        parts,
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """内存 + 磁盘两级结果缓存（线程安全）"""
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 256,
+        ttl: int = 3600,
+        cache_dir: Optional[str] = None,
+        max_disk_entries: int = 2048
+    ):
+        """
+        Args:
+            name: 缓存名称（用于日志）
+            max_entries: 内存中最多保留的条目数
+            ttl: 条目有效期（秒）
+            cache_dir: 磁盘缓存目录，为空时只使用内存
+            max_disk_entries: 磁盘上最多保留的条目数
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _is_expired(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["created_at"] > self.ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，未命中或已过期时返回 None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._is_expired(entry):
+                    del self._memory[key]
+                else:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry["value"]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            # 磁盘命中后回填内存
+            self._put_memory(key, entry)
+            self.hits += 1
+        return entry["value"]
+
+    def set(self, key: str, value: Any) -> None:
+        """写入缓存"""
+        entry = {"created_at": time.time(), "value": value}
+        with self._lock:
+            self._put_memory(key, entry)
+        self._write_disk(key, entry)
+
+    def invalidate(self, key: str) -> None:
+        """删除指定条目"""
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.cache_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._memory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0
+            }
+
+    def _put_memory(self, key: str, entry: Dict[str, Any]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._is_expired(entry):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _write_disk(self, key: str, entry: Dict[str, Any]) -> None:
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # 先写临时文件再替换，避免并发读到半截内容
+            tmp_path = f"{self._disk_path(key)}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self._disk_path(key))
+            self._prune_disk()
+        except OSError as e:
+            print(f"[WARNING] {self.name} 缓存写入磁盘失败：{e}")
+
+    def _prune_disk(self) -> None:
+        """磁盘条目超出上限时，删除最旧的文件"""
+        files = [
+            os.path.join(self.cache_dir, filename)
+            for filename in os.listdir(self.cache_dir)
+            if filename.endswith(".json")
+        ]
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_disk_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,52 @@
+"""
+线程内工具的协作式取消
+
+同步工具通过 asyncio.to_thread 在线程池中运行，工作流被取消时线程无法被中断，会继续完成剩余的上游请求。
+调度器为每次线程调用创建一个取消令牌（CancelToken），放入 contextvar 后在线程中执行工具；
+工作流被取消时调度器将令牌置位，工具在每次访问上游 API 前调用 check_cancelled()，令牌已置位时立即中止，
+不再消耗上游配额。正在进行中的单个 HTTP 请求无法中断，最多等到该请求的超时。
+
+ToolCancelled 与 asyncio.CancelledError 一样继承 BaseException，工具中捕获 Exception 的降级逻辑不会吞掉取消。
+"""
+from typing import Any, Callable, Dict, Optional
+import contextvars
+import threading
+from app.core.metrics import metrics
+
+class ToolCancelled(BaseException):
+    """工具调用已被取消（在线程内的取消检查点抛出）"""
+
+class CancelToken:
+    """取消令牌（线程安全）"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+_current_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar("cancel_token", default=None)
+
+def run_with_token(token: CancelToken, function: Callable[[Dict[str, Any]], Any], params: Dict[str, Any]) -> Any:
+    """在线程中以指定的取消令牌执行工具（asyncio.to_thread 会复制上下文，这里的设置只影响本次调用）"""
+    _current_token.set(token)
+    if token.cancelled:
+        raise ToolCancelled()
+    return function(params)
+
+def check_cancelled(checkpoint: str = "") -> None:
+    """
+    取消检查点：当前调用已被取消时抛出 ToolCancelled（不在调度器线程中调用时不做任何事）
+
+    Args:
+        checkpoint: 检查点说明（用于日志）
+    """
+    token = _current_token.get()
+    if token is not None and token.cancelled:
+        print(f"[WARN] 工具调用已取消，跳过上游请求 {checkpoint}".rstrip())
+        metrics.increment("tools.cancelled_upstream")
+        raise ToolCancelled()
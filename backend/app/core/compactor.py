@@ -0,0 +1,273 @@
+"""
+上下文压缩器
+
+将上游工具返回的数据压缩为适合放入提示词的紧凑文本：
+- 按工具数据结构选择表格（列式）编码，去掉重复的键名和缩进空白
+- 丢弃对文档生成无用的字段（如新闻 url）
+- 长序列只保留末尾若干行，其余用统计值概括
+- 在构建提示词之前强制执行 token 预算
+"""
+from typing import Dict, Any, List, Optional
+import json
+import math
+
+# 各工具数据的结构描述
+# detect: 用于识别数据类型的键；rows: 列表字段；columns: 保留的列（其余字段丢弃）
+# header: 表格前输出的标量字段；numeric: 长序列时需要统计的数值列；text_limits: 文本列的最大长度
+TOOL_CONTEXT_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "weather": {
+        "detect": ["forecast"],
+        "rows": "forecast",
+        "columns": ["date", "weather", "maxTemp", "minTemp", "humidity", "wind"],
+        "header": ["location"],
+        "numeric": ["maxTemp", "minTemp", "humidity"],
+        "text_limits": {}
+    },
+    "news": {
+        "detect": ["articles"],
+        "rows": "articles",
+        "columns": ["publishedAt", "source", "title", "description"],
+        "header": ["total", "totalResults"],
+        "numeric": [],
+        "text_limits": {"title": 60, "description": 80}
+    },
+    "stock": {
+        "detect": ["prices"],
+        "rows": "prices",
+        "columns": ["date", "open", "close", "high", "low", "volume"],
+        "header": ["symbol", "name"],
+        "numeric": ["close", "high", "low", "volume"],
+        "text_limits": {}
+    },
+    "calculate": {
+        "detect": ["expression", "result"],
+        "rows": None,
+        "columns": [],
+        "header": ["expression", "result"],
+        "numeric": [],
+        "text_limits": {}
+    },
+    "document": {
+        "detect": ["content", "format"],
+        "rows": None,
+        "columns": [],
+        "header": ["template", "content"],
+        "numeric": [],
+        "text_limits": {"content": 600}
+    }
+}
+
+# 长序列保留的末尾行数（其余行用统计值概括）
+TAIL_ROWS = 3
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数
+
+    中日韩字符约 1 字 1 token，其他字符约 4 字符 1 token
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for char in text if ord(char) > 0x2E80)
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def detect_schema(data: Any) -> Optional[str]:
+    """根据数据中的键识别工具类型，无法识别时返回 None"""
+    if not isinstance(data, dict):
+        return None
+    for tool_name, schema in TOOL_CONTEXT_SCHEMAS.items():
+        if all(key in data for key in schema["detect"]):
+            return tool_name
+    return None
+
+def _format_number(value: float) -> str:
+    """格式化数值（整数原样输出，小数保留两位）"""
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:.2f}"
+
+def _format_cell(value: Any, limit: Optional[int] = None) -> str:
+    """格式化单元格，去掉分隔符并按长度截断"""
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        text = _format_number(value)
+    elif isinstance(value, (dict, list)):
+        text = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = str(value)
+    text = text.replace("|", "/").replace("\n", " ").strip()
+    if limit and len(text) > limit:
+        text = text[:limit] + "…"
+    return text
+
+def _format_row(row: Dict[str, Any], columns: List[str], text_limits: Dict[str, int]) -> str:
+    """将一行数据编码为以 | 分隔的单元格"""
+    return "|".join(_format_cell(row.get(column), text_limits.get(column)) for column in columns)
+
+def _summarize_numeric(rows: List[Dict[str, Any]], columns: List[str]) -> List[str]:
+    """对长序列的数值列生成统计摘要"""
+    lines = []
+    for column in columns:
+        values = [row.get(column) for row in rows if isinstance(row.get(column), (int, float))]
+        if not values:
+            continue
+        first, last = values[0], values[-1]
+        mean = sum(values) / len(values)
+        line = (
+            f"{column}: 首={_format_number(first)}, 末={_format_number(last)}, "
+            f"最小={_format_number(min(values))}, 最大={_format_number(max(values))}, 均值={mean:.2f}"
+        )
+        if first:
+            line += f", 变化={(last - first) / abs(first) * 100:+.2f}%"
+        lines.append(line)
+    return lines
+
+def _compact_tool_data(
+    tool_name: str,
+    data: Dict[str, Any],
+    max_rows: int,
+    text_scale: float
+) -> str:
+    """按工具结构压缩单个工具的数据"""
+    schema = TOOL_CONTEXT_SCHEMAS[tool_name]
+    text_limits = {
+        key: max(int(limit * text_scale), 10)
+        for key, limit in schema["text_limits"].items()
+    }
+    lines = [f"[{tool_name}]"]
+
+    for key in schema["header"]:
+        if key in data and data[key] not in (None, ""):
+            lines.append(f"{key}: {_format_cell(data[key], text_limits.get(key))}")
+
+    rows_key = schema["rows"]
+    rows = data.get(rows_key) if rows_key else None
+    if isinstance(rows, list) and rows:
+        columns = [column for column in schema["columns"] if any(column in row for row in rows)]
+        if len(rows) > max_rows and schema["numeric"]:
+            # 长数值序列：统计摘要 + 末尾若干行
+            lines.append(f"{rows_key} 共 {len(rows)} 行，统计：")
+            lines.extend(_summarize_numeric(rows, schema["numeric"]))
+            shown = rows[-min(TAIL_ROWS, max_rows):]
+            lines.append(f"最近 {len(shown)} 行（{'|'.join(columns)}）：")
+        elif len(rows) > max_rows:
+            # 长文本列表：只保留前若干行
+            shown = rows[:max_rows]
+            lines.append(f"{rows_key} 共 {len(rows)} 条，展示前 {len(shown)} 条（{'|'.join(columns)}）：")
+        else:
+            shown = rows
+            lines.append(f"{rows_key}（{'|'.join(columns)}）：")
+        for row in shown:
+            lines.append(_format_row(row, columns, text_limits))
+
+    return "\n".join(lines)
+
+def _render(data: Dict[str, Any], max_rows: int, text_scale: float) -> str:
+    """渲染上下文数据（支持多个工具结果按键嵌套）"""
+    tool_name = detect_schema(data)
+    if tool_name:
+        return _compact_tool_data(tool_name, data, max_rows, text_scale)
+
+    sections = []
+    for key, value in data.items():
+        nested_tool = detect_schema(value)
+        if nested_tool:
+            sections.append(_compact_tool_data(nested_tool, value, max_rows, text_scale))
+        elif isinstance(value, (dict, list)):
+            sections.append(f"- {key}: {json.dumps(value, ensure_ascii=False, separators=(',', ':'))}")
+        else:
+            sections.append(f"- {key}: {value}")
+    return "\n".join(sections)
+
+def compact_context(
+    data: Any,
+    token_budget: int,
+    max_rows: int = 15
+) -> str:
+    """
+    压缩上下文数据，保证结果不超过 token 预算
+
+    Args:
+        data: 上游工具返回的数据（单个工具的 data，或按工具名嵌套的多个 data）
+        token_budget: token 预算
+        max_rows: 表格最多保留的行数
+
+    Returns:
+        压缩后的上下文文本
+    """
+    if not data:
+        return ""
+    if not isinstance(data, dict):
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    else:
+        # 逐步减少行数和文本长度，直到满足预算
+        text_scale = 1.0
+        text = _render(data, max_rows, text_scale)
+        while estimate_tokens(text) > token_budget and (max_rows > 1 or text_scale > 0.2):
+            max_rows = max(max_rows // 2, 1)
+            text_scale = max(text_scale / 2, 0.2)
+            text = _render(data, max_rows, text_scale)
+
+    if estimate_tokens(text) > token_budget:
+        # 仍然超出预算，按比例硬截断
+        keep = max(int(len(text) * token_budget / estimate_tokens(text)), 1)
+        text = text[:keep] + "…（上下文已截断）"
+
+    print(f"[DEBUG] 上下文压缩 - 估算 token: {estimate_tokens(text)}/{token_budget}")
+    return text
+
+def split_context(data: Any, chunk_tokens: int) -> List[Dict[str, Any]]:
+    """
+    将上下文数据切分为若干分片（用于 map-reduce 摘要）
+
+    多个工具的数据按工具拆分；单个工具的长列表按行切分，每个分片保留标量字段，
+    使分片的紧凑编码不超过 chunk_tokens。
+
+    Args:
+        data: 上下文数据
+        chunk_tokens: 每个分片的 token 上限
+
+    Returns:
+        分片列表，每个分片的结构与原工具数据相同
+    """
+    if not isinstance(data, dict) or not data:
+        return [data] if data else []
+
+    if not detect_schema(data):
+        chunks = []
+        rest = {}
+        for key, value in data.items():
+            if detect_schema(value):
+                chunks.extend(split_context(value, chunk_tokens))
+            else:
+                rest[key] = value
+        if rest:
+            chunks.append(rest)
+        return chunks
+
+    schema = TOOL_CONTEXT_SCHEMAS[detect_schema(data)]
+    rows_key = schema["rows"]
+    rows = data.get(rows_key) if rows_key else None
+    if not isinstance(rows, list) or len(rows) <= 1:
+        return [data]
+
+    # 表头等固定部分的开销 + 每行的开销
+    base_tokens = estimate_tokens(_render({**data, rows_key: rows[:1]}, 1, 1.0))
+    columns = schema["columns"]
+    text_limits = schema["text_limits"]
+
+    chunks = []
+    current: List[Dict[str, Any]] = []
+    current_tokens = base_tokens
+    for row in rows:
+        row_tokens = estimate_tokens(_format_row(row, columns, text_limits)) + 1
+        if current and current_tokens + row_tokens > chunk_tokens:
+            chunks.append({**data, rows_key: current})
+            current = []
+            current_tokens = base_tokens
+        current.append(row)
+        current_tokens += row_tokens
+    if current:
+        chunks.append({**data, rows_key: current})
+    return chunks
@@ -0,0 +1,130 @@
+"""
+复合请求拆分
+
+"查北京天气，再看看 AI 新闻，然后算一下 3*7" 这样的复合输入，原来整段交给一次大模型调用，
+模型只返回一个工具时其余任务就丢失了。拆分器：
+- 按标点和连接词（然后、再、和、并且……）把输入切成子请求，不含任何工具关键词的片段并回相邻片段
+  （如 "北京和上海的天气" 不会被切开）
+- 每个子请求先用规则引擎识别，置信度不足的子请求交给调用方并发识别（较短的大模型调用）
+- 合并成一个执行计划：按出现顺序排列取数工具，去掉重复调用，文档工具统一放在最后
+"""
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+import asyncio
+import json
+import re
+from app.core.intent_rules import match_intent
+
+# 子请求之间的分隔：标点和连接词（捕获分组，合并片段时保留原文）
+_SPLIT_RE = re.compile(r'([，,。；;！!？?\n]+|然后|并且|而且|以及|同时|顺便|另外|还有|接着|再|并|和|及|与)')
+
+def split_request(user_input: str) -> List[str]:
+    """
+    按标点和连接词拆分复合请求
+
+    Returns:
+        子请求列表（不含工具关键词的片段已并回相邻片段）；无法拆分时只有一个元素
+    """
+    pieces = _SPLIT_RE.split(user_input)
+    parts: List[str] = []
+    prefix = ""  # 还没有归属的开头片段（并入下一个含工具的片段）
+    separator = ""
+    for index, piece in enumerate(pieces):
+        if index % 2 == 1:
+            separator = piece
+            continue
+        if not piece.strip():
+            continue
+        if match_intent(piece)["tools"]:
+            if prefix:
+                parts.append(f"{prefix}{separator}{piece}")
+                prefix = ""
+            else:
+                parts.append(piece)
+        elif parts:
+            # 不含工具的片段（如 "最近五天的"）补充说明前一个子请求
+            parts[-1] = f"{parts[-1]}{separator}{piece}"
+        else:
+            prefix = f"{prefix}{separator}{piece}" if prefix else piece
+    if prefix:
+        if parts:
+            parts[-1] = f"{parts[-1]}{separator}{prefix}"
+        else:
+            parts.append(prefix)
+    return [part.strip() for part in parts]
+
+def _call_key(tool_info: Dict[str, Any]) -> str:
+    return json.dumps([tool_info["tool"], tool_info.get("parameters") or {}], ensure_ascii=False, sort_keys=True, default=str)
+
+def merge_plans(plans: List[List[Dict[str, Any]]], document: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    合并多个子请求的工具列表
+
+    Args:
+        plans: 各子请求的工具列表（按子请求顺序）
+        document: 文档工具调用（放在最后）；为空时使用子请求中的第一个文档调用
+
+    Returns:
+        去重后的工具列表，文档工具在最后
+    """
+    merged = []
+    seen = set()
+    for plan in plans:
+        for tool_info in plan:
+            if tool_info["tool"] == "document":
+                if document is None:
+                    document = tool_info
+                continue
+            key = _call_key(tool_info)
+            if key not in seen:
+                seen.add(key)
+                merged.append(tool_info)
+    if document is not None:
+        merged.append(document)
+    return merged
+
+def fill_missing_tasks(tools: List[Dict[str, Any]], rule_tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """补上规则引擎检测到、但识别结果中缺少的工具（同名工具以识别结果为准）"""
+    present = {tool_info["tool"] for tool_info in tools}
+    missing = [tool_info for tool_info in rule_tools if tool_info["tool"] not in present]
+    if not missing:
+        return tools
+    return merge_plans([tools, missing])
+
+async def decompose(
+    user_input: str,
+    rule_match: Dict[str, Any],
+    recognize: Callable[[str], Awaitable[Optional[List[Dict[str, Any]]]]],
+    min_confidence: float
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    拆分复合请求并合并为一个执行计划
+
+    Args:
+        user_input: 用户输入
+        rule_match: 整段输入的规则识别结果（提供文档工具的参数）
+        recognize: 识别单个子请求的函数（通常是一次较短的大模型调用），返回工具列表，超时等失败时返回 None
+        min_confidence: 子请求规则识别置信度达到该值时不调用 recognize
+
+    Returns:
+        工具列表；拆分后取数子请求不足两个时返回 None（由调用方整段识别）
+    """
+    parts = split_request(user_input)
+    part_matches = [match_intent(part) for part in parts]
+    data_parts = [
+        index for index, part_match in enumerate(part_matches)
+        if any(tool_info["tool"] != "document" for tool_info in part_match["tools"])
+    ]
+    if len(data_parts) < 2:
+        return None
+
+    plans = [part_match["tools"] for part_match in part_matches]
+    uncertain = [index for index in data_parts if part_matches[index]["confidence"] < min_confidence]
+    print(f"[DEBUG] 复合请求拆分为 {len(parts)} 个子请求: {parts}，需要大模型识别: {[parts[index] for index in uncertain]}")
+    if uncertain:
+        results = await asyncio.gather(*(recognize(parts[index]) for index in uncertain))
+        for index, result in zip(uncertain, results):
+            if result:
+                plans[index] = result
+
+    document = next((tool_info for tool_info in rule_match["tools"] if tool_info["tool"] == "document"), None)
+    return merge_plans(plans, document)
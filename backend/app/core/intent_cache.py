@@ -0,0 +1,61 @@
+"""
+意图识别结果缓存
+
+按规范化后的用户输入精确匹配，缓存大模型返回的意图识别结果（JSON 文本或函数调用结果）。
+意图识别超出延迟预算时，请求先按规则识别结果继续执行，大模型请求在后台完成后写入本缓存，
+下次相同输入直接命中。
+"""
+from typing import Any, Optional, Set
+import asyncio
+import re
+from app.core.cache import ResultCache, fingerprint
+from app.core.intent_similarity import similar_intents
+from app.core.metrics import metrics
+from app.config import settings
+
+intent_cache = ResultCache(
+    "intent",
+    max_entries=settings.INTENT_CACHE_MAX_ENTRIES,
+    ttl=settings.INTENT_CACHE_TTL
+)
+
+# 后台任务的强引用（事件循环只保留弱引用，未被引用的任务可能在完成前被回收）
+_background_tasks: Set[asyncio.Task] = set()
+
+def intent_key(user_input: str) -> str:
+    """计算意图缓存键（忽略大小写、首尾及连续空白）"""
+    normalized = re.sub(r'\s+', ' ', user_input.strip().lower())
+    return fingerprint("intent", normalized)
+
+def track_background(task: asyncio.Task) -> None:
+    """持有后台任务的引用，直到任务结束"""
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+def pending_background_tasks() -> int:
+    """仍在后台运行的任务数"""
+    return len(_background_tasks)
+
+metrics.register_gauge("cache.intent", intent_cache.stats)
+metrics.register_gauge("intent_background_tasks", pending_background_tasks)
+
+def store_when_done(task: asyncio.Task, key: Any, user_input: Optional[str] = None) -> None:
+    """
+    任务成功结束后将结果写入意图缓存
+
+    Args:
+        task: 大模型请求任务，结果为 (意图识别结果, 是否使用了降级方案)，降级方案的结果不缓存
+        key: 缓存键
+        user_input: 用户输入（提供时同时加入近似意图索引）
+    """
+    def _on_done(done_task: asyncio.Task) -> None:
+        if done_task.cancelled() or done_task.exception() is not None:
+            return
+        result, used_fallback = done_task.result()
+        if result and not used_fallback:
+            intent_cache.set(key, result)
+            if user_input:
+                similar_intents.add(user_input, key)
+            print(f"[DEBUG] 意图识别结果已写入缓存 - {key[:12]}")
+
+    task.add_done_callback(_on_done)
@@ -0,0 +1,271 @@
+"""
+本地意图分类器
+
+基于字符 n-gram 的多项式朴素贝叶斯模型，根据用户输入预测要调用的工具组合及置信度，无需任何网络请求。
+- 训练数据来自 Agent 解析大模型意图结果时记录的日志（JSONL：用户输入、工具列表、大模型耗时）
+- 特征使用哈希后的字符 1~3 元组，模型只包含两个 numpy 数组，预测耗时在毫秒以下
+- 工具参数仍由规则引擎提取，分类器只负责决定调用哪些工具
+
+重新训练并与大模型基线对比：
+
+    python -m app.core.intent_classifier train
+    python -m app.core.intent_classifier predict "查一下上海明天的天气"
+"""
+from typing import Dict, Any, List, Optional, Tuple
+import json
+import os
+import threading
+import time
+import zlib
+import numpy as np
+from app.config import settings
+
+# 特征哈希空间大小
+N_FEATURES = 1 << 14
+
+# 字符 n-gram 的长度范围
+NGRAM_RANGE = (1, 3)
+
+# 拉普拉斯平滑系数
+ALPHA = 0.1
+
+_log_lock = threading.Lock()
+
+def _label(tools: List[str]) -> str:
+    """工具列表 -> 类别标签（如 "weather+document"）"""
+    return "+".join(tools)
+
+def extract_features(text: str, ngram_range: Tuple[int, int] = NGRAM_RANGE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    提取哈希字符 n-gram 特征
+
+    Args:
+        text: 输入文本
+        ngram_range: n-gram 的长度范围
+
+    Returns:
+        (特征下标数组, 计数数组)
+    """
+    text = f"^{text.lower().strip()}$"
+    counts: Dict[int, int] = {}
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        for i in range(len(text) - n + 1):
+            # crc32 在不同进程间稳定（内置 hash 会随机化）
+            index = zlib.crc32(text[i:i + n].encode("utf-8")) % N_FEATURES
+            counts[index] = counts.get(index, 0) + 1
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+    return indices, values
+
+class IntentClassifier:
+    """字符 n-gram 多项式朴素贝叶斯分类器"""
+
+    def __init__(
+        self,
+        labels: List[str],
+        class_log_prior: np.ndarray,
+        feature_log_prob: np.ndarray
+    ):
+        self.labels = labels
+        self.class_log_prior = class_log_prior
+        self.feature_log_prob = feature_log_prob
+
+    @classmethod
+    def train(cls, samples: List[Dict[str, Any]], alpha: float = ALPHA) -> "IntentClassifier":
+        """
+        训练分类器
+
+        Args:
+            samples: [{"input": "用户输入", "tools": ["weather", ...]}, ...]
+            alpha: 平滑系数
+        """
+        labels = sorted({_label(sample["tools"]) for sample in samples})
+        label_index = {label: i for i, label in enumerate(labels)}
+        feature_counts = np.zeros((len(labels), N_FEATURES))
+        class_counts = np.zeros(len(labels))
+        for sample in samples:
+            row = label_index[_label(sample["tools"])]
+            indices, values = extract_features(sample["input"])
+            np.add.at(feature_counts[row], indices, values)
+            class_counts[row] += 1
+
+        smoothed = feature_counts + alpha
+        feature_log_prob = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+        class_log_prior = np.log(class_counts) - np.log(class_counts.sum())
+        return cls(labels, class_log_prior, feature_log_prob)
+
+    def predict(self, text: str) -> Tuple[List[str], float]:
+        """
+        预测工具组合
+
+        Returns:
+            (工具列表, 置信度)；"none" 类别返回空列表
+        """
+        indices, values = extract_features(text)
+        scores = self.class_log_prior + self.feature_log_prob[:, indices] @ values
+        scores -= scores.max()
+        probs = np.exp(scores)
+        probs /= probs.sum()
+        best = int(probs.argmax())
+        label = self.labels[best]
+        tools = [] if label == "none" else label.split("+")
+        return tools, float(probs[best])
+
+    def save(self, path: str) -> None:
+        """保存模型（npz）"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            labels=np.array(self.labels),
+            class_log_prior=self.class_log_prior,
+            feature_log_prob=self.feature_log_prob.astype(np.float32)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        """加载模型"""
+        with np.load(path) as archive:
+            return cls(
+                [str(label) for label in archive["labels"]],
+                archive["class_log_prior"],
+                archive["feature_log_prob"].astype(np.float64)
+            )
+
+def log_intent(user_input: str, tools: List[str], latency: Optional[float]) -> None:
+    """
+    追加一条意图识别日志（训练数据）
+
+    Args:
+        user_input: 用户输入
+        tools: 大模型识别出的工具列表（空列表表示无法识别）
+        latency: 大模型意图识别耗时（秒）
+    """
+    if not settings.INTENT_LOG_PATH:
+        return
+    record = {
+        "input": user_input,
+        "tools": tools or ["none"],
+        "latency_ms": round(latency * 1000, 1) if latency is not None else None,
+        "ts": int(time.time())
+    }
+    try:
+        with _log_lock:
+            os.makedirs(os.path.dirname(settings.INTENT_LOG_PATH) or ".", exist_ok=True)
+            with open(settings.INTENT_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"[WARNING] 写入意图日志失败：{e}")
+
+def load_samples(path: str) -> List[Dict[str, Any]]:
+    """读取意图日志（同一输入以最后一次记录为准）"""
+    samples: Dict[str, Dict[str, Any]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("input") and record.get("tools"):
+                samples[record["input"]] = record
+    return list(samples.values())
+
+_classifier: Optional[IntentClassifier] = None
+_classifier_mtime: Optional[float] = None
+
+def get_classifier() -> Optional[IntentClassifier]:
+    """获取已训练的分类器（模型文件更新后自动重新加载），未训练时返回 None"""
+    global _classifier, _classifier_mtime
+    if not settings.INTENT_CLASSIFIER_ENABLED:
+        return None
+    try:
+        mtime = os.path.getmtime(settings.INTENT_MODEL_PATH)
+    except OSError:
+        return None
+    if _classifier is None or mtime != _classifier_mtime:
+        try:
+            _classifier = IntentClassifier.load(settings.INTENT_MODEL_PATH)
+            _classifier_mtime = mtime
+            print(f"[INFO] 已加载本地意图分类器 - 类别数: {len(_classifier.labels)}")
+        except Exception as e:
+            print(f"[WARNING] 加载本地意图分类器失败：{e}")
+            return None
+    return _classifier
+
+def _train_command(args) -> None:
+    """重新训练，并在留出集上报告准确率和延迟（与大模型基线对比）"""
+    samples = load_samples(args.log)
+    if len(samples) < settings.INTENT_CLASSIFIER_MIN_SAMPLES:
+        print(f"样本数不足：{len(samples)} < {settings.INTENT_CLASSIFIER_MIN_SAMPLES}，暂不训练")
+        return
+
+    rng = np.random.default_rng(args.seed)
+    order = rng.permutation(len(samples))
+    test_size = max(int(len(samples) * args.test_ratio), 1)
+    test = [samples[i] for i in order[:test_size]]
+    train = [samples[i] for i in order[test_size:]]
+
+    # 留出集评估
+    classifier = IntentClassifier.train(train)
+    correct = 0
+    confident = 0
+    confident_correct = 0
+    start = time.perf_counter()
+    for sample in test:
+        tools, confidence = classifier.predict(sample["input"])
+        hit = tools == [tool for tool in sample["tools"] if tool != "none"]
+        correct += hit
+        if confidence >= settings.INTENT_CLASSIFIER_THRESHOLD:
+            confident += 1
+            confident_correct += hit
+    classifier_ms = (time.perf_counter() - start) * 1000 / len(test)
+
+    llm_latencies = [sample["latency_ms"] for sample in samples if sample.get("latency_ms") is not None]
+    llm_ms = sum(llm_latencies) / len(llm_latencies) if llm_latencies else None
+
+    print(f"样本数: {len(samples)}（训练 {len(train)} / 测试 {len(test)}），类别数: {len(classifier.labels)}")
+    print(f"准确率: {correct / len(test):.2%}")
+    print(
+        f"置信度 >= {settings.INTENT_CLASSIFIER_THRESHOLD} 的覆盖率: {confident / len(test):.2%}，"
+        f"其中准确率: {(confident_correct / confident if confident else 0):.2%}"
+    )
+    print(f"分类器平均延迟: {classifier_ms:.3f} ms")
+    if llm_ms is not None:
+        print(f"大模型基线平均延迟: {llm_ms:.1f} ms（约 {llm_ms / max(classifier_ms, 1e-6):.0f} 倍）")
+
+    # 使用全部样本训练最终模型
+    IntentClassifier.train(samples).save(args.model)
+    print(f"模型已保存到 {args.model}")
+
+def _predict_command(args) -> None:
+    """用已保存的模型预测单条输入"""
+    classifier = IntentClassifier.load(args.model)
+    start = time.perf_counter()
+    tools, confidence = classifier.predict(args.text)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(json.dumps({"tools": tools, "confidence": round(confidence, 4), "latency_ms": round(elapsed, 3)}, ensure_ascii=False))
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地意图分类器")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="从意图日志重新训练")
+    train_parser.add_argument("--log", default=settings.INTENT_LOG_PATH, help="意图日志路径（JSONL）")
+    train_parser.add_argument("--model", default=settings.INTENT_MODEL_PATH, help="模型保存路径")
+    train_parser.add_argument("--test-ratio", type=float, default=0.2, help="留出测试集比例")
+    train_parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    train_parser.set_defaults(handler=_train_command)
+
+    predict_parser = subparsers.add_parser("predict", help="预测单条输入")
+    predict_parser.add_argument("text", help="用户输入")
+    predict_parser.add_argument("--model", default=settings.INTENT_MODEL_PATH, help="模型路径")
+    predict_parser.set_defaults(handler=_predict_command)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
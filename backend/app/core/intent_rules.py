@@ -0,0 +1,428 @@
+"""
+基于规则的意图识别引擎
+
+在模块导入时构建一次：
+- 多模式匹配自动机（Aho-Corasick），一次扫描即可找出工具关键词、城市名称和股票名称
+- 预编译的参数提取正则（条数、天数、股票代码、计算表达式等）
+
+识别结果附带置信度，高置信度的请求可以直接跳过大模型。
+大模型不可用时的降级识别也统一使用本引擎。
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from collections import deque
+import re
+from app.tools.weather import CITY_BASE_TEMP
+from app.tools.stock import STOCK_NAME_TO_CODE
+
+class KeywordAutomaton:
+    """Aho-Corasick 多模式匹配自动机"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, Any]]] = [[]]
+
+    def add(self, keyword: str, payload: Any) -> None:
+        """添加关键词（匹配时返回 payload）"""
+        state = 0
+        for char in keyword:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].append((keyword, payload))
+
+    def build(self) -> "KeywordAutomaton":
+        """构建失败指针（广度优先）"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        return self
+
+    def search(self, text: str) -> List[Tuple[int, str, Any]]:
+        """
+        扫描文本，返回所有匹配
+
+        Returns:
+            [(起始位置, 关键词, payload), ...]，按结束位置排序
+        """
+        matches = []
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for keyword, payload in self._output[state]:
+                matches.append((index - len(keyword) + 1, keyword, payload))
+        return matches
+
+# 工具关键词（小写）
+TOOL_KEYWORDS: Dict[str, List[str]] = {
+    "news": ["新闻", "资讯", "news"],
+    "weather": ["天气", "气温", "温度", "weather"],
+    "stock": ["股票", "股价", "行情", "stock"],
+    "calculate": ["计算", "等于", "是多少", "算算", "算一下", "算下"],
+    "document": ["总结", "摘要", "报告", "邮件", "email", "文档", "生成", "写"]
+}
+
+# 只查询当天天气的关键词
+TODAY_KEYWORDS = ["现在", "今天", "当前", "今日"]
+
+# 相对时间词（同义的归为一类，校验近似复用时时间范围不同的请求不能复用；具体天数由天数实体校验）
+RELATIVE_TIME_WORDS = {
+    "今天": "today", "今日": "today", "现在": "today", "当前": "today",
+    "明天": "tomorrow", "明日": "tomorrow", "后天": "day_after_tomorrow", "昨天": "yesterday",
+    "这周": "week", "本周": "week", "一周": "week", "这几天": "week", "未来几天": "week", "最近几天": "week",
+    "接下来几天": "week", "下周": "next_week", "周末": "weekend"
+}
+
+# 文档模板和导出格式关键词（校验近似复用时模板、格式不同的文档请求不能复用）
+DOCUMENT_KEYWORDS = {
+    "报告": "report", "周报": "report", "日报": "report", "邮件": "email", "email": "email",
+    "总结": "summary", "摘要": "summary", "word": "docx", "docx": "docx", "html": "html", "网页": "html"
+}
+
+# 新闻领域关键词（查询词为空时使用）
+NEWS_DOMAINS = {"ai": "AI", "人工智能": "AI", "科技": "科技", "国内": "国内", "财经": "财经"}
+
+# 单工具降级识别的优先级（与原有规则识别保持一致）
+TOOL_PRIORITY = ["news", "weather", "stock", "calculate", "document"]
+
+# 多任务检测只统计取数/计算类工具
+TASK_TOOLS = ["weather", "calculate", "news", "stock"]
+
+_CHINESE_DIGITS = {"一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+
+_LIMIT_RE = re.compile(r'([0-9]+|[一二两三四五六七八九十])\s*条')
+_DAYS_RE = re.compile(r'([0-9]+|[一二两三四五六七八九十])\s*[日天]')
+_SYMBOL_RE = re.compile(r'(?<![0-9])([0-9]{6})(?![0-9])')
+_NUMBER_RE = re.compile(r'[0-9]+(?:\.[0-9]+)?')
+_DATE_RE = re.compile(r'[0-9]{4}[-/.][0-9]{1,2}[-/.][0-9]{1,2}')
+_EXPRESSION_RE = re.compile(r'[0-9.(（\s]*[0-9][0-9.\s)）]*(?:(?:\*\*|[+\-*/×÷])[0-9.(（\s]*[0-9][0-9.\s)）]*)+')
+# 数字之间的中文运算词（替换为等长的运算符，保持字符位置不变）
+_POWER_WORDS = {"的平方": "**2", "的立方": "**3"}
+_OPERATOR_WORDS = {"加上": "+ ", "减去": "- ", "乘以": "* ", "除以": "/ ", "加": "+", "减": "-", "乘": "*", "除": "/"}
+_POWER_RE = re.compile(r'(?<=[0-9)）])(' + "|".join(_POWER_WORDS) + r')')
+_OPERATOR_RE = re.compile(r'(?<=[0-9)）])(\s*)(' + "|".join(_OPERATOR_WORDS) + r')(?=\s*[0-9(（])')
+# 运算词（校验近似复用时，运算不同的计算请求不能复用）
+_OPERATOR_WORD_RE = re.compile(r'加|减|乘|除|平方|立方|次方|开方|根号|倍|百分之|余数|[+\-*/×÷%^]')
+_NEWS_STRIP_RE = re.compile(
+    r'[0-9一二两三四五六七八九十]+\s*条|抓取|检索|搜索|找|看看|查询|查|列出|并?写?总结|最近的|最新的?|新闻|资讯|news|帮我|一下',
+    re.IGNORECASE
+)
+# 新闻查询词中不构成主题的词（疑问词、时间词、语气词）
+_NEWS_STOPWORD_RE = re.compile(r'有什么|有啥|有哪些|什么|哪些|最近|近期|昨天|本周|今年|给我|我想|想看|关于|方面|相关')
+# 追问的承接词
+_FOLLOW_UP_CUE_RE = re.compile(
+    r'再|那.*呢|换成|换为|改成|改为|(?:基于|根据)(?:上面|以上|刚才|这些|上述)|上面的|以上|刚才的|上述|据此|这些数据'
+)
+_DOCUMENT_STRIP_RE = re.compile(r'^(?:再|然后|顺便|接着|并且?)|(?:生成|写|创建|制作)(?:一?[份个篇封])?|帮我|一份|一个')
+_PUNCTUATION_RE = re.compile(r'[，,。.!！?？;；、\s]+')
+
+def _build_automaton() -> KeywordAutomaton:
+    """构建关键词自动机：工具关键词、城市名称、股票名称、时间词"""
+    automaton = KeywordAutomaton()
+    for tool_name, keywords in TOOL_KEYWORDS.items():
+        for keyword in keywords:
+            automaton.add(keyword, ("tool", tool_name))
+    for city in CITY_BASE_TEMP:
+        automaton.add(city, ("city", city))
+    for stock_name, code in STOCK_NAME_TO_CODE.items():
+        automaton.add(stock_name.lower(), ("stock_name", code))
+    for keyword in TODAY_KEYWORDS:
+        automaton.add(keyword, ("today", True))
+    for keyword, domain in NEWS_DOMAINS.items():
+        automaton.add(keyword, ("news_domain", domain))
+    for keyword, period in RELATIVE_TIME_WORDS.items():
+        automaton.add(keyword, ("period", period))
+    for keyword, document_type in DOCUMENT_KEYWORDS.items():
+        automaton.add(keyword, ("document_type", document_type))
+    return automaton.build()
+
+_AUTOMATON = _build_automaton()
+
+def _parse_count(text: str) -> int:
+    """解析阿拉伯数字或单个中文数字"""
+    return int(text) if text.isdigit() else _CHINESE_DIGITS.get(text, 0)
+
+def _first(matches: List[Tuple[int, str, Any]], kind: str) -> Optional[Any]:
+    """取某类实体中最靠前的匹配（同一位置取最长的关键词）"""
+    candidates = [(start, -len(keyword), payload[1]) for start, keyword, payload in matches if payload[0] == kind]
+    return min(candidates)[2] if candidates else None
+
+def _replace_operator_words(text: str) -> str:
+    """把数字之间的中文运算词（加、减、乘以、除以、的平方等）替换为运算符"""
+    text = _POWER_RE.sub(lambda match: _POWER_WORDS[match.group(1)], text)
+    return _OPERATOR_RE.sub(lambda match: match.group(1) + _OPERATOR_WORDS[match.group(2)], text)
+
+def _search_expression(user_input: str) -> Optional[re.Match]:
+    """查找算术表达式（日期不视为表达式，替换后的字符位置与原输入一致）"""
+    return _EXPRESSION_RE.search(_replace_operator_words(_DATE_RE.sub(" ", user_input)))
+
+def extract_expression(user_input: str) -> Optional[str]:
+    """提取算术表达式（去除空白，统一中文运算符和括号；日期不视为表达式）"""
+    match = _search_expression(user_input)
+    if not match:
+        return None
+    expression = match.group(0)
+    for source, target in (("×", "*"), ("÷", "/"), ("（", "("), ("）", ")")):
+        expression = expression.replace(source, target)
+    expression = re.sub(r'\s+', '', expression)
+    return expression or None
+
+def extract_entities(user_input: str) -> Dict[str, Any]:
+    """
+    提取实体（用于缓存复用时校验参数）：提到的工具、城市、股票代码、数字、算术表达式和运算词、天数/条数、
+    是否限定今天、相对时间、文档模板和导出格式、新闻查询词
+    """
+    matches = _AUTOMATON.search(user_input.lower())
+    symbol_match = _SYMBOL_RE.search(user_input)
+    tools = sorted({payload[1] for _, _, payload in matches if payload[0] == "tool"})
+    return {
+        "tools": tools,
+        "city": _first(matches, "city"),
+        "symbol": symbol_match.group(1) if symbol_match else _first(matches, "stock_name"),
+        "numbers": _NUMBER_RE.findall(user_input),
+        "expression": extract_expression(user_input),
+        "operators": _OPERATOR_WORD_RE.findall(_DATE_RE.sub(" ", user_input)),
+        "counts": [_parse_count(count) for count in _DAYS_RE.findall(user_input) + _LIMIT_RE.findall(user_input)],
+        "today": bool(_first(matches, "today")),
+        "periods": sorted({payload[1] for _, _, payload in matches if payload[0] == "period"}),
+        "document_types": sorted({payload[1] for _, _, payload in matches if payload[0] == "document_type"}),
+        "topic": _news_params(user_input, matches)[0]["query"] if "news" in tools else None
+    }
+
+def mask_entities(user_input: str) -> str:
+    """
+    把城市、股票名称、相对时间词和数字替换为占位符（比较句式相似度时不受具体实体影响，
+    "这周" 和 "未来几天" 替换后相同，时间范围是否一致由实体校验）
+    """
+    lowered = user_input.lower()
+    chars = list(lowered)
+    placeholders = {"city": "#", "stock_name": "#", "period": "@"}
+    end = 0
+    # 同一位置取最长的关键词，跳过与已替换片段重叠的匹配
+    for start, keyword, payload in sorted(_AUTOMATON.search(lowered), key=lambda match: (match[0], -len(match[1]))):
+        if payload[0] in placeholders and start >= end:
+            chars[start:start + len(keyword)] = [placeholders[payload[0]]] + [""] * (len(keyword) - 1)
+            end = start + len(keyword)
+    return _NUMBER_RE.sub("0", "".join(chars))
+
+def has_follow_up_cue(user_input: str) -> bool:
+    """输入是否明确承接上一轮（"再……"、"那……呢"、"换成……"、"基于上面……" 等）"""
+    return bool(_FOLLOW_UP_CUE_RE.search(user_input))
+
+def follow_up_overrides(user_input: str) -> Dict[str, Dict[str, Any]]:
+    """
+    追问中给出的参数修改（如 "换成上海"、"改成未来三天的"、"那腾讯呢"）
+
+    Returns:
+        {工具名: 要覆盖的参数}，只包含输入中明确给出的参数
+    """
+    matches = _AUTOMATON.search(user_input.lower())
+    days_match = _DAYS_RE.search(_DATE_RE.sub(" ", user_input))
+    days = _parse_count(days_match.group(1)) if days_match else None
+    symbol_match = _SYMBOL_RE.search(user_input)
+
+    weather: Dict[str, Any] = {}
+    city = _first(matches, "city")
+    if city:
+        weather["location"] = city
+    if _first(matches, "today"):
+        weather["days"] = 1
+    elif days:
+        weather["days"] = min(max(days, 1), 7)
+
+    stock: Dict[str, Any] = {}
+    symbol = symbol_match.group(1) if symbol_match else _first(matches, "stock_name")
+    if symbol:
+        stock["symbol"] = symbol
+    if days:
+        stock["days"] = min(max(days, 1), 30)
+
+    return {tool: params for tool, params in (("weather", weather), ("stock", stock)) if params}
+
+def _news_params(user_input: str, matches: List[Tuple[int, str, Any]]) -> Tuple[Dict[str, Any], bool]:
+    """新闻参数：查询词、条数；返回 (参数, 是否显式给出查询词)"""
+    # 去掉其他工具关键词、城市等已识别的片段，剩余部分作为查询词
+    chars = list(user_input)
+    for start, keyword, payload in matches:
+        if payload[0] in ("tool", "city", "today", "period", "stock_name"):
+            chars[start:start + len(keyword)] = [" "] * len(keyword)
+    query = _DATE_RE.sub(" ", "".join(chars))
+    query = _PUNCTUATION_RE.sub(" ", _NEWS_STOPWORD_RE.sub(" ", _NEWS_STRIP_RE.sub("", query)))
+    # 去掉首尾的连接词和语气词（"和"、"并"、"的"、"呀"等），纯数字不构成主题
+    tokens = [token.strip("和与并及再的了吗呢呀吧啊") for token in query.split()]
+    query = " ".join(token for token in tokens if token and not token.isdigit() and token not in ("然后", "以及"))
+    explicit = any(len(token) >= 2 for token in query.split())
+    if not explicit:
+        query = _first(matches, "news_domain") or "科技"
+
+    limit = 10
+    limit_match = _LIMIT_RE.search(user_input)
+    if limit_match:
+        limit = min(max(_parse_count(limit_match.group(1)), 1), 50)
+    return {"query": query, "limit": limit}, explicit or bool(_first(matches, "news_domain"))
+
+def _weather_params(user_input: str, matches: List[Tuple[int, str, Any]]) -> Tuple[Dict[str, Any], bool]:
+    """天气参数：城市、天数；返回 (参数, 是否显式给出城市)"""
+    city = _first(matches, "city")
+    period = _first(matches, "period")
+    if _first(matches, "today"):
+        days = 1
+    elif period in ("tomorrow", "day_after_tomorrow"):
+        # 预报从今天开始，查询到目标日期为止
+        days = 2 if period == "tomorrow" else 3
+    else:
+        days = 7
+        days_match = _DAYS_RE.search(_DATE_RE.sub(" ", user_input))
+        if days_match:
+            days = min(max(_parse_count(days_match.group(1)), 1), 7)
+    return {"location": city or "北京", "days": days}, bool(city)
+
+def _stock_params(user_input: str, matches: List[Tuple[int, str, Any]]) -> Tuple[Dict[str, Any], bool]:
+    """股票参数：代码、天数；返回 (参数, 是否显式给出股票)"""
+    symbol_match = _SYMBOL_RE.search(user_input)
+    symbol = symbol_match.group(1) if symbol_match else _first(matches, "stock_name")
+    days = 5
+    days_match = _DAYS_RE.search(_DATE_RE.sub(" ", user_input))
+    if days_match:
+        days = min(max(_parse_count(days_match.group(1)), 1), 30)
+    return {"symbol": symbol or "000001", "days": days}, bool(symbol)
+
+def _calculate_params(user_input: str) -> Tuple[Dict[str, Any], bool]:
+    """计算参数：表达式；返回 (参数, 是否提取到表达式)"""
+    expression = extract_expression(user_input)
+    if expression:
+        return {"expression": expression}, True
+    return {"expression": re.sub(r'计算|算|等于|是多少', '', user_input).strip()}, False
+
+def _document_params(user_input: str, data_tools: List[str]) -> Dict[str, Any]:
+    """文档参数：模板类型、内容提示"""
+    lowered = user_input.lower()
+    if "报告" in lowered:
+        template = "report"
+    elif "邮件" in lowered or "email" in lowered:
+        template = "email"
+    elif "总结" in lowered or "摘要" in lowered or data_tools:
+        template = "summary"
+    else:
+        template = "report"
+
+    if data_tools:
+        names = {"weather": "天气", "news": "新闻", "stock": "股票", "calculate": "计算"}
+        template_names = {"report": "报告", "email": "邮件", "summary": "总结"}
+        content = f"根据{'、'.join(names[tool] for tool in data_tools)}数据生成{template_names[template]}"
+    else:
+        content = _DOCUMENT_STRIP_RE.sub("", user_input).strip() or user_input
+    return {"template": template, "content": content}
+
+def _build_tools(
+    user_input: str,
+    matches: List[Tuple[int, str, Any]],
+    tool_names: List[str]
+) -> Tuple[List[Dict[str, Any]], List[bool]]:
+    """按工具顺序提取参数，返回 (工具列表, 各取数工具参数是否显式给出)"""
+    data_tools = [tool_name for tool_name in tool_names if tool_name != "document"]
+    tools = []
+    explicit = []
+    for tool_name in data_tools:
+        if tool_name == "news":
+            params, is_explicit = _news_params(user_input, matches)
+        elif tool_name == "weather":
+            params, is_explicit = _weather_params(user_input, matches)
+        elif tool_name == "stock":
+            params, is_explicit = _stock_params(user_input, matches)
+        elif tool_name == "calculate":
+            params, is_explicit = _calculate_params(user_input)
+        else:
+            continue
+        tools.append({"tool": tool_name, "parameters": params})
+        explicit.append(is_explicit)
+    if "document" in tool_names:
+        tools.append({"tool": "document", "parameters": _document_params(user_input, data_tools)})
+    return tools, explicit
+
+def build_tool_plan(user_input: str, tool_names: List[str]) -> List[Dict[str, Any]]:
+    """
+    为指定的工具集合提取参数（工具由其他方式预测，例如本地分类器）
+
+    Args:
+        user_input: 用户输入
+        tool_names: 工具名称列表（document 总是放在最后）
+
+    Returns:
+        [{"tool": "weather", "parameters": {...}}, ...]
+    """
+    matches = _AUTOMATON.search(user_input.lower())
+    return _build_tools(user_input, matches, tool_names)[0]
+
+def match_intent(user_input: str) -> Dict[str, Any]:
+    """
+    规则识别用户意图
+
+    Args:
+        user_input: 用户输入
+
+    Returns:
+        {
+            "tools": [{"tool": "weather", "parameters": {...}}, ...],  # 按出现顺序排列，document 在最后
+            "primary": {"tool": ..., "parameters": {...}} | None,  # 按优先级选出的单个工具
+            "tasks": ["weather", "news", ...],  # 检测到的取数/计算类任务
+            "confidence": 0.0 ~ 1.0,
+            "entities": {"tools": [...], "city": ..., "symbol": ..., "numbers": [...], "expression": ..., "operators": [...], "counts": [...], "today": False, "periods": [...], "document_types": [...], "topic": ...}
+        }
+    """
+    lowered = user_input.lower()
+    matches = _AUTOMATON.search(lowered)
+
+    # 各工具第一次出现的位置
+    positions: Dict[str, int] = {}
+    for start, _, payload in matches:
+        if payload[0] == "tool":
+            positions[payload[1]] = min(start, positions.get(payload[1], start))
+    expression = extract_expression(user_input)
+    if expression and "calculate" not in positions:
+        positions["calculate"] = _search_expression(user_input).start()
+
+    data_tools = sorted((tool for tool in positions if tool != "document"), key=positions.get)
+    has_document = "document" in positions
+
+    tools, explicit = _build_tools(user_input, matches, data_tools + (["document"] if has_document else []))
+
+    # 置信度：单个工具且参数明确时最高；参数使用默认值、多工具组合、只有文档时逐级降低
+    if not tools:
+        confidence = 0.0
+    elif not data_tools:
+        confidence = 0.6
+    else:
+        confidence = 0.95 if all(explicit) else 0.75
+        if len(data_tools) > 1:
+            confidence -= 0.2
+        if has_document:
+            confidence -= 0.1
+        if len(user_input) > 40:
+            confidence -= 0.1
+
+    primary = None
+    for tool_name in TOOL_PRIORITY:
+        primary = next((tool for tool in tools if tool["tool"] == tool_name), None)
+        if primary:
+            break
+
+    return {
+        "tools": tools,
+        "primary": primary,
+        "tasks": [tool for tool in TASK_TOOLS if tool in positions],
+        "confidence": round(max(confidence, 0.0), 2),
+        "entities": extract_entities(user_input)
+    }
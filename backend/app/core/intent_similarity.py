@@ -0,0 +1,194 @@
+"""
+近似意图复用
+
+意图缓存按规范化后的输入精确匹配，"北京这周天气如何" 和 "北京未来几天天气" 这样的改写无法命中。
+本模块为已识别过的输入建立相似度索引：
+- 向量：哈希字符 1~2 元组（与本地意图分类器相同的特征哈希）的 TF-IDF，词频取对数，全部在 numpy 中计算，不依赖外部向量服务；
+  城市、股票名称、相对时间词和数字先替换为占位符，相似度只反映句式
+- 复用条件：余弦相似度达到 INTENT_SIMILARITY_THRESHOLD，且两条输入提取出的实体
+  （提到的工具、城市、股票代码、数字和运算、天数/条数、相对时间、文档模板和格式、新闻查询词）完全一致，
+  保证复用的意图不会带错参数
+- 抽样校验：按 INTENT_SIMILARITY_VERIFY_RATE 抽样，在后台用大模型重新识别被复用的输入，统计误复用率
+
+命中率和误复用率通过 /api/metrics 的 intent_similarity 指标查看。
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+import json
+import threading
+import numpy as np
+from app.core.cache import ResultCache
+from app.core.intent_classifier import extract_features, N_FEATURES
+from app.core.intent_rules import extract_entities, mask_entities
+from app.core.json_extractor import extract_intent_json
+from app.core.metrics import metrics
+from app.config import settings
+
+# 相似度使用的 n-gram 长度范围（改写后的句子很少共享三元组）
+NGRAM_RANGE = (1, 2)
+
+def _features(user_input: str) -> Tuple[np.ndarray, np.ndarray]:
+    """屏蔽实体后的哈希 n-gram 特征（对数词频）"""
+    indices, counts = extract_features(mask_entities(user_input), NGRAM_RANGE)
+    return indices, 1 + np.log(counts)
+
+def intent_signature(result: Any) -> Optional[List[Tuple[str, str]]]:
+    """
+    意图识别结果的比较签名：工具序列 + 参数（文档工具只比较模板和格式，自由文本参数不参与比较）
+
+    Args:
+        result: 函数调用结果（{"tools": [...]}）或 JSON 文本
+
+    Returns:
+        [(工具名, 参数 JSON), ...]；无法解析时返回 None
+    """
+    if isinstance(result, str):
+        result = extract_intent_json(result)
+    if not isinstance(result, dict):
+        return None
+    if "tools" in result:
+        calls = result["tools"] or []
+    elif result.get("tool"):
+        calls = [result]
+    else:
+        calls = []
+    signature = []
+    for call in calls:
+        if not isinstance(call, dict):
+            continue
+        tool = call.get("tool")
+        parameters = call.get("parameters") or {}
+        if tool == "document":
+            parameters = {name: parameters[name] for name in ("template", "format") if parameters.get(name)}
+        signature.append((tool, json.dumps(parameters, ensure_ascii=False, sort_keys=True, default=str)))
+    return signature
+
+class SimilarIntentIndex:
+    """已识别输入的 TF-IDF 相似度索引（LRU 淘汰，线程安全）"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._document_freq = np.zeros(N_FEATURES)
+        self._lock = threading.Lock()
+        # 所有条目的稀疏特征拼接成的数组（条目变化后按需重建）
+        self._keys: List[str] = []
+        self._flat: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+        self.lookups = 0
+        self.hits = 0
+        self.verified = 0
+        self.false_reuse = 0
+
+    def add(self, user_input: str, key: str) -> None:
+        """
+        加入一条已识别的输入
+
+        Args:
+            user_input: 用户输入
+            key: 该输入在意图缓存中的键
+        """
+        indices, values = _features(user_input)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = {
+                "input": user_input,
+                "entities": extract_entities(user_input),
+                "indices": indices,
+                "values": values
+            }
+            self._document_freq[indices] += 1
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._document_freq[evicted["indices"]] -= 1
+            self._flat = None
+
+    def _flatten(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """拼接所有条目的稀疏特征：(条目序号, 特征下标, 词频)"""
+        if self._flat is None:
+            self._keys = list(self._entries.keys())
+            entries = list(self._entries.values())
+            rows = np.concatenate([np.full(len(entry["indices"]), i) for i, entry in enumerate(entries)])
+            indices = np.concatenate([entry["indices"] for entry in entries])
+            values = np.concatenate([entry["values"] for entry in entries])
+            self._flat = (rows, indices, values)
+        return self._flat
+
+    def lookup(self, user_input: str, cache: ResultCache) -> Optional[Dict[str, Any]]:
+        """
+        查找可以复用意图的近似输入
+
+        Args:
+            user_input: 用户输入
+            cache: 意图缓存（索引只保存输入，识别结果从缓存读取，已过期的条目不复用）
+
+        Returns:
+            {"key": 缓存键, "input": 匹配到的输入, "similarity": 相似度, "result": 意图识别结果}；
+            没有满足条件的输入时返回 None
+        """
+        entities = extract_entities(user_input)
+        query_indices, query_values = _features(user_input)
+        with self._lock:
+            self.lookups += 1
+            if not self._entries:
+                return None
+            rows, indices, values = self._flatten()
+            count = len(self._keys)
+            idf = np.log((1 + count) / (1 + self._document_freq)) + 1
+
+            query = np.zeros(N_FEATURES)
+            np.add.at(query, query_indices, query_values * idf[query_indices])
+            weights = values * idf[indices]
+            dots = np.bincount(rows, weights=weights * query[indices], minlength=count)
+            norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=count))
+            similarities = dots / (norms * np.linalg.norm(query) + 1e-12)
+
+            # 从最相似的开始找实体一致的条目（实体被屏蔽，句式相同但实体不同的条目可能排在前面）
+            for row in np.argsort(-similarities):
+                similarity = float(similarities[row])
+                if similarity < settings.INTENT_SIMILARITY_THRESHOLD:
+                    break
+                key = self._keys[row]
+                entry = self._entries[key]
+                if entry["entities"] != entities:
+                    continue
+                result = cache.get(key)
+                if result is not None:
+                    self.hits += 1
+                    return {"key": key, "input": entry["input"], "similarity": similarity, "result": result}
+        return None
+
+    def record_verification(self, reused: Any, verified: Any) -> bool:
+        """
+        记录一次抽样校验结果
+
+        Args:
+            reused: 复用的意图识别结果
+            verified: 大模型对新输入重新识别的结果
+
+        Returns:
+            是否为误复用
+        """
+        wrong = intent_signature(reused) != intent_signature(verified)
+        with self._lock:
+            self.verified += 1
+            self.false_reuse += wrong
+        return wrong
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_ratio": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "verified": self.verified,
+                "false_reuse": self.false_reuse,
+                "false_reuse_rate": round(self.false_reuse / self.verified, 4) if self.verified else 0.0
+            }
+
+similar_intents = SimilarIntentIndex(settings.INTENT_CACHE_MAX_ENTRIES)
+
+metrics.register_gauge("intent_similarity", similar_intents.stats)
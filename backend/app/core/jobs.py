@@ -0,0 +1,226 @@
+"""
+异步任务队列
+
+同步的 /workflow/execute 在整个工作流（含文档生成，可能长达数十秒）期间占用 HTTP 连接。任务模式下：
+- 提交时写入有界的进程内队列，立即返回任务 ID（uuid4，不会冲突）；队列已满时直接拒绝（接口返回 429）
+- 固定数量的工作协程（JOB_WORKERS）从队列取任务执行，控制同时执行的工作流数量
+- 执行过程中按工具进度事件逐步更新任务状态（步骤、日志、文档增量文本），可随时轮询
+
+任务状态与前端 MockWorkflowState 结构一致（taskId/status/steps/logs/result），status 额外有 queued（排队中）。
+已结束的任务保留 JOB_RESULT_TTL 秒。
+"""
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+from collections import OrderedDict
+import asyncio
+import copy
+import json
+import time
+import uuid
+from app.core.metrics import metrics
+from app.config import settings
+
+# 执行工作流的函数：(任务 ID, 事件回调) -> /workflow/execute 格式的响应
+WorkflowRunner = Callable[[str, Callable[[Dict[str, Any]], Awaitable[None]]], Awaitable[Dict[str, Any]]]
+
+class JobQueueFull(Exception):
+    """任务队列已满"""
+
+class WorkflowProgress:
+    """根据 Agent 事件逐步构建工作流状态（MockWorkflowState 结构）"""
+
+    def __init__(self, task_id: str):
+        self.state: Dict[str, Any] = {
+            "taskId": task_id,
+            "status": "queued",
+            "steps": [],
+            "logs": [],
+            "result": None
+        }
+        self._steps: Dict[Any, Dict[str, Any]] = {}  # 调用序号 -> 步骤
+        self._streamed_text = ""
+
+    def apply(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        应用一个事件
+
+        Returns:
+            状态中发生变化的字段（用于增量推送）
+        """
+        now = time.strftime("%H:%M:%S")
+        if event["type"] == "tool":
+            step = self._steps.get(event["id"])
+            if step is None:
+                step = {
+                    "id": str(len(self.state["steps"]) + 1),
+                    "name": f"执行工具 {len(self.state['steps']) + 1}",
+                    "description": f"调用 {event['tool']} 工具",
+                    "status": event["status"],
+                    "timestamp": now
+                }
+                self._steps[event["id"]] = step
+                self.state["steps"].append(step)
+            else:
+                step["status"] = event["status"]
+            if event["status"] == "running":
+                return {"steps": self.state["steps"]}
+            log = {
+                "id": f"log-{len(self.state['logs']) + 1}",
+                "toolName": event["tool"].upper(),
+                "inputParams": json.dumps(event.get("params", {}), ensure_ascii=False, default=str),
+                "status": event["status"],
+                "duration": event.get("duration", "0ms"),
+                "timestamp": now
+            }
+            self.state["logs"].append(log)
+            return {"steps": self.state["steps"], "logs": self.state["logs"]}
+        if event["type"] == "delta":
+            self._streamed_text += event["content"]
+            self.state["result"] = {"summary": self._streamed_text, "chartType": "none", "chartData": [], "rawData": []}
+            return {"result": self.state["result"]}
+        return {}
+
+    def start(self) -> Dict[str, Any]:
+        self.state["status"] = "running"
+        return {"status": "running"}
+
+    def finish(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """用最终响应替换逐步构建的状态（保留任务 ID）"""
+        data = response.get("data") or {}
+        self.state = {**self.state, **data, "taskId": self.state["taskId"]}
+        return dict(self.state)
+
+    def fail(self, error: str) -> Dict[str, Any]:
+        self.state["status"] = "failed"
+        self.state["error"] = error
+        return {"status": "failed", "error": error}
+
+class JobQueue:
+    """有界任务队列 + 固定数量的工作协程"""
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        """启动工作协程（应用启动时调用；提交任务时也会按需启动）"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=max(settings.JOB_QUEUE_SIZE, 1))
+        self._workers = [
+            asyncio.create_task(self._worker(index))
+            for index in range(max(settings.JOB_WORKERS, 1))
+        ]
+        print(f"[INFO] 任务队列已启动 - 工作协程: {len(self._workers)}, 队列长度: {self._queue.maxsize}")
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def submit(self, runner: WorkflowRunner) -> Dict[str, Any]:
+        """
+        提交任务
+
+        Returns:
+            任务的初始状态
+
+        Raises:
+            JobQueueFull: 队列已满
+        """
+        self.start()
+        self._prune()
+        task_id = uuid.uuid4().hex
+        job = {
+            "progress": WorkflowProgress(task_id),
+            "runner": runner,
+            "queued_at": time.time(),
+            "started_at": None,
+            "finished_at": None
+        }
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            metrics.increment("jobs.rejected")
+            raise JobQueueFull()
+        self._jobs[task_id] = job
+        metrics.increment("jobs.submitted")
+        return self._snapshot(job)
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """任务当前状态，不存在或已清理时返回 None"""
+        job = self._jobs.get(task_id)
+        return self._snapshot(job) if job else None
+
+    def _snapshot(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        def format_time(timestamp: Optional[float]) -> Optional[str]:
+            return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) if timestamp else None
+
+        return {
+            **copy.deepcopy(job["progress"].state),
+            "queuedAt": format_time(job["queued_at"]),
+            "startedAt": format_time(job["started_at"]),
+            "finishedAt": format_time(job["finished_at"])
+        }
+
+    def _prune(self) -> None:
+        """清理超过保留时间的已结束任务"""
+        now = time.time()
+        expired = [
+            task_id for task_id, job in self._jobs.items()
+            if job["finished_at"] and now - job["finished_at"] > settings.JOB_RESULT_TTL
+        ]
+        for task_id in expired:
+            del self._jobs[task_id]
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            progress: WorkflowProgress = job["progress"]
+            job["started_at"] = time.time()
+            metrics.observe("job_queue_wait_ms", (job["started_at"] - job["queued_at"]) * 1000)
+            progress.start()
+            self.running += 1
+
+            async def on_event(event: Dict[str, Any]) -> None:
+                progress.apply(event)
+
+            try:
+                response = await job["runner"](progress.state["taskId"], on_event)
+                progress.finish(response)
+                self.completed += 1
+            except asyncio.CancelledError:
+                progress.fail("任务被取消")
+                raise
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                progress.fail(f"工作流执行失败：{str(e)}")
+                self.failed += 1
+            finally:
+                self.running -= 1
+                job["finished_at"] = time.time()
+                job["runner"] = None
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "retained": len(self._jobs)
+        }
+
+job_queue = JobQueue()
+
+metrics.register_gauge("jobs", job_queue.stats)
@@ -0,0 +1,175 @@
+"""
+增量 JSON 提取器
+
+从大模型输出中提取 JSON 对象，替代基于正则的提取：
+- 单次线性扫描，按括号配对找出完整的 JSON 对象（支持任意嵌套，忽略字符串内的括号和对象外的说明文字、代码块标记）
+- 解析失败时做少量局部修复：尾随逗号、单引号字符串、未加引号的键、Python 风格的 True/False/None
+- 支持流式输入：每收到一段文本就继续扫描，工具调用对象（含 "tool" 字段）一旦闭合立即返回，
+  不必等待完整响应，工具可以提前开始执行
+"""
+from typing import Dict, Any, List, Optional
+import json
+
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char in "_$" or ord(char) > 127
+
+def repair_json(text: str) -> str:
+    """
+    对近似 JSON 的文本做局部修复
+
+    - 删除 } 或 ] 之前的尾随逗号
+    - 单引号字符串改为双引号
+    - 未加引号的键加上双引号
+    - True/False/None 改为 true/false/null
+    """
+    out = []
+    i = 0
+    n = len(text)
+    while i < n:
+        char = text[i]
+        if char in "\"'":
+            # 读取完整字符串（保留转义）
+            j = i + 1
+            parts = []
+            while j < n and text[j] != char:
+                if text[j] == "\\" and j + 1 < n:
+                    parts.append(text[j:j + 2])
+                    j += 2
+                    continue
+                parts.append(text[j])
+                j += 1
+            content = "".join(parts)
+            if char == "'":
+                content = content.replace("\\'", "'").replace('"', '\\"')
+            out.append(f'"{content}"')
+            i = j + 1
+        elif char == ",":
+            k = i + 1
+            while k < n and text[k].isspace():
+                k += 1
+            if k < n and text[k] in "}]":
+                # 尾随逗号
+                i += 1
+                continue
+            out.append(char)
+            i += 1
+        elif char.isdigit() or char == "-":
+            # 数字（含小数和科学计数法）原样保留
+            j = i + 1
+            while j < n and (text[j].isdigit() or text[j] in ".eE+-"):
+                j += 1
+            out.append(text[i:j])
+            i = j
+        elif _is_word_char(char):
+            j = i
+            while j < n and _is_word_char(text[j]):
+                j += 1
+            word = text[i:j]
+            k = j
+            while k < n and text[k].isspace():
+                k += 1
+            if k < n and text[k] == ":":
+                out.append(f'"{word}"')
+            else:
+                out.append(_LITERALS.get(word, word))
+            i = j
+        else:
+            out.append(char)
+            i += 1
+    return "".join(out)
+
+def parse_json(text: str) -> Optional[Any]:
+    """解析 JSON，失败时修复后重试，仍失败返回 None"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return json.loads(repair_json(text))
+    except ValueError:
+        return None
+
+def _is_tool_call(value: Any) -> bool:
+    return isinstance(value, dict) and isinstance(value.get("tool"), str) and bool(value["tool"])
+
+class JsonExtractor:
+    """增量 JSON 对象提取器（流式输入，单次线性扫描）"""
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._stack: List[int] = []  # 未闭合的 { / [ 的位置
+        self._quote: Optional[str] = None  # 当前所在字符串的引号
+        self._escape = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        输入一段文本，返回本段文本中新完成的结果
+
+        Returns:
+            事件列表：
+            {"type": "tool_call", "tool_call": {"tool": ..., "parameters": {...}}}  # 任意层级的工具调用对象闭合
+            {"type": "object", "value": {...}}  # 顶层 JSON 对象闭合
+        """
+        self._text += chunk
+        events = []
+        text = self._text
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+            if self._quote:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == self._quote:
+                    self._quote = None
+            elif not self._stack:
+                # 对象外的说明文字、代码块标记直接跳过
+                if char == "{":
+                    self._stack.append(pos)
+            elif char in "\"'":
+                self._quote = char
+            elif char in "{[":
+                self._stack.append(pos)
+            elif char in "}]":
+                start = self._stack.pop()
+                if char == "}" and text[start] == "{":
+                    events.extend(self._complete(text[start:pos + 1], top_level=not self._stack))
+        self._pos = len(text)
+        if not self._stack:
+            # 没有未闭合的对象时丢弃已扫描的文本，避免缓冲区无限增长
+            self._text = ""
+            self._pos = 0
+        return events
+
+    def _complete(self, fragment: str, top_level: bool) -> List[Dict[str, Any]]:
+        """处理一个闭合的对象片段"""
+        if not top_level and "tool" not in fragment:
+            # 嵌套对象只关心工具调用，跳过解析
+            return []
+        value = parse_json(fragment)
+        events = []
+        if _is_tool_call(value):
+            events.append({"type": "tool_call", "tool_call": value})
+        if top_level and value is not None:
+            events.append({"type": "object", "value": value})
+        return events
+
+def extract_json_objects(text: str) -> List[Any]:
+    """提取文本中所有顶层 JSON 对象"""
+    return [event["value"] for event in JsonExtractor().feed(text) if event["type"] == "object"]
+
+def extract_intent_json(text: str) -> Optional[Dict[str, Any]]:
+    """
+    提取意图识别结果：优先返回包含 "tools" 或 "tool" 字段的对象，其次返回第一个对象
+
+    Returns:
+        解析后的字典，没有可解析的对象时返回 None
+    """
+    objects = [value for value in extract_json_objects(text) if isinstance(value, dict)]
+    for value in objects:
+        if "tools" in value or "tool" in value:
+            return value
+    return objects[0] if objects else None
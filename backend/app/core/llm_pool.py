@@ -0,0 +1,287 @@
+"""
+大模型端点池
+
+在多个 OpenAI 兼容后端（多个本地推理服务 + 云端兜底）之间分配请求，无需外部代理：
+- 路由：加权最少在途请求（在途请求数 / 权重），并按 EWMA 延迟相对最快端点的倍数加权
+- 被动健康检查：连续失败达到阈值、或 EWMA 延迟超过上限时摘除端点
+- 冷却后自动恢复：冷却时间按连续摘除次数指数增长；恢复后的第一次调用即为探测，失败立即再次摘除
+
+端点通过 LLM_ENDPOINTS（JSON 数组）配置，例如：
+    [{"name": "local-1", "base_url": "http://10.0.0.2:8000", "kind": "local", "weight": 2, "stages": ["intent"]},
+     {"name": "cloud", "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1", "api_key": "sk-...",
+      "model": "qwen-plus", "kind": "openai"}]
+未配置时，每个阶段使用由 LLM_* / LLM_{STAGE}_* 配置组成的单端点池。
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import time
+from app.core.metrics import metrics
+from app.config import settings
+
+# 未配置 base_url 时 OpenAI 兼容端点的默认地址（阿里云 DashScope 兼容模式）
+DEFAULT_OPENAI_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+# 参与路由计算的最小延迟（秒），避免极小的 EWMA 放大差异
+_LATENCY_FLOOR = 0.05
+
+def infer_kind(base_url: Optional[str]) -> str:
+    """未显式配置类型时，按地址推断端点类型（兼容旧配置）"""
+    if base_url and ("localhost" in base_url or "127.0.0.1" in base_url):
+        return "local"
+    return "openai"
+
+class Endpoint:
+    """单个大模型端点及其健康状态"""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: Optional[str],
+        api_key: Optional[str],
+        model: str,
+        kind: str = "openai",
+        weight: float = 1.0
+    ):
+        if kind not in ("openai", "local"):
+            raise ValueError(f"不支持的端点类型：{kind}（可选 openai/local）")
+        self.name = name
+        self.base_url = base_url or (DEFAULT_OPENAI_BASE_URL if kind == "openai" else None)
+        self.api_key = api_key
+        self.model = model
+        self.kind = kind
+        self.weight = max(float(weight), 0.01)
+        self.client = None  # 按端点复用的客户端：OpenAI 兼容客户端 / 本地模型的 httpx 长连接客户端
+
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    def is_available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "model": self.model,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejected": not self.is_available(time.time())
+        }
+
+class EndpointPool:
+    """端点池：加权最少在途请求路由 + 被动健康检查"""
+
+    def __init__(self, name: str, endpoints: List[Endpoint]):
+        self.name = name
+        self.endpoints = endpoints
+
+    def acquire(self, exclude: Tuple[Endpoint, ...] = ()) -> Optional[Endpoint]:
+        """
+        选择一个端点（调用方必须在请求结束后调用 release）
+
+        Args:
+            exclude: 本次请求已经失败过的端点（重试时跳过）
+
+        Returns:
+            选中的端点；没有可选端点时返回 None
+        """
+        now = time.time()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        if not candidates:
+            return None
+        healthy = [endpoint for endpoint in candidates if endpoint.is_available(now)]
+        if not healthy:
+            # 全部被摘除时放行最早恢复的端点，避免完全不可用
+            endpoint = min(candidates, key=lambda item: item.ejected_until)
+            print(f"[WARNING] 端点池 {self.name} 没有健康端点，临时使用 {endpoint.name}")
+        else:
+            latencies = [endpoint.ewma_latency for endpoint in healthy if endpoint.ewma_latency is not None]
+            best_latency = max(min(latencies), _LATENCY_FLOOR) if latencies else _LATENCY_FLOOR
+
+            def score(item: Endpoint) -> float:
+                latency_factor = max(item.ewma_latency or 0.0, _LATENCY_FLOOR) / best_latency
+                return (item.outstanding + 1) / item.weight * latency_factor
+
+            endpoint = min(healthy, key=score)
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+        return endpoint
+
+    def release(self, endpoint: Endpoint, latency: Optional[float], success: Optional[bool]) -> None:
+        """
+        归还端点并更新健康状态
+
+        Args:
+            endpoint: acquire 返回的端点
+            latency: 本次请求耗时（秒），失败或取消时可为 None
+            success: True 成功 / False 失败 / None 取消（不计入健康状态）
+        """
+        endpoint.outstanding = max(endpoint.outstanding - 1, 0)
+        if success is None:
+            return
+        now = time.time()
+        if success:
+            if latency is not None:
+                alpha = settings.LLM_POOL_EWMA_ALPHA
+                if endpoint.ewma_latency is None:
+                    endpoint.ewma_latency = latency
+                else:
+                    endpoint.ewma_latency = alpha * latency + (1 - alpha) * endpoint.ewma_latency
+            endpoint.consecutive_failures = 0
+            slow = settings.LLM_POOL_SLOW_LATENCY and endpoint.ewma_latency is not None \
+                and endpoint.ewma_latency > settings.LLM_POOL_SLOW_LATENCY
+            if slow:
+                self._eject(endpoint, now, f"EWMA 延迟 {endpoint.ewma_latency:.2f}s 超过上限")
+            else:
+                endpoint.ejections = 0
+            return
+
+        endpoint.errors += 1
+        endpoint.consecutive_failures += 1
+        metrics.increment(f"llm_pool.{self.name}.errors")
+        if not endpoint.is_available(now):
+            # 摘除前已发出的请求陆续失败，不重复摘除
+            return
+        if endpoint.consecutive_failures >= settings.LLM_POOL_EJECT_FAILURES:
+            self._eject(endpoint, now, f"连续失败 {endpoint.consecutive_failures} 次")
+
+    def _eject(self, endpoint: Endpoint, now: float, reason: str) -> None:
+        """摘除端点，冷却时间按连续摘除次数指数增长"""
+        endpoint.ejections += 1
+        cooldown = min(
+            settings.LLM_POOL_EJECT_COOLDOWN * (2 ** (endpoint.ejections - 1)),
+            settings.LLM_POOL_MAX_COOLDOWN
+        )
+        endpoint.ejected_until = now + cooldown
+        # 恢复后处于探测状态：再失败一次即重新摘除；慢端点恢复后重新统计延迟
+        endpoint.consecutive_failures = max(settings.LLM_POOL_EJECT_FAILURES - 1, 0)
+        endpoint.ewma_latency = None
+        metrics.increment(f"llm_pool.{self.name}.ejections")
+        print(f"[WARNING] 端点池 {self.name} 摘除端点 {endpoint.name}（{reason}），{cooldown:.0f}s 后恢复")
+
+    @asynccontextmanager
+    async def lease(self, exclude: Tuple[Endpoint, ...] = ()):
+        """
+        租用一个端点：正常结束记为成功，抛出异常记为失败，被取消不计入健康状态
+
+        用法：
+            async with pool.lease() as endpoint:
+                ...
+        """
+        endpoint = self.acquire(exclude)
+        if endpoint is None:
+            raise RuntimeError(f"端点池 {self.name} 没有可用端点")
+        start_time = time.time()
+        try:
+            yield endpoint
+        except asyncio.CancelledError:
+            self.release(endpoint, None, None)
+            raise
+        except Exception:
+            self.release(endpoint, None, False)
+            raise
+        else:
+            self.release(endpoint, time.time() - start_time, True)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+# 端点池按（阶段 + 端点配置）共享，使健康状态在请求之间保留
+_pools: Dict[Tuple, EndpointPool] = {}
+
+def _configured_endpoints(stage: Optional[str]) -> List[Dict[str, Any]]:
+    """解析 LLM_ENDPOINTS，返回服务于该阶段的端点配置"""
+    if not settings.LLM_ENDPOINTS:
+        return []
+    try:
+        configs = json.loads(settings.LLM_ENDPOINTS)
+    except ValueError as e:
+        print(f"[ERROR] LLM_ENDPOINTS 不是合法的 JSON：{e}")
+        return []
+    return [
+        config for config in configs
+        if not config.get("stages") or stage in config["stages"]
+    ]
+
+def get_pool(
+    stage: Optional[str],
+    base_url: Optional[str],
+    api_key: Optional[str],
+    model: str,
+    kind: Optional[str] = None,
+    use_configured: bool = True
+) -> EndpointPool:
+    """
+    获取阶段对应的端点池
+
+    Args:
+        stage: 调用阶段（intent/document），为空表示通用
+        base_url / api_key / model / kind: 单端点池的配置（未配置 LLM_ENDPOINTS 或显式覆盖端点时使用）
+        use_configured: 是否使用 LLM_ENDPOINTS 中的端点（显式覆盖端点时为 False）
+    """
+    configs = _configured_endpoints(stage) if use_configured else []
+    if configs:
+        key = ("configured", stage, settings.LLM_ENDPOINTS)
+    else:
+        key = ("single", stage, base_url, api_key, model, kind)
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+
+    name = stage or "default"
+    if configs:
+        endpoints = [
+            Endpoint(
+                name=config.get("name") or config.get("base_url") or f"endpoint-{index}",
+                base_url=config.get("base_url"),
+                api_key=config.get("api_key", api_key),
+                model=config.get("model") or model,
+                kind=config.get("kind") or infer_kind(config.get("base_url")),
+                weight=config.get("weight", 1.0)
+            )
+            for index, config in enumerate(configs)
+        ]
+    elif api_key:
+        endpoints = [Endpoint(name, base_url, api_key, model, kind or infer_kind(base_url))]
+    else:
+        # 没有 API Key：不创建端点，调用方使用降级方案
+        endpoints = []
+    pool = EndpointPool(name, endpoints)
+    _pools[key] = pool
+    if endpoints:
+        print(f"[INFO] 端点池 {name} 已创建 - 端点: {[endpoint.name for endpoint in endpoints]}")
+    return pool
+
+def pool_stats() -> Dict[str, List[Dict[str, Any]]]:
+    """所有端点池的状态（用于指标）"""
+    stats: Dict[str, List[Dict[str, Any]]] = {}
+    for pool in _pools.values():
+        if pool.endpoints:
+            stats.setdefault(pool.name, []).extend(pool.stats())
+    return stats
+
+async def close_pools() -> None:
+    """关闭所有端点的客户端（应用关闭时调用）"""
+    for pool in _pools.values():
+        for endpoint in pool.endpoints:
+            if endpoint.client is None:
+                continue
+            try:
+                # httpx.AsyncClient 使用 aclose，AsyncOpenAI 使用 close
+                close = getattr(endpoint.client, "aclose", None) or endpoint.client.close
+                await close()
+            except Exception as e:
+                print(f"[WARNING] 关闭端点 {endpoint.name} 的客户端失败：{e}")
+            endpoint.client = None
+
+metrics.register_gauge("llm_pool", pool_stats)
@@ -2,20 +2,138 @@
 大模型服务抽象层
 支持多种大模型接入方式：OpenAI API、本地模型等
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator, Awaitable, Callable
 import json
 import re
+import time
 import asyncio
+from app.core.admission import admission, AdmissionRejected
+from app.core.llm_pool import Endpoint, get_pool
 from app.config import settings
 
+def _h2_available() -> bool:
+    """是否安装了 HTTP/2 支持（h2 库）"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
 class LLMService:
     """大模型服务抽象类"""
     
-    def __init__(self):
-        self.api_key = settings.LLM_API_KEY
-        self.base_url = settings.LLM_BASE_URL
-        self.model = settings.LLM_MODEL
-        self._client = None
+    # 支持按阶段路由的配置项（LLM_{STAGE}_{NAME}，为空时使用全局配置）
+    STAGES = ("intent", "document")
+    
+    def __init__(
+        self,
+        stage: Optional[str] = None,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        model: Optional[str] = None
+    ):
+        """
+        Args:
+            stage: 调用阶段（intent: 意图识别，小模型、短输出；document: 文档生成，大模型、长输出），
+                为空时使用全局配置
+            api_key / base_url / model: 覆盖阶段配置（例如对冲请求使用备用端点），
+                显式指定 base_url 时不使用 LLM_ENDPOINTS 端点池
+        """
+        self.stage = stage
+        self.api_key = api_key or self._stage_setting("API_KEY") or settings.LLM_API_KEY
+        self.base_url = base_url or self._stage_setting("BASE_URL") or settings.LLM_BASE_URL
+        self.model = model or self._stage_setting("MODEL") or settings.LLM_MODEL
+        self.max_tokens: Optional[int] = self._stage_setting("MAX_TOKENS")  # 输出 token 上限，为空时不限制
+        self.timeout: float = self._stage_setting("TIMEOUT") or 30.0  # 单次请求的总超时（秒，包括排队和换端点重试）
+        self.pool = get_pool(
+            stage,
+            self.base_url,
+            self.api_key,
+            self.model,
+            kind=settings.LLM_KIND,
+            use_configured=base_url is None
+        )
+    
+    @property
+    def available(self) -> bool:
+        """是否有可用的大模型端点（否则所有调用都使用降级方案）"""
+        return bool(self.pool.endpoints)
+    
+    def _stage_setting(self, name: str) -> Any:
+        """读取当前阶段的配置项（如 LLM_INTENT_MODEL），未设置阶段或配置为空时返回 None"""
+        if self.stage not in self.STAGES:
+            return None
+        return getattr(settings, f"LLM_{self.stage.upper()}_{name}", None)
+    
+    def _request_body(self, endpoint: Endpoint, messages: list, temperature: float, **extra: Any) -> Dict[str, Any]:
+        """构建 chat/completions 请求体（带上阶段的输出 token 上限）"""
+        body = {
+            "model": endpoint.model,
+            "messages": messages,
+            "temperature": temperature,
+            **extra
+        }
+        if self.max_tokens:
+            body["max_tokens"] = self.max_tokens
+        return body
+    
+    def _remaining_time(self, deadline: float) -> float:
+        """距离请求截止时间的剩余秒数（作为单次 HTTP 调用的超时）"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError(f"大模型请求超过 {self.timeout}s 未完成")
+        return remaining
+    
+    async def _call_pool(self, call: Callable[[Endpoint, float], Awaitable[Any]]) -> Any:
+        """
+        在端点池中执行一次调用，失败时换一个端点重试（最多 LLM_POOL_MAX_ATTEMPTS 次）
+        
+        每次尝试都先经过准入控制（按阶段优先级排队），避免突发流量触发服务商限流。
+        排队和重试共用一个截止时间（self.timeout），每次调用的超时为剩余时间。
+        排队用完时间预算时不再租用端点（超时不计入端点的健康状态），也不再重试。
+        
+        Raises:
+            AdmissionRejected: 等待队列已满或排队超时
+            asyncio.TimeoutError: 排队或前面的尝试用完了时间预算
+            最后一次调用的异常
+        """
+        deadline = time.monotonic() + self.timeout
+        tried = ()
+        attempts = min(settings.LLM_POOL_MAX_ATTEMPTS, len(self.pool.endpoints))
+        for attempt in range(attempts):
+            endpoint = None
+            try:
+                async with admission.slot(self.stage):
+                    timeout = self._remaining_time(deadline)
+                    async with self.pool.lease(exclude=tried) as endpoint:
+                        tried += (endpoint,)
+                        return await call(endpoint, timeout)
+            except (asyncio.CancelledError, AdmissionRejected):
+                raise
+            except Exception as e:
+                if endpoint is None:
+                    # 尚未租用端点（排队用完了时间预算），与端点无关
+                    print(f"[WARNING] 大模型请求排队后没有剩余时间：{e}")
+                    raise
+                self._log_api_error(endpoint, e)
+                if attempt == attempts - 1 or deadline - time.monotonic() <= 0:
+                    raise
+                print(f"[WARNING] 端点 {endpoint.name} 调用失败，换一个端点重试")
+    
+    def _log_api_error(self, endpoint: Endpoint, error: Exception) -> None:
+        """输出大模型调用失败的详细信息"""
+        error_detail = str(error)
+        print(f"[ERROR] 大模型 API 调用失败：{error_detail}")
+        print(f"[ERROR] 配置信息 - endpoint: {endpoint.name}, base_url: {endpoint.base_url or '未配置'}, model: {endpoint.model}")
+        
+        # 如果是认证错误，提供更详细的提示
+        if "401" in error_detail or "unauthorized" in error_detail.lower() or "authentication" in error_detail.lower():
+            print("[ERROR] API Key 认证失败，请检查：")
+            print("  1. API Key 是否正确（从 https://bailian.console.aliyun.com/ 获取）")
+            print("  2. API Key 是否已激活")
+            print("  3. base_url 和 API Key 的地域是否匹配")
+            print("  4. 中国大陆地域: https://dashscope.aliyuncs.com/compatible-mode/v1")
+            print("  5. 国际地域: https://dashscope-intl.aliyuncs.com/compatible-mode/v1")
     
     async def chat(self, messages: list, temperature: float = 0.7, user_input: str = None) -> str:
         """
@@ -29,214 +147,371 @@ class LLMService:
         Returns:
             模型返回的文本内容
         """
+        return (await self.chat_result(messages, temperature, user_input))["content"]
+    
+    async def chat_result(self, messages: list, temperature: float = 0.7, user_input: str = None) -> Dict[str, Any]:
+        """
+        调用大模型进行对话，同时返回本次调用是否使用了降级方案
+        
+        降级标记随结果返回而不是保存在实例上：同一实例上的并发调用和后台调用不会互相覆盖
+        
+        Returns:
+            {"content": "模型返回的文本内容", "fallback": 是否使用了降级方案（降级结果不应写入缓存）}
+        """
         # 如果没有配置 API Key，使用降级方案（基于规则的识别）
-        if not self.api_key:
+        if not self.available:
             # 如果提供了原始用户输入，直接使用；否则从 messages 中提取
             if user_input:
                 result = self._fallback_response_direct(user_input)
             else:
                 result = self._fallback_response(messages)
             print(f"[DEBUG] LLM 降级方案 - 用户输入: {user_input or (messages[-1]['content'][:50] if messages else '')}, 返回: {result[:100] if result else ''}")
-            return result
+            return {"content": result, "fallback": True}
         
-        # 根据配置选择不同的实现
-        if self.base_url and "localhost" in self.base_url or "127.0.0.1" in self.base_url:
-            # 本地模型
-            return await self._call_local_model(messages, temperature)
-        else:
+        async def call(endpoint: Endpoint, timeout: float) -> str:
+            # 根据端点类型选择不同的实现
+            if endpoint.kind == "local":
+                # 本地模型
+                return await self._call_local_model(endpoint, messages, temperature, timeout)
             # OpenAI 兼容 API
-            return await self._call_openai_api(messages, temperature)
-    
-    async def _call_openai_api(self, messages: list, temperature: float) -> str:
-        """调用 OpenAI 兼容 API（支持 DashScope/百炼平台）"""
+            return await self._call_openai_api(endpoint, messages, temperature, timeout)
+        
         try:
-            from openai import OpenAI
-            
-            # 如果没有配置 base_url，使用默认的 DashScope 端点
-            base_url = self.base_url
-            if not base_url:
-                # 默认使用阿里云 DashScope 的 OpenAI 兼容模式
-                base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
-                print(f"[DEBUG] 未配置 LLM_BASE_URL，使用默认 DashScope 端点: {base_url}")
-            
-            if not self._client:
-                self._client = OpenAI(
-                    api_key=self.api_key,
-                    base_url=base_url
-                )
-                print(f"[DEBUG] 初始化 OpenAI 客户端 - base_url: {base_url}, model: {self.model}")
-            
-            # 检查是否需要 JSON 格式（如果提示词中包含 JSON 要求）
-            use_json_format = False
-            for msg in messages:
-                if "content" in msg:
-                    content = msg["content"]
-                    if isinstance(content, str) and ("json" in content.lower() or "返回格式" in content or "JSON" in content):
-                        use_json_format = True
-                        break
-            
-            # 构建请求参数
-            request_params = {
-                "model": self.model,
-                "messages": messages,
-                "temperature": temperature
-            }
-            
-            if use_json_format:
-                request_params["response_format"] = {"type": "json_object"}
-                print(f"[DEBUG] 使用 JSON 格式响应模式")
-            
-            print(f"[DEBUG] 调用大模型 API - model: {self.model}, messages_count: {len(messages)}")
-            
-            response = self._client.chat.completions.create(**request_params)
+            return {"content": await self._call_pool(call), "fallback": False}
+        except asyncio.CancelledError:
+            # 请求被取消（客户端取消或断开、服务器关闭）：中止请求并向上传递，不再使用降级方案继续执行
+            print("[WARN] 大模型 API 请求被取消")
+            raise
+        except AdmissionRejected as e:
+            print(f"[WARNING] {e}，使用降级方案")
+            return {"content": self._fallback_response(messages), "fallback": True}
+        except Exception:
+            # 降级到规则识别
+            return {"content": self._fallback_response(messages), "fallback": True}
+    
+    async def chat_with_tools(
+        self,
+        messages: list,
+        tools: List[Dict[str, Any]],
+        temperature: float = 0.3,
+        user_input: str = None
+    ) -> Dict[str, Any]:
+        """
+        使用原生函数调用（function calling）识别工具调用
+        
+        Args:
+            messages: 消息列表
+            tools: 工具定义（由 app.tools.get_tool_schemas 生成）
+            temperature: 温度参数
+            user_input: 原始用户输入（用于降级方案）
             
-            result = response.choices[0].message.content
-            print(f"[DEBUG] 大模型 API 调用成功 - 返回长度: {len(result)} 字符")
+        Returns:
+            {"tools": [{"tool": "weather", "parameters": {...}}, ...], "content": "模型的文本回复", "fallback": 是否使用了降级方案}
+            大模型不支持函数调用、只返回了文本时，"tools" 为空、"content" 为文本（由调用方按 JSON 文本解析）
+        """
+        if not self.available:
+            result = self._fallback_tool_calls(user_input or self._extract_user_input(messages))
+            print(f"[DEBUG] LLM 降级方案（函数调用）- 用户输入: {user_input}, 返回: {result['tools']}")
             return result
-            
-        except ImportError:
-            error_msg = "请安装 openai 库：pip install openai"
-            print(f"[ERROR] {error_msg}")
-            raise ImportError(error_msg)
+        
+        async def call(endpoint: Endpoint, timeout: float) -> Dict[str, Any]:
+            if endpoint.kind == "local":
+                return await self._call_local_model_with_tools(endpoint, messages, tools, temperature, timeout)
+            client = self._get_openai_client(endpoint)
+            print(f"[DEBUG] 调用大模型 API（函数调用）- endpoint: {endpoint.name}, model: {endpoint.model}, tools: {len(tools)}")
+            response = await client.chat.completions.create(
+                **self._request_body(endpoint, messages, temperature, tools=tools, tool_choice="auto"),
+                timeout=timeout
+            )
+            return response.choices[0].message.model_dump()
+        
+        try:
+            message = await self._call_pool(call)
         except asyncio.CancelledError:
-            # 请求被取消（通常是服务器关闭或重启），使用降级方案
-            print("[WARN] 大模型 API 请求被取消，使用降级方案")
-            return self._fallback_response(messages)
+            print("[WARN] 大模型 API 请求被取消")
+            raise
         except Exception as e:
-            error_detail = str(e)
-            print(f"[ERROR] 大模型 API 调用失败：{error_detail}")
-            print(f"[ERROR] 配置信息 - base_url: {self.base_url or '未配置'}, model: {self.model}")
-            
-            # 如果是认证错误，提供更详细的提示
-            if "401" in error_detail or "unauthorized" in error_detail.lower() or "authentication" in error_detail.lower():
-                print("[ERROR] API Key 认证失败，请检查：")
-                print("  1. API Key 是否正确（从 https://bailian.console.aliyun.com/ 获取）")
-                print("  2. API Key 是否已激活")
-                print("  3. base_url 和 API Key 的地域是否匹配")
-                print("  4. 中国大陆地域: https://dashscope.aliyuncs.com/compatible-mode/v1")
-                print("  5. 国际地域: https://dashscope-intl.aliyuncs.com/compatible-mode/v1")
+            print(f"[ERROR] 大模型函数调用失败：{e}")
+            return self._fallback_tool_calls(user_input or self._extract_user_input(messages))
+        
+        calls = []
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call.get("function") or {}
+            arguments = function.get("arguments") or "{}"
+            try:
+                parameters = json.loads(arguments) if isinstance(arguments, str) else dict(arguments)
+            except ValueError:
+                print(f"[WARNING] 工具参数不是合法 JSON，忽略参数 - {function.get('name')}: {arguments[:100]}")
+                parameters = {}
+            calls.append({"tool": function.get("name"), "parameters": parameters})
+        print(f"[DEBUG] 大模型函数调用返回 {len(calls)} 个工具调用")
+        return {"tools": calls, "content": message.get("content") or "", "fallback": False}
+    
+    async def _call_local_model_with_tools(
+        self,
+        endpoint: Endpoint,
+        messages: list,
+        tools: List[Dict[str, Any]],
+        temperature: float,
+        timeout: float
+    ) -> Dict[str, Any]:
+        """调用本地模型的函数调用接口，返回 message 字典"""
+        client = self._get_http_client(endpoint)
+        payload = self._request_body(endpoint, messages, temperature, tools=tools, tool_choice="auto")
+        response = await client.post("/v1/chat/completions", json=payload, timeout=self._http_timeout(timeout))
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]
+    
+    async def chat_stream(
+        self,
+        messages: list,
+        temperature: float = 0.7,
+        user_input: str = None,
+        status: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        流式调用大模型，逐段返回增量文本
+        
+        Args:
+            messages: 消息列表，格式：[{"role": "user", "content": "..."}]
+            temperature: 温度参数，控制随机性
+            user_input: 原始用户输入（用于降级方案）
+            status: 调用状态（可选，由调用方为每次调用单独提供），写入：
+                "fallback": 是否使用了降级方案
+                "incomplete": 输出中途失败（已输出部分内容，结果不完整，不应缓存）
             
-            # 降级到规则识别
-            return self._fallback_response(messages)
+        Yields:
+            模型返回的增量文本
+        """
+        if status is None:
+            status = {}
+        status["fallback"] = False
+        status["incomplete"] = False
+        # 没有配置 API Key 时，降级方案一次性返回完整结果
+        if not self.available:
+            status["fallback"] = True
+            yield await self.chat(messages, temperature, user_input)
+            return
+        
+        deadline = time.monotonic() + self.timeout
+        try:
+            async with admission.slot(self.stage):
+                async for delta in self._stream_pool(messages, temperature, self._remaining_time(deadline), status):
+                    yield delta
+        except AdmissionRejected as e:
+            print(f"[WARNING] {e}，使用降级方案")
+            status["fallback"] = True
+            yield self._fallback_response(messages)
+        except Exception:
+            # 尚未输出任何内容，降级到规则识别
+            status["fallback"] = True
+            yield self._fallback_response(messages)
     
-    async def _call_local_model(self, messages: list, temperature: float) -> str:
-        """调用本地模型（通过 HTTP API）"""
+    async def _stream_pool(
+        self,
+        messages: list,
+        temperature: float,
+        timeout: float,
+        status: Dict[str, Any]
+    ) -> AsyncIterator[str]:
+        """
+        在端点池中执行一次流式调用（失败时不重试：已输出的内容无法撤回）
+        
+        已输出部分内容后失败时结束输出，并在 status 中标记 "incomplete"
+        
+        Raises:
+            尚未输出任何内容时的调用异常（由调用方降级，并让准入控制感知 429）
+        """
+        endpoint = self.pool.acquire()
+        if endpoint.kind == "local":
+            stream = self._stream_local_model(endpoint, messages, temperature, timeout)
+        else:
+            stream = self._stream_openai_api(endpoint, messages, temperature, timeout)
+        
+        start_time = time.time()
+        first_token_latency = None  # 流式调用以首个 token 的延迟衡量端点健康
+        success = None
         try:
-            import httpx
-            
-            # 构建请求
-            url = f"{self.base_url}/v1/chat/completions"
-            payload = {
-                "model": self.model,
-                "messages": messages,
-                "temperature": temperature
-            }
-            
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    url,
-                    json=payload,
-                    headers={"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
-                )
-                response.raise_for_status()
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
+            async for delta in stream:
+                if delta:
+                    if first_token_latency is None:
+                        first_token_latency = time.time() - start_time
+                    yield delta
+            success = True
         except Exception as e:
-            print(f"本地模型调用失败：{e}")
-            # 降级到规则识别
-            return self._fallback_response(messages)
+            success = False
+            self._log_api_error(endpoint, e)
+            print(f"[ERROR] 大模型流式调用失败：{e}")
+            if first_token_latency is None:
+                raise
+            status["incomplete"] = True
+        finally:
+            self.pool.release(endpoint, first_token_latency, success)
+    
+    def _get_openai_client(self, endpoint: Endpoint):
+        """获取（或初始化）端点的 OpenAI 兼容异步客户端"""
+        from openai import AsyncOpenAI
+        
+        if not endpoint.client:
+            endpoint.client = AsyncOpenAI(
+                api_key=endpoint.api_key,
+                base_url=endpoint.base_url
+            )
+            print(f"[DEBUG] 初始化 OpenAI 客户端 - endpoint: {endpoint.name}, base_url: {endpoint.base_url}, model: {endpoint.model}")
+        return endpoint.client
+    
+    def _get_http_client(self, endpoint: Endpoint):
+        """
+        获取（或初始化）本地模型端点的长连接 HTTP 客户端
+        
+        每个端点一个 httpx.AsyncClient，连接池限制连接数并保持长连接，避免每次调用都重新建立连接；
+        安装了 h2 时启用 HTTP/2。客户端在应用关闭时由 close_pools 关闭。
+        """
+        import httpx
+        
+        if not endpoint.client:
+            http2 = settings.LLM_HTTP2 and _h2_available()
+            endpoint.client = httpx.AsyncClient(
+                base_url=endpoint.base_url,
+                headers={"Authorization": f"Bearer {endpoint.api_key}"} if endpoint.api_key else {},
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY
+                ),
+                http2=http2
+            )
+            print(f"[DEBUG] 初始化本地模型 HTTP 客户端 - endpoint: {endpoint.name}, base_url: {endpoint.base_url}, http2: {http2}")
+        return endpoint.client
+    
+    def _http_timeout(self, timeout: float):
+        """单次 HTTP 调用的超时：总时间取请求剩余时间，建立连接另有上限"""
+        import httpx
+        
+        return httpx.Timeout(timeout, connect=min(settings.LLM_HTTP_CONNECT_TIMEOUT, timeout))
+    
+    async def _stream_openai_api(
+        self,
+        endpoint: Endpoint,
+        messages: list,
+        temperature: float,
+        timeout: float
+    ) -> AsyncIterator[str]:
+        """流式调用 OpenAI 兼容 API"""
+        client = self._get_openai_client(endpoint)
+        print(f"[DEBUG] 流式调用大模型 API - endpoint: {endpoint.name}, model: {endpoint.model}, messages_count: {len(messages)}")
+        stream = await client.chat.completions.create(
+            **self._request_body(endpoint, messages, temperature, stream=True),
+            timeout=timeout
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    async def _stream_local_model(
+        self,
+        endpoint: Endpoint,
+        messages: list,
+        temperature: float,
+        timeout: float
+    ) -> AsyncIterator[str]:
+        """流式调用本地模型（解析 SSE 格式的增量响应）"""
+        client = self._get_http_client(endpoint)
+        payload = self._request_body(endpoint, messages, temperature, stream=True)
+        
+        async with client.stream(
+            "POST",
+            "/v1/chat/completions",
+            json=payload,
+            timeout=self._http_timeout(timeout)
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                if choices:
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+    
+    async def _call_openai_api(self, endpoint: Endpoint, messages: list, temperature: float, timeout: float) -> str:
+        """调用 OpenAI 兼容 API（支持 DashScope/百炼平台），失败时抛出异常"""
+        try:
+            client = self._get_openai_client(endpoint)
+        except ImportError:
+            error_msg = "请安装 openai 库：pip install openai"
+            print(f"[ERROR] {error_msg}")
+            raise ImportError(error_msg)
+        
+        # 检查是否需要 JSON 格式（如果提示词中包含 JSON 要求）
+        use_json_format = False
+        for msg in messages:
+            if "content" in msg:
+                content = msg["content"]
+                if isinstance(content, str) and ("json" in content.lower() or "返回格式" in content or "JSON" in content):
+                    use_json_format = True
+                    break
+        
+        # 构建请求参数
+        request_params = self._request_body(endpoint, messages, temperature)
+        
+        if use_json_format:
+            request_params["response_format"] = {"type": "json_object"}
+            print(f"[DEBUG] 使用 JSON 格式响应模式")
+        
+        print(f"[DEBUG] 调用大模型 API - endpoint: {endpoint.name}, model: {endpoint.model}, messages_count: {len(messages)}")
+        
+        response = await client.chat.completions.create(**request_params, timeout=timeout)
+        
+        result = response.choices[0].message.content
+        print(f"[DEBUG] 大模型 API 调用成功 - 返回长度: {len(result)} 字符")
+        return result
+    
+    async def _call_local_model(self, endpoint: Endpoint, messages: list, temperature: float, timeout: float) -> str:
+        """调用本地模型（通过 HTTP API），失败时抛出异常"""
+        client = self._get_http_client(endpoint)
+        payload = self._request_body(endpoint, messages, temperature)
+        
+        response = await client.post("/v1/chat/completions", json=payload, timeout=self._http_timeout(timeout))
+        response.raise_for_status()
+        result = response.json()
+        return result["choices"][0]["message"]["content"]
+    
+    def _fallback_tool_calls(self, user_input: str) -> Dict[str, Any]:
+        """降级方案：基于规则识别工具调用（函数调用格式）"""
+        # 延迟导入，避免与工具模块形成循环导入
+        from app.core.intent_rules import match_intent
+        
+        return {"tools": match_intent(user_input)["tools"], "content": "", "fallback": True}
     
     def _fallback_response_direct(self, user_input: str) -> str:
         """
         降级方案：基于规则的意图识别（直接使用用户输入）
         当大模型不可用时使用此方法
         """
-        user_input_lower = user_input.lower()
-        
-        # 简单的规则识别（按优先级顺序检查）
-        # 检查新闻相关关键词（必须明确包含"新闻"或"资讯"）
-        if "新闻" in user_input_lower or "资讯" in user_input_lower or "news" in user_input_lower:
-            # 提取查询关键词
-            query = user_input
-            # 移除常见动词
-            query = re.sub(r'抓取|检索|搜索|找|看看|查|列出|总结|最近的', '', query)
-            query = re.sub(r'新闻|资讯|news|条', '', query, flags=re.IGNORECASE)
-            query = query.strip()
-            
-            # 提取数量
-            limit = 10
-            limit_match = re.search(r'(\d+)\s*条', user_input)
-            if limit_match:
-                limit = int(limit_match.group(1))
-                limit = min(max(limit, 1), 50)
-            
-            # 提取领域关键词
-            if not query or len(query) < 2:
-                # 尝试提取领域关键词
-                if "ai" in user_input_lower or "人工智能" in user_input_lower:
-                    query = "AI"
-                elif "科技" in user_input_lower:
-                    query = "科技"
-                elif "国内" in user_input_lower:
-                    query = "国内"
-                else:
-                    query = "科技"  # 默认
-            
-            return json.dumps({
-                "tool": "news",
-                "parameters": {"query": query, "limit": limit},
-                "reasoning": "用户查询新闻信息"
-            })
-        # 然后检查天气
-        elif "天气" in user_input_lower or "气温" in user_input_lower or "weather" in user_input_lower:
-            # 提取城市
-            cities = ["北京", "上海", "广州", "深圳", "杭州", "南京", "成都", "武汉", 
-                     "西安", "天津", "重庆", "苏州", "长沙", "郑州", "青岛", "大连"]
-            location = "北京"
-            for city in cities:
-                if city in user_input:
-                    location = city
-                    break
-            
-            days = 7
-            if any(kw in user_input_lower for kw in ["现在", "今天", "当前"]):
-                days = 1
-            else:
-                # 尝试提取天数
-                days_match = re.search(r'(\d+)\s*天', user_input)
-                if days_match:
-                    days = int(days_match.group(1))
-                    days = min(max(days, 1), 7)
-            
-            return json.dumps({
-                "tool": "weather",
-                "parameters": {"location": location, "days": days},
-                "reasoning": "用户查询天气信息"
-            })
-        elif "股票" in user_input_lower:
-            return json.dumps({
-                "tool": "stock",
-                "parameters": {"symbol": "000001", "days": 5},
-                "reasoning": "用户查询股票信息"
-            })
-        elif "计算" in user_input_lower or "+" in user_input or "-" in user_input:
-            return json.dumps({
-                "tool": "calculate",
-                "parameters": {"expression": user_input},
-                "reasoning": "用户需要进行计算"
-            })
-        else:
+        tools = self._fallback_tool_calls(user_input)["tools"]
+        if not tools:
             return json.dumps({
                 "tool": None,
                 "reasoning": "无法识别用户意图，使用默认处理"
             })
+        if len(tools) > 1:
+            return json.dumps({
+                "tools": tools,
+                "reasoning": "规则识别到多个任务"
+            }, ensure_ascii=False)
+        return json.dumps({
+            "tool": tools[0]["tool"],
+            "parameters": tools[0]["parameters"],
+            "reasoning": "规则识别用户意图"
+        }, ensure_ascii=False)
     
-    def _fallback_response(self, messages: list) -> str:
-        """
-        降级方案：基于规则的意图识别（从 messages 中提取）
-        当大模型不可用时使用此方法
-        """
-        # 从消息中提取用户的实际输入
+    def _extract_user_input(self, messages: list) -> str:
+        """从消息中提取用户的实际输入"""
         # 如果 messages[-1]["content"] 是完整的提示词，尝试提取"用户需求："后面的内容
         content = messages[-1]["content"] if messages else ""
         
@@ -244,82 +519,16 @@ class LLMService:
         user_input = content
         if "用户需求：" in content:
             # 提取"用户需求："后面的内容
-            match = re.search(r'用户需求[：:]\s*(.+?)(?:\n返回格式|$)', content, re.DOTALL)
+            # 只取"用户需求："所在行，避免把提示词后续的说明和示例当作用户输入
+            match = re.search(r'用户需求[：:]\s*(.+?)\s*(?:\n|$)', content)
             if match:
                 user_input = match.group(1).strip()
-        
+        return user_input
+    
+    def _fallback_response(self, messages: list) -> str:
+        """
+        降级方案：基于规则的意图识别（从 messages 中提取）
+        当大模型不可用时使用此方法
+        """
         # 调用直接版本
-        return self._fallback_response_direct(user_input)
-        
-        # 简单的规则识别（按优先级顺序检查）
-        # 检查新闻相关关键词（必须明确包含"新闻"或"资讯"）
-        if "新闻" in user_input_lower or "资讯" in user_input_lower or "news" in user_input_lower:
-            # 提取查询关键词
-            query = user_input
-            # 移除常见动词
-            query = re.sub(r'抓取|检索|搜索|找|看看|查|列出|总结', '', query)
-            query = re.sub(r'新闻|资讯|news', '', query, flags=re.IGNORECASE)
-            query = query.strip()
-            
-            # 提取数量
-            limit = 10
-            limit_match = re.search(r'(\d+)\s*条', user_input)
-            if limit_match:
-                limit = int(limit_match.group(1))
-                limit = min(max(limit, 1), 50)
-            
-            # 提取领域关键词
-            if not query or len(query) < 2:
-                # 尝试提取领域关键词
-                if "ai" in user_input_lower or "人工智能" in user_input_lower:
-                    query = "AI"
-                elif "科技" in user_input_lower:
-                    query = "科技"
-                elif "国内" in user_input_lower:
-                    query = "国内"
-                else:
-                    query = "科技"  # 默认
-            
-            return json.dumps({
-                "tool": "news",
-                "parameters": {"query": query, "limit": limit},
-                "reasoning": "用户查询新闻信息"
-            })
-        # 然后检查天气
-        elif "天气" in user_input_lower or "气温" in user_input_lower or "weather" in user_input_lower:
-            # 提取城市
-            cities = ["北京", "上海", "广州", "深圳", "杭州", "南京", "成都", "武汉", 
-                     "西安", "天津", "重庆", "苏州", "长沙", "郑州", "青岛", "大连"]
-            location = "北京"
-            for city in cities:
-                if city in user_input:
-                    location = city
-                    break
-            
-            days = 7
-            if any(kw in user_input_lower for kw in ["现在", "今天", "当前"]):
-                days = 1
-            
-            return json.dumps({
-                "tool": "weather",
-                "parameters": {"location": location, "days": days},
-                "reasoning": "用户查询天气信息"
-            })
-        elif "股票" in user_input_lower:
-            return json.dumps({
-                "tool": "stock",
-                "parameters": {"symbol": "000001", "days": 5},
-                "reasoning": "用户查询股票信息"
-            })
-        elif "计算" in user_input_lower or "+" in user_input or "-" in user_input:
-            return json.dumps({
-                "tool": "calculate",
-                "parameters": {"expression": user_input},
-                "reasoning": "用户需要进行计算"
-            })
-        else:
-            return json.dumps({
-                "tool": None,
-                "reasoning": "无法识别用户意图，使用默认处理"
-            })
-
+        return self._fallback_response_direct(self._extract_user_input(messages))
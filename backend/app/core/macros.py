@@ -0,0 +1,261 @@
+"""
+工作流宏
+
+很多用户每天发送同样的组合请求（所在城市天气 + 财经新闻 + 自选股 + 总结），每次都要经过大模型推导执行计划。
+工作流宏预先声明工具图，按名称调用，完全跳过意图识别：
+
+    {
+        "name": "morning_briefing",
+        "description": "早间简报",
+        "params": {"city": "北京", "symbol": "600519"},  # 参数及默认值
+        "steps": [
+            {"id": "weather", "tool": "weather", "parameters": {"location": "{city}", "days": 1}},
+            {"id": "stock", "tool": "stock", "parameters": {"symbol": "{symbol}"}},
+            {"id": "summary", "tool": "document", "parameters": {"template": "summary", "content": "早间简报"},
+             "depends_on": ["weather", "stock"]}
+        ]
+    }
+
+- 参数值中的 {参数名} 在调用时替换；整个值就是 "{参数名}" 时保留参数的原始类型（如数字）
+- depends_on 声明步骤间的依赖，没有依赖关系的步骤由调度器并发执行；依赖步骤的成功结果作为 data 参数传入
+- 宏保存在服务端的 JSON 文件中（MACRO_STORE_PATH）；内置宏每次启动都会加载，只能用 PUT 覆盖，不能删除
+"""
+from typing import Dict, Any, List, Optional, Tuple
+import copy
+import json
+import os
+import re
+import threading
+from app.config import settings
+
+class MacroNotFound(Exception):
+    """工作流宏不存在"""
+
+class MacroParamError(ValueError):
+    """调用参数无效（传入了宏未声明的参数）"""
+
+class BuiltinMacroError(Exception):
+    """内置工作流宏不能删除"""
+
+_NAME_RE = re.compile(r'^[A-Za-z0-9_\-]{1,64}$')
+_PLACEHOLDER_RE = re.compile(r'\{([A-Za-z_][A-Za-z0-9_]*)\}')
+
+# 内置宏（存储文件中的同名宏会覆盖）
+DEFAULT_MACROS: Dict[str, Dict[str, Any]] = {
+    "morning_briefing": {
+        "name": "morning_briefing",
+        "description": "早间简报：所在城市天气 + 财经新闻 + 自选股 + 总结",
+        "params": {"city": "北京", "symbol": "600519", "news_query": "财经"},
+        "steps": [
+            {"id": "weather", "tool": "weather", "parameters": {"location": "{city}", "days": 1}},
+            {"id": "news", "tool": "news", "parameters": {"query": "{news_query}", "limit": 5}},
+            {"id": "stock", "tool": "stock", "parameters": {"symbol": "{symbol}", "days": 5}},
+            {
+                "id": "summary",
+                "tool": "document",
+                "parameters": {"template": "summary", "content": "{city}早间简报：天气、{news_query}新闻与自选股行情"},
+                "depends_on": ["weather", "news", "stock"]
+            }
+        ]
+    }
+}
+
+def _placeholders(value: Any) -> List[str]:
+    """收集参数值中引用的宏参数名"""
+    if isinstance(value, str):
+        return _PLACEHOLDER_RE.findall(value)
+    if isinstance(value, dict):
+        return [name for item in value.values() for name in _placeholders(item)]
+    if isinstance(value, list):
+        return [name for item in value for name in _placeholders(item)]
+    return []
+
+def _substitute(value: Any, params: Dict[str, Any]) -> Any:
+    """替换参数值中的 {参数名}"""
+    if isinstance(value, str):
+        whole = _PLACEHOLDER_RE.fullmatch(value)
+        if whole:
+            return params[whole.group(1)]
+        return _PLACEHOLDER_RE.sub(lambda match: str(params[match.group(1)]), value)
+    if isinstance(value, dict):
+        return {key: _substitute(item, params) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute(item, params) for item in value]
+    return value
+
+def validate_macro(macro: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    校验宏定义
+
+    Returns:
+        规范化后的宏定义
+
+    Raises:
+        ValueError: 名称非法、工具不存在、缺少必填参数、引用未声明的参数、依赖不存在或存在循环依赖
+    """
+    from app.tools import TOOLS_REGISTRY
+
+    name = macro.get("name") or ""
+    if not _NAME_RE.match(name):
+        raise ValueError("宏名称只能包含字母、数字、下划线和短横线（1-64 个字符）")
+    params = macro.get("params") or {}
+    steps = macro.get("steps") or []
+    if not steps:
+        raise ValueError("宏至少需要一个步骤")
+
+    step_ids = set()
+    normalized_steps = []
+    for index, step in enumerate(steps):
+        step_id = str(step.get("id") or f"step{index + 1}")
+        if step_id in step_ids:
+            raise ValueError(f"步骤 ID 重复：{step_id}")
+        step_ids.add(step_id)
+        tool_name = step.get("tool")
+        if tool_name not in TOOLS_REGISTRY:
+            raise ValueError(f"步骤 {step_id} 的工具不存在：{tool_name}")
+        parameters = step.get("parameters") or {}
+        missing = [param for param in TOOLS_REGISTRY[tool_name]["required_params"] if param not in parameters]
+        if missing:
+            raise ValueError(f"步骤 {step_id} 缺少必填参数：{', '.join(missing)}")
+        undeclared = [param for param in _placeholders(parameters) if param not in params]
+        if undeclared:
+            raise ValueError(f"步骤 {step_id} 引用了未声明的参数：{', '.join(sorted(set(undeclared)))}")
+        normalized_steps.append({
+            "id": step_id,
+            "tool": tool_name,
+            "parameters": parameters,
+            "depends_on": [str(dependency) for dependency in step.get("depends_on") or []]
+        })
+
+    for step in normalized_steps:
+        unknown = [dependency for dependency in step["depends_on"] if dependency not in step_ids]
+        if unknown:
+            raise ValueError(f"步骤 {step['id']} 依赖的步骤不存在：{', '.join(unknown)}")
+
+    # 检查循环依赖（按依赖关系逐层移除没有未完成依赖的步骤）
+    remaining = {step["id"]: set(step["depends_on"]) for step in normalized_steps}
+    while remaining:
+        ready = [step_id for step_id, dependencies in remaining.items() if not dependencies & remaining.keys()]
+        if not ready:
+            raise ValueError(f"步骤之间存在循环依赖：{', '.join(sorted(remaining))}")
+        for step_id in ready:
+            del remaining[step_id]
+
+    return {
+        "name": name,
+        "description": macro.get("description") or "",
+        "params": params,
+        "steps": normalized_steps
+    }
+
+def render_steps(macro: Dict[str, Any], params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    用调用参数（未提供的使用默认值）生成可执行的步骤列表
+
+    Raises:
+        MacroParamError: 传入了未声明的参数
+    """
+    params = params or {}
+    unknown = [name for name in params if name not in macro["params"]]
+    if unknown:
+        raise MacroParamError(f"宏 {macro['name']} 没有参数：{', '.join(unknown)}")
+    values = {**macro["params"], **params}
+    return [
+        {**step, "parameters": _substitute(copy.deepcopy(step["parameters"]), values)}
+        for step in macro["steps"]
+    ]
+
+def resolve_macro(name: str, params: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    查找宏并生成可执行的步骤列表（在执行前调用，执行过程中的错误不会被当作宏不存在或参数无效）
+
+    Returns:
+        (宏定义, 步骤列表)
+
+    Raises:
+        MacroNotFound: 宏不存在
+        MacroParamError: 传入了未声明的参数
+    """
+    macro = macro_store.get(name)
+    if macro is None:
+        raise MacroNotFound(name)
+    return macro, render_steps(macro, params)
+
+class MacroStore:
+    """工作流宏存储（JSON 文件，线程安全）"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        self._macros: Dict[str, Dict[str, Any]] = {
+            name: validate_macro(macro) for name, macro in DEFAULT_MACROS.items()
+        }
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] 读取工作流宏失败：{e}")
+            return
+        for macro in stored.values():
+            try:
+                macro = validate_macro(macro)
+            except ValueError as e:
+                print(f"[WARNING] 忽略无效的工作流宏 {macro.get('name')}：{e}")
+                continue
+            self._macros[macro["name"]] = macro
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._macros, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [copy.deepcopy(macro) for macro in self._macros.values()]
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            macro = self._macros.get(name)
+            return copy.deepcopy(macro) if macro else None
+
+    def put(self, macro: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        新增或更新宏
+
+        Raises:
+            ValueError: 宏定义无效
+        """
+        macro = validate_macro(macro)
+        with self._lock:
+            self._macros[macro["name"]] = macro
+            self._save()
+        return copy.deepcopy(macro)
+
+    def delete(self, name: str) -> bool:
+        """
+        删除宏
+
+        Returns:
+            宏不存在时返回 False
+
+        Raises:
+            BuiltinMacroError: 内置宏每次启动都会重新加载，删除后会恢复，因此不允许删除
+        """
+        if name in DEFAULT_MACROS:
+            raise BuiltinMacroError(name)
+        with self._lock:
+            if self._macros.pop(name, None) is None:
+                return False
+            self._save()
+            return True
+
+macro_store = MacroStore(settings.MACRO_STORE_PATH)
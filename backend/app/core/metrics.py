@@ -0,0 +1,77 @@
+"""
+运行指标
+
+进程内的轻量指标收集：计数器、数值分布（保留最近若干个样本计算分位数）。
+通过 GET /api/metrics 查看。
+"""
+from typing import Dict, Any, Callable
+from collections import deque
+import threading
+
+# 每个分布指标保留的最近样本数（用于计算分位数）
+WINDOW_SIZE = 1024
+
+def _percentile(sorted_values: list, ratio: float) -> float:
+    index = min(int(len(sorted_values) * ratio), len(sorted_values) - 1)
+    return sorted_values[index]
+
+class Metrics:
+    """计数器 + 数值分布（线程安全）"""
+
+    def __init__(self, window_size: int = WINDOW_SIZE):
+        self.window_size = window_size
+        self._counters: Dict[str, float] = {}
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        """计数器累加"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float) -> None:
+        """记录一个样本（如延迟、提示词 token 数）"""
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                summary = {"count": 0, "sum": 0.0, "min": value, "max": value, "recent": deque(maxlen=self.window_size)}
+                self._summaries[name] = summary
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["min"] = min(summary["min"], value)
+            summary["max"] = max(summary["max"], value)
+            summary["recent"].append(value)
+
+    def register_gauge(self, name: str, getter: Callable[[], Any]) -> None:
+        """注册即时值（查看指标时调用 getter 读取，如队列长度、缓存统计）"""
+        with self._lock:
+            self._gauges[name] = getter
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出当前所有指标"""
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = {}
+            for name, summary in self._summaries.items():
+                recent = sorted(summary["recent"])
+                summaries[name] = {
+                    "count": summary["count"],
+                    "avg": round(summary["sum"] / summary["count"], 2),
+                    "min": summary["min"],
+                    "max": summary["max"],
+                    "p50": _percentile(recent, 0.5),
+                    "p95": _percentile(recent, 0.95),
+                    "p99": _percentile(recent, 0.99)
+                }
+            gauges = dict(self._gauges)
+
+        gauge_values = {}
+        for name, getter in gauges.items():
+            try:
+                gauge_values[name] = getter()
+            except Exception as e:
+                gauge_values[name] = f"读取失败：{e}"
+        return {"counters": counters, "summaries": summaries, "gauges": gauge_values}
+
+metrics = Metrics()
@@ -0,0 +1,265 @@
+"""
+定时预计算
+
+早高峰（如 8-9 点）的请求高度集中在少数城市的天气和自选股行情上。预计算调度器在应用内按 cron 表达式
+提前调用这些工具，结果写入工具缓存（app/core/tool_cache.py）；宏任务还会生成文档并写入文档缓存。
+高峰期的请求直接命中缓存，不再集中访问上游 API。
+
+任务通过 PRECOMPUTE_JOBS（JSON 数组）配置，例如：
+    [{"cron": "*/10 7-9 * * 1-5", "tool": "weather", "params": {"location": "北京", "days": 7}},
+     {"cron": "50 7 * * *", "macro": "morning_briefing", "params": {"city": "上海"}}]
+未配置时，按 PRECOMPUTE_CRON 预计算所有内置城市的天气（参数与规则识别结果一致，保证缓存键相同）；
+自选股行情只在配置了 STOCK_API_KEY 且行情接口支持该代码时预计算。内置自选股都是 A 股/港股代码，
+行情接口只返回 Mock 数据（不写入缓存），因此默认配置下不会预计算股票。
+
+cron 格式为 "分 时 日 月 周"，每个字段支持 *、数字、范围（a-b）、步长（*/n、a-b/n）和逗号列表，周日为 0 或 7。
+"""
+from typing import Dict, Any, List, Optional, Set
+from datetime import datetime, timedelta
+import asyncio
+import json
+import time
+from app.core.metrics import metrics
+from app.config import settings
+
+# 字段取值范围：分、时、日、月、周
+_CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+class CronSchedule:
+    """cron 表达式（分 时 日 月 周）"""
+
+    def __init__(self, expression: str):
+        """
+        Raises:
+            ValueError: 表达式格式错误
+        """
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 表达式需要 5 个字段（分 时 日 月 周）：{expression}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, _CRON_FIELDS)
+        ]
+        # 周日可以写作 0 或 7，统一为 Python 的 weekday()（周一为 0）
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        # 日和周同时受限时满足其一即可（与 cron 相同）
+        self.days_restricted = fields[2] != "*"
+        self.weekdays_restricted = fields[4] != "*"
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> Set[int]:
+        values: Set[int] = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_text = part.split("/", 1)
+                step = int(step_text)
+                if step <= 0:
+                    raise ValueError(f"cron 步长必须大于 0：{field}")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(value) for value in part.split("-", 1))
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"cron 字段超出范围 {low}-{high}：{field}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = moment.weekday() in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """
+        下一次执行时间（严格晚于 moment，精确到分钟）
+
+        Raises:
+            ValueError: 表达式永远不会触发（如 2 月 30 日）
+        """
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 4)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                # 跳到下个月 1 日零点
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"cron 表达式不会触发：{self.expression}")
+
+def default_jobs() -> List[Dict[str, Any]]:
+    """默认任务：所有内置城市的天气 + 有真实行情的自选股（参数取自规则识别，与用户请求的缓存键一致；只返回 Mock 数据的股票不预计算）"""
+    from app.core.intent_rules import match_intent
+    from app.tools.weather import CITY_BASE_TEMP
+    from app.tools.stock import STOCK_NAME_TO_CODE, supports_live_quotes
+
+    queries = [f"{city}天气" for city in CITY_BASE_TEMP]
+    if settings.STOCK_API_KEY:
+        queries += [f"{code}股票" for code in dict.fromkeys(STOCK_NAME_TO_CODE.values()) if supports_live_quotes(code)]
+    jobs = []
+    for query in queries:
+        primary = match_intent(query)["primary"]
+        if primary:
+            jobs.append({"cron": settings.PRECOMPUTE_CRON, "tool": primary["tool"], "params": primary["parameters"]})
+    return jobs
+
+def load_jobs() -> List[Dict[str, Any]]:
+    """读取预计算任务配置（无效任务打印警告后忽略）"""
+    if not settings.PRECOMPUTE_JOBS:
+        configs = default_jobs()
+    else:
+        try:
+            configs = json.loads(settings.PRECOMPUTE_JOBS)
+        except ValueError as e:
+            print(f"[ERROR] PRECOMPUTE_JOBS 不是合法的 JSON：{e}")
+            return []
+
+    jobs = []
+    for config in configs:
+        try:
+            if not config.get("tool") and not config.get("macro"):
+                raise ValueError("需要配置 tool 或 macro")
+            schedule = CronSchedule(config.get("cron") or settings.PRECOMPUTE_CRON)
+            schedule.next_after(datetime.now())
+        except ValueError as e:
+            print(f"[WARNING] 忽略无效的预计算任务 {config}：{e}")
+            continue
+        jobs.append({
+            "schedule": schedule,
+            "tool": config.get("tool"),
+            "macro": config.get("macro"),
+            "params": config.get("params") or {}
+        })
+    return jobs
+
+class PrecomputeScheduler:
+    """预计算调度器（由应用生命周期启动和停止的后台任务）"""
+
+    def __init__(self):
+        self.jobs: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.last_run: Optional[str] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_failures = 0
+        self.next_run: Optional[datetime] = None
+
+    def start(self) -> None:
+        if self._task is not None or not settings.PRECOMPUTE_ENABLED:
+            return
+        self.jobs = load_jobs()
+        if not self.jobs:
+            return
+        self._task = asyncio.create_task(self._loop())
+        print(f"[INFO] 预计算调度器已启动 - 任务数: {len(self.jobs)}")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                now = datetime.now()
+                upcoming = [(job["schedule"].next_after(now), job) for job in self.jobs]
+                self.next_run = min(run_at for run_at, _ in upcoming)
+            except Exception as e:
+                # 计算下次执行时间失败时后台任务不能静默退出：记录错误，稍后重试
+                print(f"[ERROR] 预计算调度失败（请检查 PRECOMPUTE_CRON / PRECOMPUTE_JOBS）：{e}")
+                self.next_run = None
+                await asyncio.sleep(60)
+                continue
+            await asyncio.sleep(max((self.next_run - datetime.now()).total_seconds(), 0))
+            due = [job for run_at, job in upcoming if run_at == self.next_run]
+            try:
+                await self.run_jobs(due)
+            except Exception as e:
+                print(f"[ERROR] 预计算执行失败：{e}")
+
+    async def run_jobs(self, jobs: List[Dict[str, Any]]) -> int:
+        """
+        执行一批任务：先并发刷新工具缓存，再执行宏（宏中的工具调用直接命中刚刷新的缓存）
+
+        Returns:
+            失败的任务数
+        """
+        from app.core.scheduler import ToolScheduler
+
+        start_time = time.time()
+        scheduler = ToolScheduler()
+        semaphore = asyncio.Semaphore(max(settings.PRECOMPUTE_CONCURRENCY, 1))
+
+        async def refresh(job: Dict[str, Any]) -> bool:
+            async with semaphore:
+                result = await scheduler.call_tool(job["tool"], dict(job["params"]), refresh=True)
+            if not result.get("success"):
+                print(f"[WARNING] 预计算 {job['tool']} {job['params']} 失败：{result.get('error')}")
+            return bool(result.get("success"))
+
+        tool_jobs = [job for job in jobs if job["tool"]]
+        results = list(await asyncio.gather(*(refresh(job) for job in tool_jobs)))
+        for job in jobs:
+            if job["macro"]:
+                results.append(await self._run_macro(job["macro"], job["params"]))
+
+        failures = results.count(False)
+        duration_ms = (time.time() - start_time) * 1000
+        self.runs += 1
+        self.last_run = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.last_duration_ms = round(duration_ms, 1)
+        self.last_failures = failures
+        metrics.increment("precompute.runs")
+        metrics.increment("precompute.failures", failures)
+        metrics.observe("precompute_duration_ms", duration_ms)
+        print(f"[INFO] 预计算完成 - 任务数: {len(jobs)}, 失败: {failures}, 耗时: {duration_ms:.0f}ms")
+        return failures
+
+    async def _run_macro(self, name: str, params: Dict[str, Any]) -> bool:
+        from app.core.agent import Agent
+        from app.core.macros import resolve_macro, MacroNotFound, MacroParamError
+
+        try:
+            _, steps = resolve_macro(name, params)
+        except MacroNotFound:
+            print(f"[WARNING] 预计算的工作流宏不存在：{name}")
+            return False
+        except MacroParamError as e:
+            print(f"[WARNING] 预计算的工作流宏 {name} 参数无效：{e}")
+            return False
+        agent_result = await Agent().execute_graph(steps)
+        results = agent_result["tool_result"]
+        if isinstance(results, list):
+            return all(item["tool_result"].get("success") for item in results)
+        return bool(results and results.get("success"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "jobs": len(self.jobs),
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_duration_ms": self.last_duration_ms,
+            "last_failures": self.last_failures,
+            "next_run": self.next_run.strftime("%Y-%m-%d %H:%M") if self.next_run else None
+        }
+
+precompute_scheduler = PrecomputeScheduler()
+
+metrics.register_gauge("precompute", precompute_scheduler.stats)
@@ -1,94 +1,86 @@
 """
 提示词模板
 """
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+
+def _describe_param(name: str, schema: Dict[str, Any], required: bool) -> str:
+    """单个参数的说明，如：days(integer，可选，查询天数)"""
+    details = [schema.get("type", "string"), "必填" if required else "可选"]
+    if schema.get("description"):
+        details.append(schema["description"])
+    if schema.get("enum"):
+        details.append(f"可选值：{'/'.join(schema['enum'])}")
+    return f"{name}({'，'.join(details)})"
+
+def describe_tools(tool_names: Optional[List[str]] = None) -> str:
+    """
+    根据工具注册表生成工具说明（每个工具一行）
+    
+    Args:
+        tool_names: 只生成这些工具的说明，为空时生成全部
+    """
+    # 延迟导入，避免与工具模块形成循环导入
+    from app.tools import TOOLS_REGISTRY
+    
+    lines = []
+    for name, info in TOOLS_REGISTRY.items():
+        if tool_names and name not in tool_names:
+            continue
+        params = "、".join(
+            _describe_param(param, schema, param in info["required_params"])
+            for param, schema in info.get("parameters", {}).items()
+        )
+        lines.append(f"- {name}：{info['description']}。参数：{params}")
+    return "\n".join(lines)
 
 class PromptTemplate:
     """提示词模板管理"""
     
-    INTENT_RECOGNITION_PROMPT = """你是一个智能助手，负责分析用户需求并选择合适的工具。
-
-可用工具列表：
-1. weather - 天气查询工具
-   - 功能：查询指定城市的天气信息（支持7天预报）
-   - 参数：location（城市名称，必填）、days（查询天数，可选，默认7）
-
-2. news - 新闻检索工具
-   - 功能：根据关键词检索新闻
-   - 参数：query（搜索关键词，必填）、limit（返回数量，可选，默认10）
-
-3. stock - 股票数据查询工具
-   - 功能：查询股票历史价格数据
-   - 参数：symbol（股票代码，必填）、days（查询天数，可选，默认5）
-
-4. calculate - 数值计算工具
-   - 功能：执行数学计算
-   - 参数：expression（计算表达式，必填）、variables（变量字典，可选）
-
-5. document - 文档生成工具
-   - 功能：生成报告、邮件、总结等文档
-   - 参数：template（模板类型，必填，可选值：report/email/summary）、content（内容提示，必填）、data（上下文数据，可选）
-
-请分析以下用户需求，并返回 JSON 格式的工具调用指令。
-
-用户需求：{user_input}
-
-重要说明：
-1. 如果用户需求包含多个任务（如"查天气并写总结"、"查天气→绘图→写总结"），请识别所有需要的工具，按顺序返回
-2. 如果用户需求包含计算表达式（如"1+1"、"计算"等），优先使用 calculate 工具
-3. 如果用户需求包含"总结"、"写总结"、"生成报告"等，通常需要先获取数据（天气/新闻/股票），然后使用 document 工具生成总结
-4. 你必须只返回 JSON 格式，不要包含任何其他文本、解释或 markdown 代码块标记
-
-返回格式示例（单个工具）：
-{{
-    "tool": "weather",
-    "parameters": {{
-        "location": "北京",
-        "days": 7
-    }},
-    "reasoning": "用户查询天气信息"
-}}
-
-返回格式示例（多个工具，按顺序）：
-{{
-    "tools": [
-        {{
-            "tool": "weather",
-            "parameters": {{
-                "location": "北京",
-                "days": 7
-            }}
-        }},
-        {{
-            "tool": "document",
-            "parameters": {{
-                "template": "summary",
-                "content": "根据天气数据生成总结"
-            }}
-        }}
-    ],
-    "reasoning": "用户需要查询天气并生成总结"
-}}
-
-如果用户需求包含计算，返回：
-{{
-    "tool": "calculate",
-    "parameters": {{
-        "expression": "1+1"
-    }},
-    "reasoning": "用户需要进行计算"
-}}
-
-如果用户需求不需要调用工具，返回：
-{{
-    "tool": null,
-    "reasoning": "用户需求不需要调用工具"
-}}
+    # 静态前缀：放在提示词最前面且保持不变，便于模型服务复用缓存的前缀
+    INTENT_PROMPT_PREFIX = """你是一个智能助手，负责分析用户需求并选择合适的工具，只返回 JSON，不要包含其他文本或 markdown 代码块标记。
+
+规则：
+1. 用户需求包含多个任务时，按执行顺序返回所有工具：{"tools": [{"tool": "工具名", "parameters": {...}}, ...]}
+2. 只有一个任务时返回：{"tool": "工具名", "parameters": {...}}
+3. 包含计算表达式（如"1+1"、"计算"）时，使用 calculate
+4. 需要"总结"、"报告"等文档时，先获取数据（天气/新闻/股票），最后使用 document
+5. 不需要调用工具时返回：{"tool": null}
+
+示例（查北京天气并写总结）：
+{"tools": [{"tool": "weather", "parameters": {"location": "北京", "days": 7}}, {"tool": "document", "parameters": {"template": "summary", "content": "根据天气数据生成总结"}}]}
 """
     
-    def get_intent_recognition_prompt(self, user_input: str) -> str:
-        """获取意图识别提示词"""
-        return self.INTENT_RECOGNITION_PROMPT.format(user_input=user_input)
+    FUNCTION_CALLING_PROMPT = """你是一个智能助手，负责分析用户需求并调用合适的工具。
+
+规则：
+1. 用户需求包含多个任务时，按执行顺序调用所有需要的工具
+2. 用户需求包含计算表达式（如"1+1"、"计算"等）时，调用 calculate
+3. 需要"总结"、"报告"等文档时，先调用取数工具（天气/新闻/股票），最后调用 document
+4. 不需要调用工具时，直接用一句话回复，不调用任何工具"""
+    
+    def get_function_calling_messages(self, user_input: str) -> list:
+        """获取函数调用模式的意图识别消息（工具说明通过 tools 参数传递，不再写入提示词）"""
+        return [
+            {"role": "system", "content": self.FUNCTION_CALLING_PROMPT},
+            {"role": "user", "content": f"用户需求：{user_input}"}
+        ]
+    
+    def get_intent_recognition_prompt(self, user_input: str, tool_names: Optional[List[str]] = None) -> str:
+        """
+        获取意图识别提示词的可变部分（工具说明由注册表生成 + 用户需求）
+        
+        Args:
+            user_input: 用户输入
+            tool_names: 只介绍这些工具（由规则预识别得到），为空时介绍全部工具
+        """
+        return f"可用工具：\n{describe_tools(tool_names)}\n\n用户需求：{user_input}"
+    
+    def get_intent_recognition_messages(self, user_input: str, tool_names: Optional[List[str]] = None) -> list:
+        """获取意图识别消息：静态前缀作为 system 消息在前，可变部分在后"""
+        return [
+            {"role": "system", "content": self.INTENT_PROMPT_PREFIX},
+            {"role": "user", "content": self.get_intent_recognition_prompt(user_input, tool_names)}
+        ]
     
     def get_tool_selection_prompt(
         self, 
@@ -1,20 +1,32 @@
 """
 工具调度器
 """
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator, Callable, Awaitable, Optional
 import asyncio
+import copy
 from app.tools import TOOLS_REGISTRY
+from app.core.tool_cache import get_cached_result, store_result, tool_cache_key
+from app.core.cancellation import CancelToken, run_with_token
 
 class ToolScheduler:
     """工具调度器，负责调用和管理工具"""
     
-    def __init__(self):
+    def __init__(self, single_flight: bool = False):
+        """
+        Args:
+            single_flight: 是否合并相同的调用：同一调度器上工具和参数相同的调用只执行一次，
+                其余调用等待并共享结果（批量请求中的多个工作流共用一个调度器）
+        """
         self.tools = TOOLS_REGISTRY
+        self.single_flight = single_flight
+        self._flights: Dict[str, asyncio.Task] = {}
+        self.shared_calls = 0  # 合并掉的调用数
     
     async def call_tool(
         self, 
         tool_name: str, 
-        parameters: Dict[str, Any]
+        parameters: Dict[str, Any],
+        refresh: bool = False
     ) -> Dict[str, Any]:
         """
         调用工具
@@ -22,10 +34,38 @@ class ToolScheduler:
         Args:
             tool_name: 工具名称
             parameters: 工具参数
+            refresh: 是否跳过工具缓存直接调用（仍会写入缓存，用于预计算）
             
         Returns:
             工具执行结果
         """
+        if not self.single_flight:
+            return await self._call_tool(tool_name, parameters, refresh)
+        
+        key = tool_cache_key(tool_name, parameters)
+        task = self._flights.get(key)
+        if task is None:
+            # 共享的调用在独立任务中执行，某个等待方被取消不影响其他等待方
+            task = asyncio.create_task(self._call_tool(tool_name, dict(parameters), refresh))
+            self._flights[key] = task
+        else:
+            self.shared_calls += 1
+            print(f"[DEBUG] 合并相同的工具调用 - {tool_name}: {parameters}")
+        return copy.deepcopy(await asyncio.shield(task))
+    
+    def cancel_pending(self) -> None:
+        """取消仍在执行的合并调用（批量请求结束时调用）"""
+        for task in self._flights.values():
+            if not task.done():
+                task.cancel()
+    
+    async def _call_tool(
+        self,
+        tool_name: str,
+        parameters: Dict[str, Any],
+        refresh: bool = False
+    ) -> Dict[str, Any]:
+        """执行一次工具调用（未要求刷新时先查工具缓存）"""
         if tool_name not in self.tools:
             return {
                 "success": False,
@@ -33,27 +73,128 @@ class ToolScheduler:
                 "data": None
             }
         
+        if not refresh:
+            cached = get_cached_result(tool_name, parameters)
+            if cached is not None:
+                print(f"[DEBUG] 工具缓存命中 - {tool_name}: {parameters}")
+                return cached
+        
         tool_info = self.tools[tool_name]
         tool_function = tool_info["function"]
+        token = CancelToken()
         
         try:
-            # 使用 asyncio.to_thread 在后台线程运行同步函数
-            # 这样可以避免阻塞事件循环，同时正确处理取消操作
-            result = await asyncio.to_thread(tool_function, parameters)
+            if asyncio.iscoroutinefunction(tool_function):
+                # 异步工具直接在事件循环中运行
+                result = await tool_function(parameters)
+            else:
+                # 使用 asyncio.to_thread 在后台线程运行同步函数，避免阻塞事件循环
+                # 线程无法被中断，取消时通过令牌通知工具跳过后续的上游请求（见 app/core/cancellation.py）
+                result = await asyncio.to_thread(run_with_token, token, tool_function, parameters)
+            store_result(tool_name, parameters, result)
             return result
         except asyncio.CancelledError:
-            # 正确处理取消操作
+            # 取消向上传递，调用方（工作流）随之中止
+            token.cancel()
+            print(f"[WARN] 工具调用被取消 - {tool_name}")
+            raise
+        except Exception as e:
             return {
                 "success": False,
-                "error": "工具调用被取消",
+                "error": f"工具调用失败：{str(e)}",
                 "data": None
             }
+    
+    async def stream_tool(
+        self,
+        tool_name: str,
+        parameters: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式调用工具
+        
+        支持流式输出的工具（注册表中配置了 stream_function）逐段返回增量内容，
+        其他工具只返回最终结果。
+        
+        Yields:
+            {"type": "delta", "content": "..."} 或 {"type": "result", "result": {...}}
+        """
+        tool_info = self.tools.get(tool_name)
+        stream_function = tool_info.get("stream_function") if tool_info else None
+        if not stream_function:
+            yield {"type": "result", "result": await self.call_tool(tool_name, parameters)}
+            return
+        
+        try:
+            async for event in stream_function(parameters):
+                yield event
         except Exception as e:
+            yield {
+                "type": "result",
+                "result": {
+                    "success": False,
+                    "error": f"工具调用失败：{str(e)}",
+                    "data": None
+                }
+            }
+    
+    async def run_graph(
+        self,
+        steps: List[Dict[str, Any]],
+        call: Optional[Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        按依赖关系执行工具图：依赖全部完成的步骤立即开始，互不依赖的步骤并发执行
+        
+        接受 data 参数的工具（如 document）会拿到依赖步骤的成功结果：只有一个依赖时直接作为 data，
+        多个依赖时按步骤 ID 整合（与 Agent 链式调用的上下文数据结构一致）。
+        
+        Args:
+            steps: [{"id": ..., "tool": ..., "parameters": {...}, "depends_on": [...]}, ...]，调用方保证无循环依赖
+            call: 调用单个工具的函数，默认使用 call_tool
+            
+        Returns:
+            按 steps 顺序排列的 [{"id", "tool_name", "tool_params", "tool_result"}, ...]
+        """
+        call = call or self.call_tool
+        tasks: Dict[str, asyncio.Task] = {}
+        
+        async def run_step(step: Dict[str, Any]) -> Dict[str, Any]:
+            dependencies = step.get("depends_on") or []
+            results = {
+                dependency: (await tasks[dependency])["tool_result"]
+                for dependency in dependencies
+            }
+            tool_name = step["tool"]
+            tool_params = dict(step.get("parameters") or {})
+            tool_info = self.tools.get(tool_name) or {}
+            accepts_data = "data" in tool_info.get("required_params", []) + tool_info.get("optional_params", [])
+            collected_data = {
+                dependency: result["data"]
+                for dependency, result in results.items()
+                if result.get("success") and result.get("data")
+            }
+            if accepts_data and collected_data and "data" not in tool_params:
+                tool_params["data"] = next(iter(collected_data.values())) if len(collected_data) == 1 else collected_data
+            
+            print(f"[DEBUG] 工具图执行步骤 {step['id']}: {tool_name}")
+            tool_result = await call(tool_name, tool_params)
+            if not tool_result.get("success"):
+                print(f"[WARNING] 工具图步骤 {step['id']} 执行失败：{tool_result.get('error')}")
             return {
-                "success": False,
-                "error": f"工具调用失败：{str(e)}",
-                "data": None
+                "id": step["id"],
+                "tool_name": tool_name,
+                "tool_params": tool_params,
+                "tool_result": tool_result
             }
+        
+        for step in steps:
+            tasks[step["id"]] = asyncio.create_task(run_step(step))
+        try:
+            return list(await asyncio.gather(*tasks.values()))
+        finally:
+            for task in tasks.values():
+                task.cancel()
     
     def get_available_tools(self) -> List[Dict[str, Any]]:
         """获取可用工具列表"""
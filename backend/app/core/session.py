@@ -0,0 +1,208 @@
+"""
+对话会话存储
+
+按 conversationId 保存每一轮的执行计划（工具及参数）和工具结果，使追问只执行变化的部分：
+- "再帮我写个总结"：沿用上一轮的取数工具（直接复用结果），只新增文档生成
+- "换成上海" / "改成未来三天的"：按上一轮的计划替换参数，参数没变的工具直接复用结果
+
+存储有界：
+- 会话按最近访问 LRU 淘汰（SESSION_MAX_SESSIONS），空闲超过 SESSION_TTL 的会话过期
+- 最近 SESSION_RECENT_TURNS 轮保持原样（可复用工具结果），更早的轮次 zlib 压缩保存
+- 每个会话的内存上限为 SESSION_MAX_BYTES，超出时先丢弃最早的轮次，仍超出时最新一轮只保留计划
+
+会话数量和内存占用通过 /api/metrics 的 session 指标查看。
+"""
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+import copy
+import json
+import threading
+import time
+import zlib
+from app.core.intent_rules import follow_up_overrides, has_follow_up_cue
+from app.core.tool_cache import tool_cache_key
+from app.core.metrics import metrics
+from app.config import settings
+
+def _encode(turn: Dict[str, Any]) -> bytes:
+    return json.dumps(turn, ensure_ascii=False, default=str).encode("utf-8")
+
+class Session:
+    """单个会话：最近的轮次原样保存，更早的轮次压缩保存"""
+
+    def __init__(self, conversation_id: str):
+        self.conversation_id = conversation_id
+        self.recent: List[Dict[str, Any]] = []  # [{"turn": {...}, "size": 字节数}]
+        self.archived: List[bytes] = []  # 压缩后的更早轮次
+        self.turn_count = 0
+        self.last_active = time.time()
+
+    @property
+    def size(self) -> int:
+        """估算的内存占用（字节）：原样轮次按 JSON 长度计，压缩轮次按压缩后长度计"""
+        return sum(item["size"] for item in self.recent) + sum(len(data) for data in self.archived)
+
+    def add(self, turn: Dict[str, Any]) -> None:
+        self.turn_count += 1
+        self.recent.append({"turn": turn, "size": len(_encode(turn))})
+        while len(self.recent) > max(settings.SESSION_RECENT_TURNS, 1):
+            oldest = self.recent.pop(0)
+            self.archived.append(zlib.compress(_encode(oldest["turn"])))
+        self._enforce_limit()
+
+    def _enforce_limit(self) -> None:
+        """超出内存上限时丢弃最早的轮次；只剩最新一轮仍超出时去掉其工具结果"""
+        limit = settings.SESSION_MAX_BYTES
+        while self.size > limit and self.archived:
+            self.archived.pop(0)
+        while self.size > limit and len(self.recent) > 1:
+            self.recent.pop(0)
+        if self.size > limit and self.recent:
+            latest = self.recent[-1]
+            if latest["turn"].get("results"):
+                turn = {**latest["turn"], "results": []}
+                self.recent[-1] = {"turn": turn, "size": len(_encode(turn))}
+                metrics.increment("session.truncated")
+
+    def turns(self) -> List[Dict[str, Any]]:
+        """全部保存的轮次（从旧到新，解压更早的轮次）"""
+        archived = [json.loads(zlib.decompress(data)) for data in self.archived]
+        return archived + [copy.deepcopy(item["turn"]) for item in self.recent]
+
+class SessionStore:
+    """会话存储（按会话 LRU 淘汰 + 空闲过期，线程安全）"""
+
+    def __init__(self):
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.expired = 0
+
+    def _get(self, conversation_id: str) -> Optional[Session]:
+        session = self._sessions.get(conversation_id)
+        if session is None:
+            return None
+        if time.time() - session.last_active > settings.SESSION_TTL:
+            del self._sessions[conversation_id]
+            self.expired += 1
+            return None
+        session.last_active = time.time()
+        self._sessions.move_to_end(conversation_id)
+        return session
+
+    def last_turn(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """最近一轮（副本），会话不存在或已过期时返回 None"""
+        with self._lock:
+            session = self._get(conversation_id)
+            if session is None or not session.recent:
+                return None
+            return copy.deepcopy(session.recent[-1]["turn"])
+
+    def reusable_results(self, conversation_id: str) -> Dict[str, Dict[str, Any]]:
+        """最近几轮中成功的工具结果，按（工具名 + 参数）的缓存键索引"""
+        with self._lock:
+            session = self._get(conversation_id)
+            if session is None:
+                return {}
+            reusable = {}
+            for item in session.recent:
+                for result in item["turn"].get("results", []):
+                    if result["tool_result"] and result["tool_result"].get("success"):
+                        key = tool_cache_key(result["tool_name"], result["tool_params"])
+                        reusable[key] = copy.deepcopy(result["tool_result"])
+            return reusable
+
+    def record_turn(
+        self,
+        conversation_id: str,
+        user_input: str,
+        plan: List[Dict[str, Any]],
+        results: List[Dict[str, Any]]
+    ) -> None:
+        """
+        保存一轮对话
+
+        Args:
+            conversation_id: 对话 ID
+            user_input: 用户输入
+            plan: 执行计划 [{"tool": ..., "parameters": {...}}]（执行前的参数，不含注入的上下文数据）
+            results: 工具执行结果 [{"tool_name", "tool_params", "tool_result"}]
+        """
+        turn = {
+            "input": user_input,
+            "plan": copy.deepcopy(plan),
+            "results": copy.deepcopy(results),
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        with self._lock:
+            session = self._get(conversation_id)
+            if session is None:
+                session = Session(conversation_id)
+                self._sessions[conversation_id] = session
+            session.add(turn)
+            while len(self._sessions) > settings.SESSION_MAX_SESSIONS:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+
+    def history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """会话的全部轮次（从旧到新）"""
+        with self._lock:
+            session = self._get(conversation_id)
+            return session.turns() if session else []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = [session.size for session in self._sessions.values()]
+            return {
+                "sessions": len(sizes),
+                "total_bytes": sum(sizes),
+                "avg_session_bytes": round(sum(sizes) / len(sizes)) if sizes else 0,
+                "max_session_bytes": max(sizes) if sizes else 0,
+                "limit_bytes": settings.SESSION_MAX_BYTES,
+                "evicted": self.evicted,
+                "expired": self.expired
+            }
+
+def plan_follow_up(
+    user_input: str,
+    rule_match: Dict[str, Any],
+    previous_plan: List[Dict[str, Any]]
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    按上一轮的计划解析追问
+
+    Args:
+        user_input: 本轮输入
+        rule_match: 本轮输入的规则识别结果
+        previous_plan: 上一轮的执行计划
+
+    Returns:
+        本轮的执行计划；输入包含新的取数任务、或不是对上一轮的追问时返回 None
+        （没有承接词、也没有修改上一轮参数的输入视为新请求，如 "帮我写一封感谢邮件"）
+    """
+    if any(tool_info["tool"] != "document" for tool_info in rule_match["tools"]):
+        return None
+    data_steps = [tool_info for tool_info in previous_plan if tool_info["tool"] != "document"]
+    if not data_steps:
+        return None
+
+    overrides = follow_up_overrides(user_input)
+    overrides = {tool: params for tool, params in overrides.items() if any(step["tool"] == tool for step in data_steps)}
+    document = next((tool_info for tool_info in rule_match["tools"] if tool_info["tool"] == "document"), None)
+    if not overrides and (document is None or not has_follow_up_cue(user_input)):
+        return None
+    if document is None:
+        # 只修改参数时沿用上一轮的文档步骤（数据变化后重新生成）
+        document = next((tool_info for tool_info in previous_plan if tool_info["tool"] == "document"), None)
+
+    plan = [
+        {"tool": step["tool"], "parameters": {**step["parameters"], **overrides.get(step["tool"], {})}}
+        for step in data_steps
+    ]
+    if document is not None:
+        plan.append(copy.deepcopy(document))
+    return plan
+
+session_store = SessionStore()
+
+metrics.register_gauge("session", session_store.stats)
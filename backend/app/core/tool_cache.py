@@ -0,0 +1,50 @@
+"""
+工具结果缓存
+
+按（工具名 + 规范化参数）缓存外部数据类工具的成功结果（Mock 数据不缓存），每个工具使用独立的有效期（TOOL_CACHE_TTLS），
+未配置有效期的工具（如计算、文档）不缓存。定时预计算（app/core/precompute.py）在高峰前写入本缓存，
+高峰期的请求直接命中，不再访问上游 API。
+"""
+from typing import Dict, Any, Optional
+import copy
+from app.core.cache import ResultCache, fingerprint
+from app.core.metrics import metrics
+from app.config import settings
+
+tool_caches: Dict[str, ResultCache] = {
+    tool_name: ResultCache(f"tool.{tool_name}", max_entries=settings.TOOL_CACHE_MAX_ENTRIES, ttl=ttl)
+    for tool_name, ttl in settings.TOOL_CACHE_TTLS.items()
+    if ttl > 0
+}
+
+def tool_cache_key(tool_name: str, parameters: Dict[str, Any]) -> str:
+    """计算工具缓存键（字符串参数忽略大小写和首尾空白）"""
+    normalized = {
+        key: value.strip().lower() if isinstance(value, str) else value
+        for key, value in parameters.items()
+    }
+    return fingerprint("tool", tool_name, normalized)
+
+def get_cached_result(tool_name: str, parameters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """读取缓存的工具结果（返回副本，metadata 中标记 cache_hit），未命中时返回 None"""
+    cache = tool_caches.get(tool_name)
+    if cache is None:
+        return None
+    cached = cache.get(tool_cache_key(tool_name, parameters))
+    if cached is None:
+        return None
+    result = copy.deepcopy(cached)
+    result.setdefault("metadata", {})["cache_hit"] = True
+    return result
+
+def store_result(tool_name: str, parameters: Dict[str, Any], result: Dict[str, Any]) -> None:
+    """写入工具结果（只缓存成功的真实数据，Mock 数据不缓存，配置 API Key 后立即生效）"""
+    cache = tool_caches.get(tool_name)
+    if cache is None or not result.get("success"):
+        return
+    if (result.get("metadata") or {}).get("is_mock"):
+        return
+    cache.set(tool_cache_key(tool_name, parameters), copy.deepcopy(result))
+
+for _tool_name, _cache in tool_caches.items():
+    metrics.register_gauge(f"cache.{_cache.name}", _cache.stats)
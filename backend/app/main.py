@@ -1,14 +1,29 @@
 """
 FastAPI 应用入口
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router
+from app.core.llm_pool import close_pools
+from app.core.precompute import precompute_scheduler
+from app.core.jobs import job_queue
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动任务队列和定时预计算；关闭时停止它们并释放大模型端点的长连接"""
+    job_queue.start()
+    precompute_scheduler.start()
+    yield
+    await precompute_scheduler.stop()
+    await job_queue.stop()
+    await close_pools()
 
 app = FastAPI(
     title="语联灵犀 API",
     description="基于大模型 Agent 与工具链框架的异构工具联动系统",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 配置 CORS（跨域）
@@ -3,12 +3,12 @@
 
 所有工具必须在此注册，才能被调度层调用。
 """
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from .weather import get_weather
 from .news import search_news
 from .stock import get_stock_data
 from .data import calculate
-from .document import generate_document
+from .document import generate_document_async, generate_document_stream
 
 # 工具注册表
 TOOLS_REGISTRY: Dict[str, Dict[str, Any]] = {
@@ -16,31 +16,84 @@ TOOLS_REGISTRY: Dict[str, Dict[str, Any]] = {
         "function": get_weather,
         "description": "天气查询工具，支持7天预报",
         "required_params": ["location"],
-        "optional_params": ["days"]
+        "optional_params": ["days"],
+        "parameters": {
+            "location": {"type": "string", "description": "城市名称，如：北京"},
+            "days": {"type": "integer", "description": "查询天数，1-7，默认7；只问今天/现在时为1", "minimum": 1, "maximum": 7}
+        }
     },
     "news": {
         "function": search_news,
         "description": "新闻检索工具",
         "required_params": ["query"],
-        "optional_params": ["limit", "category"]
+        "optional_params": ["limit", "category"],
+        "parameters": {
+            "query": {"type": "string", "description": "搜索关键词，如：AI、科技"},
+            "limit": {"type": "integer", "description": "返回数量，1-50，默认10", "minimum": 1, "maximum": 50},
+            "category": {"type": "string", "description": "新闻分类"}
+        }
     },
     "stock": {
         "function": get_stock_data,
         "description": "股票数据查询工具",
         "required_params": ["symbol"],
-        "optional_params": ["days"]
+        "optional_params": ["days"],
+        "parameters": {
+            "symbol": {"type": "string", "description": "股票代码或名称，如：600519、贵州茅台"},
+            "days": {"type": "integer", "description": "查询天数，1-30，默认5", "minimum": 1, "maximum": 30}
+        }
     },
     "calculate": {
         "function": calculate,
         "description": "数值计算工具",
         "required_params": ["expression"],
-        "optional_params": ["variables"]
+        "optional_params": ["variables"],
+        "parameters": {
+            "expression": {"type": "string", "description": "计算表达式，如：(1+2)*3"},
+            "variables": {"type": "object", "description": "变量字典，如：{\"x\": 2}"}
+        }
     },
     "document": {
-        "function": generate_document,
-        "description": "文档生成工具",
+        "function": generate_document_async,
+        "stream_function": generate_document_stream,
+        "description": "文档生成工具，生成报告、邮件、总结等文档；需要数据时放在取数工具之后调用",
         "required_params": ["template", "content"],
-        "optional_params": ["data", "format"]
+        "optional_params": ["data", "format"],
+        # data 由 Agent 用前面工具的结果填充，不暴露给大模型
+        "parameters": {
+            "template": {"type": "string", "description": "模板类型", "enum": ["report", "email", "summary"]},
+            "content": {"type": "string", "description": "内容提示"},
+            "format": {"type": "string", "description": "输出格式，默认markdown", "enum": ["markdown", "docx", "html"]}
+        }
     }
 }
 
+
+def get_tool_schemas(tool_names: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    根据注册表生成函数调用（function calling）的工具定义
+
+    Args:
+        tool_names: 只生成指定工具的定义，为空时生成全部
+
+    Returns:
+        OpenAI 兼容的 tools 列表：[{"type": "function", "function": {"name", "description", "parameters"}}]
+    """
+    schemas = []
+    for name, info in TOOLS_REGISTRY.items():
+        if tool_names is not None and name not in tool_names:
+            continue
+        properties = info.get("parameters", {})
+        schemas.append({
+            "type": "function",
+            "function": {
+                "name": name,
+                "description": info["description"],
+                "parameters": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": [param for param in info["required_params"] if param in properties]
+                }
+            }
+        })
+    return schemas
@@ -5,14 +5,37 @@
 如果没有配置大模型，则使用 Mock 数据
 参考 docs/TOOL_GUIDE.md 中的规范
 """
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, AsyncIterator
 import time
 import asyncio
 import json
 from app.core.llm_service import LLMService
+from app.core.compactor import compact_context, split_context, estimate_tokens, detect_schema
+from app.core.cache import ResultCache, fingerprint
+from app.core.artifacts import artifact_store
+from app.core.metrics import metrics
 from app.config import settings
 
-def _build_document_prompt(template: str, content: str, data: Dict[str, Any] = None) -> str:
+# 文档结果缓存：相同的模板、内容提示和上下文数据直接返回已生成的 Markdown
+document_cache = ResultCache(
+    "document",
+    max_entries=settings.DOC_CACHE_MAX_ENTRIES,
+    ttl=settings.DOC_CACHE_TTL,
+    cache_dir=settings.DOC_CACHE_DIR,
+    max_disk_entries=settings.DOC_CACHE_DISK_MAX_ENTRIES
+)
+metrics.register_gauge("cache.document", document_cache.stats)
+
+def document_fingerprint(template: str, content: str, data: Dict[str, Any] = None) -> str:
+    """计算文档输入的指纹（上下文数据变化时指纹随之变化）"""
+    return fingerprint("document", template.lower(), content, data or {})
+
+def _build_document_prompt(
+    template: str,
+    content: str,
+    data: Dict[str, Any] = None,
+    summaries: List[str] = None
+) -> str:
     """
     构建文档生成提示词
     
@@ -20,6 +43,7 @@ def _build_document_prompt(template: str, content: str, data: Dict[str, Any] = N
         template: 模板类型（report、email、summary）
         content: 内容提示
         data: 上下文数据（可选）
+        summaries: 上下文数据的分片摘要（可选，map-reduce 模式下代替 data）
         
     Returns:
         提示词字符串
@@ -38,15 +62,19 @@ def _build_document_prompt(template: str, content: str, data: Dict[str, Any] = N
     prompt += f"主题/内容：{content}\n\n"
     
     # 如果有上下文数据，添加到提示词中
-    if data:
-        prompt += "上下文数据：\n"
-        if isinstance(data, dict):
-            for key, value in data.items():
-                if isinstance(value, (dict, list)):
-                    prompt += f"- {key}: {json.dumps(value, ensure_ascii=False, indent=2)}\n"
-                else:
-                    prompt += f"- {key}: {value}\n"
+    if summaries:
+        prompt += "上下文数据（已分片摘要）：\n"
+        for i, summary in enumerate(summaries, 1):
+            prompt += f"### 片段 {i}\n{summary.strip()}\n"
         prompt += "\n"
+    elif data:
+        prompt += "上下文数据：\n"
+        prompt += compact_context(
+            data,
+            token_budget=settings.DOC_CONTEXT_TOKEN_BUDGET,
+            max_rows=settings.DOC_CONTEXT_MAX_ROWS
+        )
+        prompt += "\n\n"
     
     # 根据模板类型添加特定要求
     if template.lower() == "report":
@@ -77,6 +105,27 @@ def _build_document_prompt(template: str, content: str, data: Dict[str, Any] = N
     
     return prompt
 
+def _build_document_messages(
+    template: str,
+    content: str,
+    data: Dict[str, Any] = None,
+    summaries: List[str] = None
+) -> list:
+    """构建文档生成的消息列表"""
+    # 构建提示词
+    prompt = _build_document_prompt(template, content, data, summaries)
+    
+    return [
+        {
+            "role": "system",
+            "content": "你是一个专业的文档生成助手，擅长生成各种类型的文档。请根据用户要求生成高质量的文档内容，使用 Markdown 格式。"
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
 async def _generate_with_llm(template: str, content: str, data: Dict[str, Any] = None) -> str:
     """
     使用大模型生成文档内容（异步函数）
@@ -89,117 +138,94 @@ async def _generate_with_llm(template: str, content: str, data: Dict[str, Any] =
     Returns:
         生成的文档内容
     """
-    llm_service = LLMService()
-    
-    # 构建提示词
-    prompt = _build_document_prompt(template, content, data)
-    
-    # 构建消息
-    messages = [
-        {
-            "role": "system",
-            "content": "你是一个专业的文档生成助手，擅长生成各种类型的文档。请根据用户要求生成高质量的文档内容，使用 Markdown 格式。"
-        },
-        {
-            "role": "user",
-            "content": prompt
-        }
-    ]
+    llm_service = LLMService(stage="document")
+    messages = _build_document_messages(template, content, data)
     
     # 调用大模型（使用较高的 temperature 以获得更自然的文本）
     response = await llm_service.chat(messages, temperature=0.8, user_input=content)
     
     return response
 
-def generate_document(params: Dict[str, Any]) -> Dict[str, Any]:
+def _should_map_reduce(data: Dict[str, Any]) -> bool:
+    """上下文数据是否大到需要 map-reduce 摘要"""
+    if not settings.DOC_MAP_REDUCE_ENABLED or not data:
+        return False
+    raw_text = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+    return estimate_tokens(raw_text) > settings.DOC_MAP_REDUCE_THRESHOLD
+
+async def _summarize_chunks(content: str, data: Dict[str, Any]) -> Optional[List[str]]:
     """
-    文档生成工具
+    map 阶段：将上下文数据分片，并发调用大模型提炼每个分片的要点
+    
+    并发数受 DOC_MAP_REDUCE_CONCURRENCY 限制，总耗时约为 分片数 / 并发数 次模型调用
     
-    Args:
-        params: 参数字典
-            - template: 文档模板类型（必填，report/email/summary）
-            - content: 内容提示（必填）
-            - data: 上下文数据（可选）
-            - format: 输出格式（可选，默认 "markdown"）
-        
     Returns:
-        工具执行结果
+        按分片顺序排列的摘要列表；任一分片的调用使用了降级方案时返回 None
+        （降级输出的是规则识别结果而不是摘要，不能汇总到文档中）
     """
-    start_time = time.time()
+    chunks = split_context(data, settings.DOC_MAP_REDUCE_CHUNK_TOKENS)
+    semaphore = asyncio.Semaphore(max(settings.DOC_MAP_REDUCE_CONCURRENCY, 1))
+    llm_service = LLMService(stage="document")
+    print(f"[DEBUG] 文档 map-reduce - 分片数: {len(chunks)}, 并发数: {settings.DOC_MAP_REDUCE_CONCURRENCY}")
     
-    # 参数校验
-    template = params.get("template")
-    content = params.get("content")
-    if not template or not content:
-        return {
-            "success": False,
-            "data": None,
-            "error": "参数错误：template 和 content 不能为空",
-            "metadata": {
-                "tool_name": "document",
-                "duration": f"{(time.time() - start_time) * 1000:.0f}ms",
-                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-            }
-        }
+    async def summarize(index: int, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        tool_name = detect_schema(chunk) or "上下文"
+        # 分片已按 token 上限切分，保留分片内的全部行
+        row_counts = [len(value) for value in chunk.values() if isinstance(value, list)] if isinstance(chunk, dict) else []
+        row_count = max(row_counts or [1])
+        chunk_text = compact_context(chunk, token_budget=settings.DOC_MAP_REDUCE_CHUNK_TOKENS, max_rows=row_count)
+        prompt = (
+            f"以下是{tool_name}数据的第 {index + 1}/{len(chunks)} 个片段。"
+            f"请围绕主题“{content}”提炼其中的关键事实和数字，使用简洁的要点列出，不超过200字，不要编造数据。\n\n"
+            f"{chunk_text}"
+        )
+        messages = [
+            {"role": "system", "content": "你是一个数据摘要助手，只输出要点，不输出其他内容。"},
+            {"role": "user", "content": prompt}
+        ]
+        async with semaphore:
+            return await llm_service.chat_result(messages, temperature=0.3, user_input=content)
     
-    data = params.get("data", {})
-    format_type = params.get("format", "markdown")
+    results = await asyncio.gather(*(summarize(i, chunk) for i, chunk in enumerate(chunks)))
+    if any(result["fallback"] for result in results):
+        print("[WARNING] 文档 map-reduce - 分片摘要使用了降级方案，放弃汇总")
+        return None
+    return [result["content"] for result in results]
+
+async def _stream_with_llm(
+    template: str,
+    content: str,
+    data: Dict[str, Any] = None,
+    status: Dict[str, Any] = None
+) -> AsyncIterator[str]:
+    """
+    使用大模型流式生成文档内容
     
-    # 尝试使用大模型生成文档
-    if settings.LLM_API_KEY:
-        try:
-            print(f"[DEBUG] 使用大模型生成文档 - 模板: {template}, 内容提示: {content[:50]}...")
-            
-            # 调用异步函数生成文档
-            # 由于 generate_document 是在 asyncio.to_thread 中运行的同步函数，
-            # 它不在异步上下文中，可以直接使用 asyncio.run()
-            # 如果 asyncio.run() 失败（已有事件循环），则创建新的事件循环
-            try:
-                document_content = asyncio.run(_generate_with_llm(template, content, data))
-            except RuntimeError:
-                # 如果已经有事件循环在运行，创建新的事件循环
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    document_content = loop.run_until_complete(_generate_with_llm(template, content, data))
-                finally:
-                    loop.close()
-            
-            # 计算字数
-            word_count = len(document_content)
-            
-            print(f"[DEBUG] 文档生成成功 - 字数: {word_count}")
-            
-            return {
-                "success": True,
-                "data": {
-                    "content": document_content,
-                    "format": format_type,
-                    "word_count": word_count,
-                    "template": template
-                },
-                "error": None,
-                "metadata": {
-                    "tool_name": "document",
-                    "duration": f"{(time.time() - start_time) * 1000:.0f}ms",
-                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "is_mock": False,
-                    "api_provider": "llm"
-                }
-            }
-        except asyncio.TimeoutError:
-            print(f"[ERROR] 文档生成超时（超过30秒）")
-            print("[INFO] 降级到 Mock 数据")
-        except Exception as e:
-            import traceback
-            print(f"[ERROR] 文档生成失败：{e}")
-            print(f"[ERROR] 错误详情：{traceback.format_exc()}")
-            print("[INFO] 降级到 Mock 数据")
+    上下文数据过大时先执行 map 阶段得到分片摘要，再将摘要汇总（reduce）到最终模板中
+    
+    Args:
+        status: 调用状态（可选），写入 "fallback": 大模型服务是否使用了降级方案（此时输出的不是文档，
+            map 阶段的分片摘要降级时不再调用大模型，直接标记降级）
+    
+    Yields:
+        生成文档的增量文本
+    """
+    llm_service = LLMService(stage="document")
+    if _should_map_reduce(data):
+        summaries = await _summarize_chunks(content, data)
+        if summaries is None:
+            if status is not None:
+                status["fallback"] = True
+            return
+        messages = _build_document_messages(template, content, summaries=summaries)
     else:
-        print(f"[DEBUG] 大模型未配置，使用 Mock 数据")
+        messages = _build_document_messages(template, content, data)
     
-    # 降级到 Mock 数据（当没有大模型或生成失败时）
-    # 生成简单的 Mock 文档
+    async for delta in llm_service.chat_stream(messages, temperature=0.8, user_input=content, status=status):
+        yield delta
+
+def _build_mock_content(template: str, content: str) -> str:
+    """生成 Mock 文档（当没有大模型或生成失败时）"""
     template_names = {
         "report": "报告",
         "email": "邮件",
@@ -207,7 +233,7 @@ def generate_document(params: Dict[str, Any]) -> Dict[str, Any]:
     }
     template_name = template_names.get(template.lower(), "文档")
     
-    mock_content = f"""# {template_name}
+    return f"""# {template_name}
 
 ## 主题
 {content}
@@ -229,24 +255,208 @@ def generate_document(params: Dict[str, Any]) -> Dict[str, Any]:
 ---
 *注：这是 Mock 数据，实际功能需要配置大模型 API Key*
 """
+
+def _build_result(
+    start_time: float,
+    template: str,
+    format_type: str,
+    document_content: str,
+    **metadata: Any
+) -> Dict[str, Any]:
+    """
+    构建统一格式的工具执行结果
     
-    word_count = len(mock_content)
+    format 为 docx/html 时提交后台导出任务，结果中只附带产物 ID 和下载地址，
+    文件内容不会序列化到工作流的 JSON 结果中
+    """
+    result_data = {
+        "content": document_content,
+        "format": format_type,
+        "word_count": len(document_content),
+        "template": template
+    }
+    if format_type and format_type.lower() not in ("markdown", "md"):
+        template_names = {"report": "报告", "email": "邮件", "summary": "总结"}
+        title = template_names.get(template.lower(), "文档")
+        result_data["artifact"] = artifact_store.submit(document_content, format_type, title)
     
     return {
         "success": True,
-        "data": {
-            "content": mock_content,
-            "format": format_type,
-            "word_count": word_count,
-            "template": template
-        },
+        "data": result_data,
         "error": None,
         "metadata": {
             "tool_name": "document",
             "duration": f"{(time.time() - start_time) * 1000:.0f}ms",
             "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "is_mock": True
+            **metadata
+        }
+    }
+
+async def generate_document_stream(params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    文档生成工具（流式版本）
+    
+    Args:
+        params: 参数字典，与 generate_document 相同
+        
+    Yields:
+        事件字典：
+        - {"type": "delta", "content": "..."}：增量文本
+        - {"type": "result", "result": {...}}：最终的工具执行结果（最后一个事件）
+    """
+    start_time = time.time()
+    
+    # 参数校验
+    template = params.get("template")
+    content = params.get("content")
+    if not template or not content:
+        yield {
+            "type": "result",
+            "result": {
+                "success": False,
+                "data": None,
+                "error": "参数错误：template 和 content 不能为空",
+                "metadata": {
+                    "tool_name": "document",
+                    "duration": f"{(time.time() - start_time) * 1000:.0f}ms",
+                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+                }
+            }
         }
+        return
+    
+    data = params.get("data", {})
+    format_type = params.get("format", "markdown")
+    
+    # 尝试使用大模型生成文档（文档阶段的配置：LLM_DOCUMENT_*、LLM_ENDPOINTS 端点池或全局配置）
+    if LLMService(stage="document").available:
+        cache_key = document_fingerprint(template, content, data)
+        if settings.DOC_CACHE_ENABLED:
+            cached_content = document_cache.get(cache_key)
+            if cached_content is not None:
+                print(f"[DEBUG] 文档缓存命中 - 模板: {template}, 指纹: {cache_key[:12]}")
+                yield {"type": "delta", "content": cached_content}
+                yield {
+                    "type": "result",
+                    "result": _build_result(
+                        start_time, template, format_type, cached_content,
+                        is_mock=False, api_provider="llm", cache_hit=True
+                    )
+                }
+                return
+        
+        try:
+            print(f"[DEBUG] 使用大模型生成文档 - 模板: {template}, 内容提示: {content[:50]}...")
+            
+            chunks = []
+            status: Dict[str, Any] = {}
+            async for delta in _stream_with_llm(template, content, data, status):
+                if status.get("fallback"):
+                    # 大模型调用失败或被准入控制拒绝，降级输出的是规则识别结果而不是文档：不输出、不缓存
+                    continue
+                chunks.append(delta)
+                yield {"type": "delta", "content": delta}
+            
+            if status.get("fallback"):
+                print("[WARNING] 大模型服务使用了降级方案，文档降级到 Mock 数据")
+            elif status.get("incomplete"):
+                # 输出中途中断：已输出的内容不完整，不缓存、不导出，结果标记为失败
+                document_content = "".join(chunks)
+                print(f"[ERROR] 文档生成中断 - 已输出字数: {len(document_content)}")
+                yield {
+                    "type": "result",
+                    "result": {
+                        "success": False,
+                        "data": {
+                            "content": document_content,
+                            "format": "markdown",
+                            "word_count": len(document_content),
+                            "template": template
+                        },
+                        "error": "文档生成中断，内容不完整",
+                        "metadata": {
+                            "tool_name": "document",
+                            "duration": f"{(time.time() - start_time) * 1000:.0f}ms",
+                            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                            "is_mock": False,
+                            "api_provider": "llm",
+                            "incomplete": True
+                        }
+                    }
+                }
+                return
+            else:
+                document_content = "".join(chunks)
+                
+                print(f"[DEBUG] 文档生成成功 - 字数: {len(document_content)}")
+                
+                if settings.DOC_CACHE_ENABLED and document_content:
+                    document_cache.set(cache_key, document_content)
+                
+                yield {
+                    "type": "result",
+                    "result": _build_result(
+                        start_time, template, format_type, document_content,
+                        is_mock=False, api_provider="llm", cache_hit=False
+                    )
+                }
+                return
+        except asyncio.TimeoutError:
+            print(f"[ERROR] 文档生成超时（超过30秒）")
+            print("[INFO] 降级到 Mock 数据")
+        except Exception as e:
+            import traceback
+            print(f"[ERROR] 文档生成失败：{e}")
+            print(f"[ERROR] 错误详情：{traceback.format_exc()}")
+            print("[INFO] 降级到 Mock 数据")
+    else:
+        print(f"[DEBUG] 大模型未配置，使用 Mock 数据")
+    
+    # 降级到 Mock 数据（当没有大模型或生成失败时）
+    mock_content = _build_mock_content(template, content)
+    yield {"type": "delta", "content": mock_content}
+    yield {
+        "type": "result",
+        "result": _build_result(start_time, template, format_type, mock_content, is_mock=True)
     }
 
+async def generate_document_async(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    文档生成工具（异步版本，在事件循环中直接运行）
+    
+    Args:
+        params: 参数字典，与 generate_document 相同
+        
+    Returns:
+        工具执行结果
+    """
+    result = None
+    async for event in generate_document_stream(params):
+        if event["type"] == "result":
+            result = event["result"]
+    return result
 
+def generate_document(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    文档生成工具
+    
+    Args:
+        params: 参数字典
+            - template: 文档模板类型（必填，report/email/summary）
+            - content: 内容提示（必填）
+            - data: 上下文数据（可选）
+            - format: 输出格式（可选，默认 "markdown"；docx/html 会在后台导出为文件）
+        
+    Returns:
+        工具执行结果
+    """
+    # 同步调用入口：在没有运行中事件循环的线程里直接使用 asyncio.run()
+    # 如果 asyncio.run() 失败（已有事件循环），则创建新的事件循环
+    try:
+        return asyncio.run(generate_document_async(params))
+    except RuntimeError:
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(generate_document_async(params))
+        finally:
+            loop.close()
@@ -9,6 +9,7 @@ from typing import Dict, Any
 import time
 import requests
 from app.config import settings
+from app.core.cancellation import check_cancelled
 
 def search_news(params: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -71,6 +72,7 @@ def search_news(params: Dict[str, Any]) -> Dict[str, Any]:
             
             print(f"[DEBUG] NewsAPI 请求参数: q={query}, language={news_params.get('language')}, pageSize={limit}")
             
+            check_cancelled("news")
             response = requests.get(news_url, params=news_params, timeout=10)
             
             # 检查 HTTP 状态码
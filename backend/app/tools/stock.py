@@ -9,6 +9,38 @@ from typing import Dict, Any
 import time
 import requests
 from app.config import settings
+from app.core.cancellation import check_cancelled
+
+# 股票名称到代码的映射（用于将股票名称转换为代码）
+STOCK_NAME_TO_CODE = {
+    "贵州茅台": "600519",
+    "茅台": "600519",
+    "平安银行": "000001",
+    "平安": "000001",
+    "腾讯控股": "00700",
+    "腾讯": "00700",
+    "阿里巴巴": "09988",
+    "阿里": "09988",
+    "万科A": "000002",
+    "万科": "000002",
+    "招商银行": "600036",
+    "五粮液": "000858",
+}
+
+# 股票代码到名称的映射（用于显示）
+STOCK_CODE_TO_NAME = {
+    "600519": "贵州茅台",
+    "000001": "平安银行",
+    "00700": "腾讯控股",
+    "09988": "阿里巴巴",
+    "000002": "万科A",
+    "600036": "招商银行",
+    "000858": "五粮液"
+}
+
+def supports_live_quotes(symbol: str) -> bool:
+    """Alpha Vantage 只支持美股字母代码（如 AAPL），其他代码总是返回 Mock 数据"""
+    return symbol.isalpha() and 1 <= len(symbol) <= 5
 
 def get_stock_data(params: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -41,39 +73,13 @@ def get_stock_data(params: Dict[str, Any]) -> Dict[str, Any]:
     days = params.get("days", 5)
     days = min(max(days, 1), 30)  # 限制在1-30天
     
-    # 股票名称到代码的映射（用于将股票名称转换为代码）
-    stock_name_to_code = {
-        "贵州茅台": "600519",
-        "茅台": "600519",
-        "平安银行": "000001",
-        "平安": "000001",
-        "腾讯控股": "00700",
-        "腾讯": "00700",
-        "阿里巴巴": "09988",
-        "阿里": "09988",
-        "万科A": "000002",
-        "万科": "000002",
-        "招商银行": "600036",
-        "五粮液": "000858",
-    }
-    
     # 如果 symbol 是股票名称，转换为代码
     original_symbol = symbol
-    if symbol in stock_name_to_code:
-        symbol = stock_name_to_code[symbol]
+    if symbol in STOCK_NAME_TO_CODE:
+        symbol = STOCK_NAME_TO_CODE[symbol]
         print(f"[DEBUG] 股票名称转换: {original_symbol} -> {symbol}")
     
-    # 股票代码到名称的映射（用于显示）
-    stock_names = {
-        "600519": "贵州茅台",
-        "000001": "平安银行",
-        "00700": "腾讯控股",
-        "09988": "阿里巴巴",
-        "000002": "万科A",
-        "600036": "招商银行",
-        "000858": "五粮液"
-    }
-    stock_name = stock_names.get(symbol, f"股票{symbol}")
+    stock_name = STOCK_CODE_TO_NAME.get(symbol, f"股票{symbol}")
     
     # 尝试使用真实 API
     api_key = settings.STOCK_API_KEY
@@ -87,7 +93,7 @@ def get_stock_data(params: Dict[str, Any]) -> Dict[str, Any]:
             # Alpha Vantage 主要支持美国股票（字母代码，如 AAPL, MSFT）
             # 中国股票代码（数字）可能无法直接使用，会降级到 Mock 数据
             # 判断是美股（字母）还是中国股票（数字）
-            if symbol.isalpha() and 1 <= len(symbol) <= 5:
+            if supports_live_quotes(symbol):
                 # 美国股票代码（字母，如 AAPL, MSFT, TSLA）
                 stock_url = "https://www.alphavantage.co/query"
                 stock_params = {
@@ -98,6 +104,7 @@ def get_stock_data(params: Dict[str, Any]) -> Dict[str, Any]:
                 }
                 
                 print(f"[DEBUG] 使用 Alpha Vantage API - 美股代码: {symbol.upper()}")
+                check_cancelled("stock")
                 response = requests.get(stock_url, params=stock_params, timeout=10)
                 response.raise_for_status()
                 data = response.json()
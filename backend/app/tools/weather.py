@@ -13,6 +13,16 @@ import hashlib
 import base64
 import urllib.parse
 from app.config import settings
+from app.core.cancellation import check_cancelled
+
+# 支持的城市及其基础温度（用于 Mock 数据，冬季温度参考（1月份））
+CITY_BASE_TEMP = {
+    "北京": 2, "上海": 8, "广州": 18, "深圳": 19, "杭州": 6,
+    "南京": 4, "成都": 7, "武汉": 5, "西安": 2, "天津": 1,
+    "重庆": 9, "苏州": 6, "长沙": 7, "郑州": 3, "青岛": 2, "大连": -1,
+    "济南": 2, "福州": 13, "厦门": 15, "合肥": 4, "石家庄": 1,
+    "哈尔滨": -18, "长春": -15, "沈阳": -10
+}
 
 def generate_seniverse_signature(uid: str, secret: str, ttl: int = 300) -> tuple:
     """
@@ -110,6 +120,7 @@ def get_weather(params: Dict[str, Any]) -> Dict[str, Any]:
             }
             
             print(f"[DEBUG] 心知天气 API 调用 - 使用私钥方式")
+            check_cancelled("weather")
             response = requests.get(api_url, params=api_params, timeout=10)
             response.raise_for_status()
             data = response.json()
@@ -225,6 +236,7 @@ def get_weather(params: Dict[str, Any]) -> Dict[str, Any]:
                     "X-QW-Api-Key": api_key
                 }
                 
+                check_cancelled("weather")
                 city_response = requests.get(
                     city_search_url, 
                     params=city_params, 
@@ -239,6 +251,7 @@ def get_weather(params: Dict[str, Any]) -> Dict[str, Any]:
                         "location": location,
                         "key": api_key
                     }
+                    check_cancelled("weather")
                     city_response = requests.get(
                         city_search_url,
                         params=city_params_with_key,
@@ -271,6 +284,7 @@ def get_weather(params: Dict[str, Any]) -> Dict[str, Any]:
                 "X-QW-Api-Key": api_key
             }
             
+            check_cancelled("weather")
             forecast_response = requests.get(
                 forecast_url, 
                 params=forecast_params, 
@@ -285,6 +299,7 @@ def get_weather(params: Dict[str, Any]) -> Dict[str, Any]:
                     "location": location_param,
                     "key": api_key
                 }
+                check_cancelled("weather")
                 forecast_response = requests.get(
                     forecast_url,
                     params=forecast_params_with_key,
@@ -389,15 +404,7 @@ def get_weather(params: Dict[str, Any]) -> Dict[str, Any]:
     import hashlib
     
     # 根据城市生成不同的基础温度（模拟不同城市的气候，更符合实际）
-    # 冬季温度参考（1月份）
-    city_base_temp = {
-        "北京": 2, "上海": 8, "广州": 18, "深圳": 19, "杭州": 6,
-        "南京": 4, "成都": 7, "武汉": 5, "西安": 2, "天津": 1,
-        "重庆": 9, "苏州": 6, "长沙": 7, "郑州": 3, "青岛": 2, "大连": -1,
-        "济南": 2, "福州": 13, "厦门": 15, "合肥": 4, "石家庄": 1,
-        "哈尔滨": -18, "长春": -15, "沈阳": -10
-    }
-    base_temp = city_base_temp.get(location, 5)
+    base_temp = CITY_BASE_TEMP.get(location, 5)
     
     # 使用确定性算法生成数据（基于城市和日期，确保相同输入返回相同结果）
     forecast = []
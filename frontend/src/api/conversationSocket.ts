@@ -0,0 +1,139 @@
+/**
+ * 对话 WebSocket 客户端
+ * 一个对话保持一条连接：后端复用同一个 Agent 和会话，执行过程中推送步骤/日志/结果的增量状态
+ */
+import type { MockWorkflowState } from './types';
+
+const WS_PATH = '/api/ws/conversations';  // 通过 Vite 代理转发到 ws://localhost:8000/api/ws/conversations
+
+interface ServerMessage {
+  type: 'update' | 'result' | 'cancelled' | 'error';
+  taskId?: string;
+  data?: Partial<MockWorkflowState>;
+  message?: string;
+}
+
+interface PendingTask {
+  onUpdate?: (state: Partial<MockWorkflowState>) => void;
+  resolve: (state: MockWorkflowState) => void;
+  reject: (error: Error) => void;
+}
+
+/**
+ * 生成对话 ID
+ * crypto.randomUUID 只在安全上下文（HTTPS / localhost）中可用，局域网 HTTP 访问时回退到随机数
+ */
+export function createConversationId(): string {
+  if (typeof crypto !== 'undefined' && typeof crypto.randomUUID === 'function') {
+    return crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}${Math.random().toString(36).slice(2, 10)}`;
+}
+
+export class WorkflowCancelledError extends Error {
+  constructor() {
+    super('任务已取消');
+    this.name = 'WorkflowCancelledError';
+  }
+}
+
+export class ConversationSocket {
+  private socket: WebSocket | null = null;
+  private connecting: Promise<WebSocket> | null = null;
+  private pending: PendingTask | null = null;
+
+  constructor(private readonly conversationId: string) {}
+
+  /**
+   * 建立连接（已连接时直接返回）
+   */
+  private connect(): Promise<WebSocket> {
+    if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+      return Promise.resolve(this.socket);
+    }
+    if (this.connecting) {
+      return this.connecting;
+    }
+
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const url = `${protocol}//${window.location.host}${WS_PATH}/${encodeURIComponent(this.conversationId)}`;
+
+    this.connecting = new Promise((resolve, reject) => {
+      const socket = new WebSocket(url);
+      socket.onopen = () => {
+        this.socket = socket;
+        this.connecting = null;
+        resolve(socket);
+      };
+      socket.onerror = () => {
+        this.connecting = null;
+        reject(new Error('WebSocket 连接失败'));
+      };
+      socket.onclose = () => {
+        this.socket = null;
+        this.connecting = null;
+        this.finish((task) => task.reject(new Error('WebSocket 连接已断开')));
+      };
+      socket.onmessage = (event) => this.handleMessage(JSON.parse(event.data) as ServerMessage);
+    });
+    return this.connecting;
+  }
+
+  private finish(settle: (task: PendingTask) => void) {
+    const task = this.pending;
+    this.pending = null;
+    if (task) {
+      settle(task);
+    }
+  }
+
+  private handleMessage(message: ServerMessage) {
+    const task = this.pending;
+    if (!task) return;
+
+    if (message.type === 'update') {
+      task.onUpdate?.(message.data ?? {});
+    } else if (message.type === 'result') {
+      task.onUpdate?.(message.data ?? {});
+      this.finish((current) => current.resolve(message.data as MockWorkflowState));
+    } else if (message.type === 'cancelled') {
+      task.onUpdate?.(message.data ?? { status: 'failed' });
+      this.finish((current) => current.reject(new WorkflowCancelledError()));
+    } else if (message.type === 'error') {
+      this.finish((current) => current.reject(new Error(message.message || '工作流执行失败')));
+    }
+  }
+
+  /**
+   * 发送一条消息并等待工作流完成
+   * @param userInput 用户输入的自然语言
+   * @param onUpdate 状态增量回调（MockWorkflowState 的部分字段）
+   */
+  async send(
+    userInput: string,
+    onUpdate?: (state: Partial<MockWorkflowState>) => void
+  ): Promise<MockWorkflowState> {
+    if (this.pending) {
+      throw new Error('上一条消息仍在执行');
+    }
+    const socket = await this.connect();
+    return new Promise((resolve, reject) => {
+      this.pending = { onUpdate, resolve, reject };
+      socket.send(JSON.stringify({ type: 'message', userInput }));
+    });
+  }
+
+  /**
+   * 取消正在执行的工作流（后端同时取消在途的大模型请求和工具调用）
+   */
+  cancel() {
+    if (this.pending && this.socket && this.socket.readyState === WebSocket.OPEN) {
+      this.socket.send(JSON.stringify({ type: 'cancel' }));
+    }
+  }
+
+  close() {
+    this.socket?.close();
+    this.socket = null;
+  }
+}
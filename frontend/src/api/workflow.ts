@@ -88,6 +88,96 @@ export class WorkflowService {
     }
   }
 
+  /**
+   * 流式执行工作流（NDJSON）
+   * 文档生成的增量文本会实时写入 result.summary，最终结果到达后替换为完整状态
+   * @param userInput 用户输入的自然语言
+   * @param conversationId 对话 ID（可选）
+   * @param onUpdate 状态更新回调
+   */
+  static async executeWorkflowStream(
+    userInput: string,
+    conversationId?: string | null,
+    onUpdate?: (state: Partial<MockWorkflowState>) => void
+  ): Promise<MockWorkflowState> {
+    try {
+      if (onUpdate) {
+        onUpdate({
+          status: 'running',
+          steps: [],
+          logs: [],
+          result: null
+        });
+      }
+
+      const response = await fetch(`${API_BASE_URL}/workflow/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          userInput,
+          conversationId: conversationId || null,
+        }),
+      });
+
+      if (!response.ok || !response.body) {
+        const errorText = await response.text();
+        throw new Error(`API 请求失败: ${response.status} ${errorText}`);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let streamedText = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const lines = buffer.split('\n');
+        buffer = lines.pop() ?? '';
+
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const event = JSON.parse(line);
+
+          if (event.type === 'delta') {
+            streamedText += event.content;
+            if (onUpdate) {
+              onUpdate({
+                result: { summary: streamedText, chartType: 'none', chartData: [], rawData: [] }
+              });
+            }
+          } else if (event.type === 'result') {
+            if (event.code !== 200) {
+              throw new Error(event.message || '工作流执行失败');
+            }
+            if (onUpdate) {
+              onUpdate(event.data);
+            }
+            return event.data as MockWorkflowState;
+          } else if (event.type === 'error') {
+            throw new Error(event.message || '工作流执行失败');
+          }
+        }
+      }
+
+      throw new Error('工作流响应流意外结束');
+    } catch (error) {
+      console.error('工作流执行错误:', error);
+
+      if (onUpdate) {
+        onUpdate({
+          status: 'failed',
+        });
+      }
+
+      throw error;
+    }
+  }
+
   /**
    * 查询工具状态
    */
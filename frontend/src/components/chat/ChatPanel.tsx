@@ -1,5 +1,5 @@
 import React, { useState, useRef, useEffect } from 'react';
-import { Bot, Loader2, Zap, Send } from 'lucide-react';
+import { Bot, Loader2, Zap, Send, Square } from 'lucide-react';
 import type { Message } from '../../api/types';
 import MessageBubble from './MessageBubble';
 
@@ -7,9 +7,10 @@ interface ChatPanelProps {
   messages: Message[];
   isLoading: boolean;
   onSendMessage: (text: string) => void;
+  onCancel?: () => void;  // 取消正在执行的任务（未提供时不显示停止按钮）
 }
 
-const ChatPanel: React.FC<ChatPanelProps> = ({ messages, isLoading, onSendMessage }) => {
+const ChatPanel: React.FC<ChatPanelProps> = ({ messages, isLoading, onSendMessage, onCancel }) => {
   const [input, setInput] = useState('');
   const scrollRef = useRef<HTMLDivElement>(null);
 
@@ -53,6 +54,15 @@ const ChatPanel: React.FC<ChatPanelProps> = ({ messages, isLoading, onSendMessag
           <div className="flex items-center gap-2 text-gray-400 text-sm ml-12 mb-4 animate-pulse">
             <Loader2 size={14} className="animate-spin" />
             <span>Agent 正在思考并调度工具...</span>
+            {onCancel && (
+              <button
+                onClick={onCancel}
+                className="ml-2 flex items-center gap-1 px-2 py-0.5 rounded-full border border-gray-200 text-xs text-gray-500 hover:text-red-600 hover:border-red-200 transition-colors"
+              >
+                <Square size={10} />
+                停止
+              </button>
+            )}
           </div>
         )}
       </div>
@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { Layout, Terminal, FileText, Zap, PlayCircle } from 'lucide-react';
 import PageHeader from '../components/common/PageHeader';
 import ChatPanel from '../components/chat/ChatPanel';
@@ -8,6 +8,7 @@ import ResultPanel from '../components/workflow/ResultPanel';
 import ToolStatusPanel from '../components/workflow/ToolStatusPanel';
 import type { Message, MockWorkflowState } from '../api/types';
 import { WorkflowService } from '../api/workflow';
+import { ConversationSocket, WorkflowCancelledError, createConversationId } from '../api/conversationSocket';
 
 const MainLayout: React.FC = () => {
   const [activeTab, setActiveTab] = useState('overview');
@@ -24,6 +25,18 @@ const MainLayout: React.FC = () => {
     result: null
   });
 
+  // 对话 WebSocket：同一对话复用一条连接，后端保留会话上下文，追问可复用上一轮的工具结果
+  const socketRef = useRef<ConversationSocket | null>(null);
+  if (socketRef.current === null) {
+    socketRef.current = new ConversationSocket(createConversationId());
+  }
+
+  useEffect(() => () => socketRef.current?.close(), []);
+
+  const handleCancel = () => {
+    socketRef.current?.cancel();
+  };
+
   const handleSendMessage = async (text: string) => {
     const userMsg: Message = {
       id: Date.now().toString(),
@@ -38,14 +51,19 @@ const MainLayout: React.FC = () => {
     setWorkflowState(prev => ({ ...prev, status: 'running', steps: [], logs: [], result: null }));
 
     try {
-      // 调用真实后端 API
-      const result = await WorkflowService.executeWorkflow(
-        text,
-        null,
-        (updatedState) => {
-          setWorkflowState(prev => ({ ...prev, ...updatedState }));
+      const onUpdate = (updatedState: Partial<MockWorkflowState>) => {
+        setWorkflowState(prev => ({ ...prev, ...updatedState }));
+      };
+      // 优先通过对话 WebSocket 执行（服务端推送步骤进度，可取消）；连接失败时回退到流式 HTTP 接口
+      let result: MockWorkflowState;
+      try {
+        result = await socketRef.current!.send(text, onUpdate);
+      } catch (error) {
+        if (error instanceof WorkflowCancelledError || !(error instanceof Error) || error.message !== 'WebSocket 连接失败') {
+          throw error;
         }
-      );
+        result = await WorkflowService.executeWorkflowStream(text, null, onUpdate);
+      }
 
       // 更新消息
       const agentMessage = result.status === 'success' 
@@ -65,6 +83,17 @@ const MainLayout: React.FC = () => {
         setActiveTab('result');
       }
     } catch (error) {
+      if (error instanceof WorkflowCancelledError) {
+        setMessages(prev => [...prev, {
+          id: (Date.now() + 1).toString(),
+          role: 'agent',
+          content: '任务已取消。',
+          timestamp: new Date().toLocaleTimeString(),
+          relatedTool: 'Workflow Engine'
+        }]);
+        setWorkflowState(prev => ({ ...prev, status: 'failed' }));
+        return;
+      }
       // 错误处理
       console.error('工作流执行失败:', error);
       setMessages(prev => [...prev, {
@@ -90,6 +119,7 @@ const MainLayout: React.FC = () => {
             messages={messages} 
             isLoading={loading} 
             onSendMessage={handleSendMessage} 
+            onCancel={handleCancel}
           />
         </div>
 
@@ -10,6 +10,7 @@ export default defineConfig({
       '/api': {
         target: 'http://localhost:8000',
         changeOrigin: true,
+        ws: true,  // 同时代理对话 WebSocket（/api/ws/conversations）
         // rewrite: (path) => path.replace(/^\/api/, '')  // 如果后端不需要 /api 前缀，取消注释
       }
     }